@@ -0,0 +1,176 @@
+'''
+Accuracy & speed of the pipeline on synthetic nights with known seeing & drift.
+
+The faster engines (profile models, cosmic-ray rejection, sky subtraction, cross-
+correlation engines) are only worth adopting if they measure the same thing.  run()
+writes a night with fake_night.py -- seeing getting worse, the star drifting along the
+slit, & the slits flexing -- then runs each stage with each variant on it:
+
+    star    fit_all() on both nods, as in get_seeing() & get_star_drift(), giving
+            the seeing (") & the star's offsets (") from the first frame of each nod
+    slit    cross_correlations() against the first frame of each nod, as in
+            get_slit_drift(), giving the slits' shifts (pixels)
+
+and compares them to what was put in, reporting the bias & scatter of the errors and the
+seconds per frame.  A measurement fails if any of them is over its budget (see "budgets").
+'''
+
+from drift import *
+from tracker import pixscale
+import fake_night as fn
+import tempfile
+import time
+
+# Drift() settings for each variant of each stage
+variants = {'star': {'gaussian':{},
+                     'moffat':{'profile_model':'moffat'},
+                     'gaussian_halo':{'profile_model':'gaussian_halo'},
+                     'fast':{'profile_model':'fast'},
+                     'stack':{'cosmics':'stack'},
+                     'sky':{'sky_frames':4}},
+            'slit': {'image_registration':{'xcorr':'image_registration'},
+                     'masked':{'xcorr':'masked'},
+                     'strips':{'xcorr':'strips'}}}
+
+# largest |bias|, scatter, & seconds per frame for each measurement (", ", pixels, pixels);
+# (measurement, variant) keys override the measurement's budget for one variant.
+# The x shifts come mostly from the skylines, whose peaks are clipped before the
+# cross-correlation (see Drift.cross_correlations()), so they're looser than the y shifts.
+# The times are a few times what each variant takes on the default night (star: ~0.006
+# s/frame, ~0.012 with the sky; slit: ~0.85 image_registration, ~1.4 masked, ~0.16 strips)
+budgets = {'seeing':(0.03,0.02,0.03), 'star_offset':(0.01,0.01,0.03),
+           'slit_xshift':(0.1,0.1,3.), 'slit_yshift':(0.1,0.05,3.),
+           ('seeing','sky'):(0.03,0.02,0.06), ('star_offset','sky'):(0.01,0.01,0.06),
+           ('slit_xshift','masked'):(0.1,0.1,4.), ('slit_yshift','masked'):(0.1,0.05,4.),
+           ('slit_xshift','strips'):(0.1,0.1,0.5), ('slit_yshift','strips'):(0.1,0.05,0.5)}
+
+report_columns = ['stage','variant','measurement','frames','bias','scatter',\
+                  'sec_per_frame','passed']
+
+
+def default_night(nframes=12):
+    '''
+    The night the harness runs on (can be changed before calling run()).
+    '''
+    night = fn.FakeNight()
+    night.nframes = nframes
+    night.seeing = (0.5,0.9)                        # "
+    night.star_drift = lambda t: 0.8*np.sin(t)      # pixels
+    night.slit_xshift = (0.,-0.6)                   # pixels
+    night.slit_yshift = (0.,0.4)
+    return night
+
+
+def drift_variant(night,home,settings):
+    drift_obj = night.drift_object(home)
+    for key,value in settings.items(): setattr(drift_obj,key,value)
+    return drift_obj
+
+
+def star_stage(drift_obj,truth):
+    '''
+    Errors in the seeing & the star's offsets for every frame (the offsets leave out
+    the first frame of each nod, which is zero by definition).
+    '''
+    truth = truth.set_index('frame')
+    errors = {'seeing':[], 'star_offset':[]}
+    for nod in drift_obj.split_dither():
+        cen, A, sig, num = drift_obj.fit_all(nod)
+        cen, sig, num = np.asarray(cen), np.asarray(sig), np.asarray(num)
+        errors['seeing'].extend(sig * 2.35 * pixscale - truth.loc[num,'seeing'].values)
+        offset = (cen[0] - cen) * pixscale # same as get_star_drift()
+        errors['star_offset'].extend((offset - truth.loc[num,'star_offset'].values)[1:])
+    return errors
+
+
+def slit_stage(drift_obj,truth):
+    '''
+    Errors in the slits' shifts relative to the first frame of each nod (which is
+    left out).
+    '''
+    truth = truth.set_index('frame')
+    errors = {'slit_xshift':[], 'slit_yshift':[]}
+    for nod in drift_obj.split_dither():
+        ref, num0 = nod[0], rf.frame_number(nod[0])
+        for filename,data in drift_obj.prefetch(nod[1:],reference=ref):
+            x,y = drift_obj.cross_correlations(ref,filename,data=data)
+            num = rf.frame_number(filename)
+            for key,shift in zip(['slit_xshift','slit_yshift'],[x,y]):
+                errors[key].append(shift - (truth.loc[num,key] - truth.loc[num0,key]))
+    return errors
+
+
+stage_functions = {'star':star_stage, 'slit':slit_stage}
+
+
+def budget(measurement,variant,budgets=budgets):
+    return budgets.get((measurement,variant),budgets[measurement])
+
+
+def run(home=None,night=None,stages=('star','slit'),variants=variants,budgets=budgets,write=True):
+    '''
+    Runs each stage & variant on a synthetic night & compares to the truth.
+
+    INPUTS ---- home:       str, where the night is written (default: a temporary directory)
+                night:      a fake_night.FakeNight() (default: default_night())
+                stages:     list, stages to run ("star", "slit")
+                variants:   dict, Drift() settings of each variant, by stage
+                budgets:    dict, see "budgets"
+                write:      bool, write the night (False if it's already in "home")
+
+    RETURNS --- report:     pandas DataFrame with "report_columns"
+    '''
+    if night is None: night = default_night()
+    scratch = None
+    if home is None: home = scratch = tempfile.mkdtemp(prefix='kvs-accuracy-') + '/'
+    try:
+        truth = night.write(home) if write == True else fn.read_truth(home,night.date,night.mask)
+        rows = []
+        for stage in stages:
+            for variant,settings in variants[stage].items():
+                drift_obj = drift_variant(night,home,settings)
+                start = time.time()
+                errors = stage_functions[stage](drift_obj,truth)
+                per_frame = (time.time() - start) / night.nframes
+                for measurement,err in errors.items():
+                    err = np.asarray(err,dtype=float)
+                    bias, scatter = np.nanmean(err), np.nanstd(err)
+                    max_bias, max_scatter, max_time = budget(measurement,variant,budgets)
+                    passed = bool(np.all(np.isfinite(err)) and abs(bias) <= max_bias and \
+                                  scatter <= max_scatter and per_frame <= max_time)
+                    rows.append([stage,variant,measurement,len(err),bias,scatter,per_frame,passed])
+    finally:
+        if scratch is not None: shutil.rmtree(scratch,ignore_errors=True)
+    return pd.DataFrame(rows,columns=report_columns)
+
+
+def print_report(report):
+    print('%6s %20s %12s %7s %9s %9s %9s %7s'%('stage','variant','measurement','frames',
+          'bias','scatter','s/frame','passed'))
+    for row in report.itertuples():
+        print('%6s %20s %12s %7i %+9.4f %9.4f %9.3f %7s'%(row.stage,row.variant,row.measurement,
+              row.frames,row.bias,row.scatter,row.sec_per_frame,row.passed))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Checking the accuracy & speed of the pipeline on a synthetic night.",
+                usage='accuracy.py [-o HOME] [-n NFRAMES] [-s STAGES] [-v VARIANTS] [-w]')
+    parser.add_argument('-o','--home',help='Where the night is written. (default: a temporary directory)',default=None)
+    parser.add_argument('-n','--nframes',help='Number of frames in the night. (default: 12)',type=int,default=12)
+    parser.add_argument('-s','--stages',help='Stages to run, ex. star,slit',default='star,slit')
+    parser.add_argument('-v','--variants',help='Only these variants, ex. gaussian,fast,masked (default: all)',default=None)
+    parser.add_argument('-w','--save',help='Save the report to plots-data/accuracy/.',action='store_true')
+    args = parser.parse_args()
+
+    chosen = variants
+    if args.variants is not None:
+        names = args.variants.split(',')
+        chosen = {stage:{v:s for v,s in options.items() if v in names} for stage,options in variants.items()}
+    report = run(home=args.home,night=default_night(args.nframes),stages=args.stages.split(','),variants=chosen)
+    print()
+    print_report(report)
+    if args.save == True:
+        os.makedirs('plots-data/accuracy',exist_ok=True)
+        report.to_csv('plots-data/accuracy/accuracy_report.txt',sep='\t',index=False)
+    if not report.passed.all(): sys.exit(1) # for schedulers & CI
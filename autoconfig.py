@@ -0,0 +1,193 @@
+'''
+Automatic configuration of the star's slit for a new mask.
+
+Drift() needs row_start, row_end, col_start, & col_end, which so far have been looked up
+by hand & typed into keck_masks.dat.  configure() finds them from the frames themselves:
+
+    1.  the first frame of each nod is read & differenced (A - B), so the sky cancels and
+        a star is a positive peak with a negative peak 2*dither/0.18" rows away (see
+        collapse_profile.star_pairs())
+    2.  the rows are the slit holding the star in both nods, found from the bars between
+        the slits in the sky profile (see collapse_profile.slit_bounds()), trimmed by a
+        couple of rows at the edges
+    3.  the columns are the range that gives the summed profile of the star the highest
+        S/N, which keeps the bright skylines & the ends of the spectrum out
+    4.  the settings are checked by fitting the star in the first few frames of each nod
+        (the fits have to converge, stay inside the cut-out, agree from frame to frame,
+        and be the dither apart between the nods)
+
+If the brightest star fails the checks, the next brightest is tried.  configure_stars()
+does the same for every star bright enough to track, for multistar.py.
+'''
+
+import numpy as np
+import collapse_profile as coll
+from scipy.ndimage import median_filter
+from tracker import pixscale
+
+star_keys = ['row_start','row_end','col_start','col_end']
+
+
+def nod_frames(drift_obj,nod_A,nod_B):
+    '''
+    Reads the first frame of each nod & returns the spatial profiles of their difference
+    (A - B) and of the sky ((A + B) / 2), along with the difference itself.
+    '''
+    A = np.array(drift_obj.read_frame(nod_A[0]),dtype=float)
+    diff = A - np.array(drift_obj.read_frame(nod_B[0]),dtype=float)
+    sky = A - diff/2 # (A + B) / 2, without another full frame
+    del A
+    # medians over the columns, so cosmic rays & skylines don't matter
+    return diff, np.nanmedian(diff,axis=1), np.nanmedian(sky,axis=1)
+
+
+def star_columns(diff,row_A,row_B,start,end,half=3,widths=(100,200,300,500,750,1000)):
+    '''
+    Picks the range of columns that gives the star's summed profile the highest S/N.
+
+    INPUTS ---- diff:       NxN array, difference of the two nods (A - B)
+                row_A:      int, row of the star in nod A
+                row_B:      int, row of the star in nod B
+                start,end:  int, rows of the star's slit
+                half:       int, rows on either side of the star counted as signal
+                widths:     list, number of columns tried
+
+    RETURNS --- col_start,col_end:  (int,int)
+    '''
+    star = np.zeros(diff.shape[0],dtype=bool)
+    star[row_A-half:row_A+half+1] = star[row_B-half:row_B+half+1] = True
+    signal = np.nansum(diff[row_A-half:row_A+half+1],axis=0) - np.nansum(diff[row_B-half:row_B+half+1],axis=0)
+
+    # noise of each column from the rest of the slit (the sky & skylines)
+    sky_rows = np.arange(start,end)[~star[start:end]]
+    resid = diff[sky_rows] - np.nanmedian(diff[sky_rows],axis=0)
+    noise = 1.4826 * np.nanmedian(np.abs(resid),axis=0) * np.sqrt(2*(2*half+1))
+    # cosmic rays & hot pixels only hit single columns
+    signal, noise = median_filter(np.nan_to_num(signal),5), median_filter(np.nan_to_num(noise),5)
+    noise[noise <= 0] = np.inf
+
+    csum_s = np.concatenate(([0],np.cumsum(signal)))
+    csum_n = np.concatenate(([0],np.cumsum(noise**2)))
+    best, cols = -np.inf, (0,diff.shape[1])
+    for width in widths:
+        if width > len(signal): continue
+        snr = (csum_s[width:]-csum_s[:-width]) / np.sqrt(csum_n[width:]-csum_n[:-width])
+        i = int(np.nanargmax(snr))
+        if snr[i] > best: best, cols = snr[i], (i,i+width)
+    return cols
+
+
+def validate(drift_obj,nod_A,nod_B,sep,nframes=3,max_spread=3.,tol=3.):
+    '''
+    Fits the star in the first few frames of each nod with the current settings.
+
+    RETURNS --- ok:         bool, whether the settings work
+                centers:    list, median centre of the star (rows in the cut-out) for
+                            each nod, or the reason the settings didn't work
+    '''
+    height = drift_obj.row_end - drift_obj.row_start
+    centers = []
+    for nod,frames in zip(['A','B'],[nod_A[:nframes],nod_B[:nframes]]):
+        fits = []
+        for filename in frames:
+            try: mean, A, sig = drift_obj.fit_model(filename)
+            except (RuntimeError,ValueError): return False, f'fit failed for {filename}'
+            if not (1 < mean < height-1 and 0.5 < sig < height/4 and A > 0):
+                return False, f'bad fit for {filename} (centre {mean:.1f}, sigma {sig:.1f})'
+            fits.append(mean)
+        if np.ptp(fits) > max_spread: return False, f'star moves {np.ptp(fits):.1f} rows in nod {nod}'
+        centers.append(float(np.median(fits)))
+    if sep > 0 and abs(abs(centers[0]-centers[1]) - sep) > tol:
+        return False, f'nods are {abs(centers[0]-centers[1]):.1f} rows apart instead of {sep:.1f}'
+    return True, centers
+
+
+def star_settings(diff,sky_profile,row_A,row_B,trim=2,half=27):
+    '''
+    Rows & columns for the star at rows row_A (nod A) & row_B (nod B).
+
+    RETURNS --- row_start,row_end,col_start,col_end:    (int,int,int,int)
+    '''
+    start, end = coll.slit_bounds(sky_profile,min(row_A,row_B),max(row_A,row_B))
+    if start is None: start, end = (row_A+row_B)//2 - half, (row_A+row_B)//2 + half
+    else: start, end = start+trim, end-trim
+    col_start, col_end = star_columns(diff,row_A,row_B,start,end)
+    return int(start), int(end), int(col_start), int(col_end)
+
+
+def configure(drift_obj,nframes=3,candidates=5,trim=2,half=27):
+    '''
+    Finds the star's slit & columns and fills them in on the Drift() object.
+
+    INPUTS ---- drift_obj:  a Drift() object with date, mask, dither, & home defined
+                nframes:    int, frames of each nod used to check the settings
+                candidates: int, most stars tried
+                trim:       int, rows trimmed off the edges of the slit
+                half:       int, half the rows used if the slit's edges can't be
+                            found (same window as collapse_profile.return_star())
+
+    RETURNS --- info:       dict, the settings, rows of the star in each nod, S/N,
+                            & fitted centres
+    '''
+    nod_A, nod_B = drift_obj.split_dither()
+    if len(nod_A) == 0 or len(nod_B) == 0:
+        raise Exception('Need frames in both nods to find the star.')
+    sep = 2*drift_obj.dither/pixscale # rows between the nods
+
+    diff, diff_profile, sky_profile = nod_frames(drift_obj,nod_A,nod_B)
+    before = {key:getattr(drift_obj,key) for key in star_keys}
+    failed = []
+    for row_A,row_B,snr in coll.star_pairs(diff_profile,sep,nmax=candidates):
+        start, end, col_start, col_end = star_settings(diff,sky_profile,row_A,row_B,trim,half)
+        for key,value in zip(star_keys,[start,end,col_start,col_end]): setattr(drift_obj,key,value)
+        ok, centers = validate(drift_obj,nod_A,nod_B,sep,nframes)
+        if ok == True:
+            print('Star found: star_slit %s,%s | star_cols %s,%s'%(start,end,col_start,col_end),end='\n\n')
+            return {'row_start':start, 'row_end':end, 'col_start':col_start, 'col_end':col_end,
+                    'row_A':row_A, 'row_B':row_B, 'snr':snr, 'centers':centers}
+        failed.append(f'rows {row_A}/{row_B}: {centers}')
+
+    for key,value in before.items(): setattr(drift_obj,key,value) # leaves it as it was
+    raise Exception(f'No star found for {drift_obj.mask} on {drift_obj.date}. ' + '; '.join(failed))
+
+
+def configure_stars(drift_obj,nframes=3,candidates=10,nsigma=30,trim=2,half=27):
+    '''
+    Finds every star bright enough to track in the mask (see multistar.py) and fills
+    in drift_obj.stars.  Each star is checked the same way as in configure(); the
+    single-star settings (row_start, etc.) are left as they were.
+
+    INPUTS ---- drift_obj:  a Drift() object with date, mask, dither, & home defined
+                nframes:    int, frames of each nod used to check each star
+                candidates: int, most stars tried
+                nsigma:     float, how far above the noise a star's peaks need to be
+
+    RETURNS --- info:       list of dicts, one per star (see configure()), brightest first
+    '''
+    nod_A, nod_B = drift_obj.split_dither()
+    if len(nod_A) == 0 or len(nod_B) == 0:
+        raise Exception('Need frames in both nods to find the stars.')
+    sep = 2*drift_obj.dither/pixscale
+
+    diff, diff_profile, sky_profile = nod_frames(drift_obj,nod_A,nod_B)
+    before = {key:getattr(drift_obj,key) for key in star_keys}
+    found = []
+    for row_A,row_B,snr in coll.star_pairs(diff_profile,sep,nsigma=nsigma,nmax=candidates):
+        settings = star_settings(diff,sky_profile,row_A,row_B,trim,half)
+        if any(s[0] < settings[1] and settings[0] < s[1] for s in star_boxes(found)):
+            continue # same slit as a star already found
+        for key,value in zip(star_keys,settings): setattr(drift_obj,key,value)
+        ok, centers = validate(drift_obj,nod_A,nod_B,sep,nframes)
+        if ok == True:
+            found.append(dict(zip(star_keys,settings),row_A=row_A,row_B=row_B,snr=snr,centers=centers))
+    for key,value in before.items(): setattr(drift_obj,key,value)
+
+    if len(found) == 0: raise Exception(f'No stars found for {drift_obj.mask} on {drift_obj.date}.')
+    drift_obj.stars = star_boxes(found)
+    print('Stars found: '+', '.join('star_slit %s,%s'%(s[0],s[1]) for s in drift_obj.stars),end='\n\n')
+    return found
+
+
+def star_boxes(info):
+    # (row_start, row_end, col_start, col_end) of each star
+    return [tuple(star[key] for key in star_keys) for star in info]
@@ -0,0 +1,174 @@
+'''
+Archive-wide catalogue of raw MOSFIRE frames.
+
+Drift.mask_frames() only looks in one home/date/ directory (and opens every header in it
+each time), and KVS-data/engineering_fcs_info.dat was put together by hand.  This module
+scans a whole archive tree (one directory per night, ex. archive/2021apr23/) across a
+process pool & keeps one row per frame in a SQLite database:
+
+    night, file, object, gratmode, yoffset, band, utc, airmass, rotpposn (PA), el, az,
+    parang, size (bytes), mtime
+
+The columns are indexed, so queries like
+
+    >>> query("object = 'Flexure Test FCS Off' and band = 'J' and el = 45")
+    >>> mask_nights('UDS_MOSFIRE_J')
+
+come back in milliseconds as pandas DataFrames (same column names as the .dat tables,
+so they drop into the engineering_time/ scripts).  Rescanning only opens the frames that
+are new or changed since the last scan.  With Drift.catalogue set to the database,
+mask_frames() & split_dither() use it instead of reading the headers (only the frames
+written since the last scan are opened, see Drift.catalogue_frames()).
+'''
+
+import numpy as np
+import pandas as pd
+import rawfits as rf
+from multiprocessing import Pool
+import sqlite3
+import re
+import os
+
+default_db = 'KVS-data/catalogue.db'
+
+# column --> (header keyword, SQL type)
+header_columns = {'object':('OBJECT','TEXT'), 'gratmode':('GRATMODE','TEXT'),
+                  'yoffset':('YOFFSET','REAL'), 'band':('FILTER','TEXT'),
+                  'utc':('UTC','TEXT'), 'airmass':('AIRMASS','REAL'),
+                  'rotpposn':('ROTPPOSN','REAL'), 'el':('EL','REAL'),
+                  'az':('AZ','REAL'), 'parang':('PARANG','REAL')}
+columns = ['night','file'] + list(header_columns) + ['size','mtime']
+indices = [('object',),('night',),('band','el'),('gratmode',),('object','night')]
+
+night_pattern = re.compile(r'^\d{4}[a-z]{3}\d{2}$') # ex. 2021apr23
+
+
+def connect(dbfile=default_db):
+    '''
+    Opens the catalogue (making the table & indices if they aren't there yet).
+    '''
+    if os.path.dirname(dbfile) != '': os.makedirs(os.path.dirname(dbfile),exist_ok=True)
+    db = sqlite3.connect(dbfile)
+    types = ', '.join(f'{col} {sql}' for col,(key,sql) in header_columns.items())
+    db.execute(f'CREATE TABLE IF NOT EXISTS frames (night TEXT, file TEXT, {types}, '
+               'size INTEGER, mtime REAL, PRIMARY KEY (night,file))')
+    for cols in indices:
+        db.execute(f'CREATE INDEX IF NOT EXISTS idx_{"_".join(cols)} ON frames ({",".join(cols)})')
+    return db
+
+
+def archive_frames(archive):
+    '''
+    Lists (night, file, size, mtime) for every raw frame in an archive tree.
+    '''
+    found = []
+    for night in sorted(os.listdir(archive)):
+        path = os.path.join(archive,night)
+        if night_pattern.match(night) is None or not os.path.isdir(path): continue
+        for entry in os.scandir(path):
+            if entry.name.startswith('m') and rf.extension(entry.name) is not None:
+                stat = entry.stat()
+                found.append((night,entry.name,stat.st_size,stat.st_mtime))
+    return found
+
+
+def frame_row(args):
+    '''
+    Reads one frame's header & returns its row (header values are None if missing).
+    '''
+    archive, night, filename, size, mtime = args
+    try: head = rf.getheader(os.path.join(archive,night,filename))
+    except (OSError,ValueError): head = {} # unreadable/truncated file, still catalogued
+    row = [night,filename]
+    for col,(key,sql) in header_columns.items():
+        value = head.get(key,None)
+        if sql == 'REAL' and value is not None:
+            try: value = float(value)
+            except ValueError: value = None
+        row.append(value)
+    return row + [size,mtime]
+
+
+def build_catalogue(archive,dbfile=default_db,workers=4,rescan=False,chunksize=16):
+    '''
+    Scans an archive tree & adds its frames to the catalogue.
+
+    INPUTS ---- archive:    str, directory holding one directory per night
+                dbfile:     str, the SQLite database
+                workers:    int, number of processes reading headers
+                rescan:     bool, reread every header (default: only new or
+                            changed frames are read)
+
+    RETURNS --- added:      int, number of frames (re)catalogued
+    '''
+    db = connect(dbfile)
+    found = archive_frames(archive)
+    if rescan == False:
+        known = {(n,f):(s,m) for n,f,s,m in db.execute('SELECT night,file,size,mtime FROM frames')}
+        found = [frame for frame in found if known.get(frame[:2]) != frame[2:]]
+
+    jobs = [(archive,)+frame for frame in found]
+    if workers > 1 and len(jobs) > chunksize:
+        with Pool(workers) as pool: rows = pool.map(frame_row,jobs,chunksize=chunksize)
+    else: rows = [frame_row(job) for job in jobs]
+
+    with db: # one transaction
+        db.executemany(f'INSERT OR REPLACE INTO frames ({",".join(columns)}) '
+                       f'VALUES ({",".join("?"*len(columns))})',rows)
+    db.close()
+    return len(rows)
+
+
+def query(where='1',params=(),dbfile=default_db,**filters):
+    '''
+    Frames matching an SQL condition, ex. "object = 'Flexure Test FCS On' and band = 'H'",
+    and/or column = value filters, ex. query(object='Flexure Test FCS On',band='H').
+
+    NOTE: "where" is pasted into the SQL as it is, so it's for trusted input only (ex.
+    the scripts here).  Values coming from elsewhere go in the filters, or in "params"
+    with a "?" for each in "where".
+
+    RETURNS --- df:     pandas DataFrame, one row per frame (ordered by night & file)
+    '''
+    for col in filters:
+        if col not in columns: raise KeyError(f'No column "{col}" in the catalogue.')
+    where = ' and '.join([f'({where})'] + [f'{col} = ?' for col in filters])
+    params = tuple(params) + tuple(filters.values())
+    db = connect(dbfile)
+    df = pd.read_sql_query(f'SELECT * FROM frames WHERE {where} ORDER BY night, file',db,params=params)
+    db.close()
+    return df
+
+
+def mask_nights(mask,dbfile=default_db):
+    '''
+    Nights a mask was observed on, with the number of frames each night.
+    '''
+    db = connect(dbfile)
+    df = pd.read_sql_query('SELECT night, COUNT(*) AS frames FROM frames WHERE object = ? '
+                           'GROUP BY night ORDER BY night',db,params=(mask,))
+    db.close()
+    return df
+
+
+def night_frames(night,mask,dbfile=default_db):
+    '''
+    Names of the frames of a mask on a night (as catalogued, see Drift.catalogue_frames()
+    for the frames written since the last scan too).
+    '''
+    return list(query(night=night,object=mask,dbfile=dbfile).file)
+
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Cataloguing the raw frames of a MOSFIRE archive.",
+                usage='catalogue.py ...')
+    parser.add_argument('-a','--archive',help='Path to the archive (one directory per night).',required=True)
+    parser.add_argument('-d','--database',help=f'SQLite database. (default: {default_db})',default=default_db)
+    parser.add_argument('-w','--workers',help='Number of processes.',type=int,default=4)
+    parser.add_argument('-r','--rescan',help='Reread every header.',action='store_true')
+    args = parser.parse_args()
+
+    added = build_catalogue(args.archive,args.database,workers=args.workers,rescan=args.rescan)
+    print(f'Catalogued {added} frames.')
@@ -16,6 +16,20 @@ This module will be used for both the seeing & drift tracking of the star *as we
     --> Currently have a skyline issue. Need to figure out how to mask out the skylines
         otherwise the collasping won't work.
     
+    WHO OWNS THE ARRAYS:
+    --------------------
+    collapse_2D()       changes "arr" in place (clipped cosmic rays --> NaN)
+    make_blank()        changes "arr" in place through collapse_2D()
+    return_star()       changes "arr" in place through collapse_2D()
+    return_blank2D()    returns a new array, unless inplace=True (then "arr" itself is
+                        blanked & returned, so no full-frame copy is made)
+    blank_rows()        changes "arr" in place through collapse_2D(), returns a row mask
+    weight_rows()       changes "arr" in place (blanked rows & NaNs --> mean of the rest)
+    edge_strips()       only reads the (blanked) spatial profile
+    star_pairs()        only reads the spatial profile (see autoconfig.py)
+    slit_bounds()       only reads the spatial profile (see autoconfig.py)
+    With low_memory=True, the sigma clipping runs over blocks of rows, so only a block's
+    worth of temporary arrays exists at a time instead of several full-frame copies.
 '''
 
 __author__ = 'Taylor Hutchison'
@@ -23,16 +37,20 @@ __email__ = 'aibhleog@tamu.edu'
 __version__ = 'Oct2019'
 
 import pandas as pd
+from scipy.ndimage import binary_dilation
 from drift import *
 
 import warnings
 warnings.filterwarnings("ignore")
 
-def collapse_2D(arr):
+def collapse_2D(arr,low_memory=False,block=128):
     '''
     This function takes a 2D array (assuming raw MOSFIRE image) and collapses it spatially. Can be used later for more complex functions.
+    NOTE: "arr" is changed in place, the clipped pixels are set to NaN.
     
     INPUTS ---- arr:            NxN array, assumed to be raw MOSFIRE FITS
+                low_memory:     bool, clip "block" rows at a time
+                block:          int, number of rows per block
     RETURNS --- nansum(arr):    1XN array, collapsed FITS clipped of cosmics
     '''
     
@@ -40,24 +58,37 @@ def collapse_2D(arr):
     # --> the threshold is sigma=2 because the code runs on the 
     # --> rows of the 2D, where every value should be consistent
     # --> i.e., "spectrally"
-    mask = sigma_clip(arr,sigma=2,axis=1)
-    arr[mask.mask] = np.nan
-    return np.nansum(arr,axis=1)
+    if low_memory == False:
+        mask = sigma_clip(arr,sigma=2,axis=1)
+        arr[mask.mask] = np.nan
+        return np.nansum(arr,axis=1)
+    
+    # same clipping, but the rows are independent so it can run in blocks
+    spatial = np.zeros(len(arr))
+    for i in range(0,len(arr),block):
+        rows = arr[i:i+block] # view, so the NaNs go into "arr"
+        mask = sigma_clip(rows,sigma=2,axis=1)
+        rows[mask.mask] = np.nan
+        spatial[i:i+block] = np.nansum(rows,axis=1,dtype=np.float64)
+    return spatial
 
 
 # NEED TO MASK OUT SKYLINES
-def return_star(arr,sigma=5,see=False):
+def return_star(arr,sigma=5,see=False,spatial=None):
     '''
     This function takes a collapsed raw image (spatially), finds the star, and returns a 2D slice with the star's profile clearly defined. 
     
     INPUTS ---- arr:        NxN array, assumed to be collapsed FITS
                 see:        bool, to see the clipping results
                 sigma:      int, set high so only star is found
+                spatial:    1xN array, precomputed spatial profile (ex. from
+                            a preview, see preview.py); arr isn't used if given
     
     RETURNS --- y1,y2:      (int,int), rows encompassing the star's signal
                             widened to include the other dither
     '''
-    spatial = collapse_2D(arr) # getting spatial profile of mask
+    if spatial is None: spatial = collapse_2D(arr) # getting spatial profile of mask
+    else: spatial = np.array(spatial,dtype=float)
     med,std = np.median(spatial),np.std(spatial)
     mask = spatial < med - std*1.5 # cutting out the spaces
     spatial[mask] = np.nan                                  # between the slits (low values)
@@ -84,8 +115,133 @@ def return_star(arr,sigma=5,see=False):
     return peak-27,peak+27  # the rows encompassing the star's slit
                             # widened to include the other dither
 
+
+def star_pairs(diff,sep,tol=3,nsigma=10,nmax=5):
+    '''
+    Finds stars in the spatial profile of the difference of the two nods (A - B).  The
+    sky cancels out there, and a star shows up as a positive peak (nod A) with a negative
+    peak (nod B) "sep" rows away -- which the slit edges, skylines, & bars between the
+    slits never do.
+
+    INPUTS ---- diff:       1xN array, spatial profile of A - B (ex. median over columns)
+                sep:        float, rows between the nods (2 * dither / pixel scale),
+                            0 if unknown (any negative peak within 50 rows is used)
+                tol:        int, rows the negative peak can be off from "sep"
+                nsigma:     float, how far above the noise both peaks need to be
+                nmax:       int, most stars returned
+
+    RETURNS --- pairs:      list of (row in nod A, row in nod B, S/N), strongest first
+    '''
+    diff = np.nan_to_num(np.asarray(diff,dtype=float))
+    noise = 1.4826 * np.median(np.abs(diff - np.median(diff)))
+    if noise == 0: noise = np.std(diff)
+    rows = np.arange(len(diff))
+
+    # local maxima above the noise
+    peaks = np.flatnonzero((diff[1:-1] >= diff[:-2]) & (diff[1:-1] > diff[2:]) & \
+                           (diff[1:-1] > nsigma*noise)) + 1
+    pairs = []
+    for a in peaks[np.argsort(diff[peaks])[::-1]]: # brightest first
+        if any(abs(a-p[0]) <= 2*tol for p in pairs): continue # same star
+        if sep > 0: near = np.abs(np.abs(rows-a) - sep) <= tol
+        else: near = (np.abs(rows-a) <= 50) & (rows != a)
+        b = rows[near][np.argmin(diff[near])]
+        if diff[b] > -nsigma*noise: continue # no negative counterpart, not a star
+        pairs.append((int(a),int(b),float((diff[a]-diff[b])/(2*noise))))
+        if len(pairs) == nmax: break
+    return sorted(pairs,key=lambda p: p[2],reverse=True)
+
+
+def slit_bounds(spatial,low,high,window=60,max_height=150):
+    '''
+    Finds the edges of the slit holding rows "low" through "high", from the bars
+    between the slits (which get almost no sky, so they're the low rows of the profile).
+
+    INPUTS ---- spatial:    1xN array, spatial profile of the sky (ex. median over columns)
+                low,high:   int, rows known to be inside the slit (ex. the star in both nods)
+                window:     int, rows on either side used to find the level of the bars
+                max_height: int, tallest slit searched
+
+    RETURNS --- start,end:  (int,int), first row of the slit & the row after its last,
+                            or (None,None) if the bars couldn't be found
+    '''
+    spatial = np.asarray(spatial,dtype=float)
+    local = spatial[max(low-window,0):min(high+window+1,len(spatial))]
+    bar, slit = np.nanpercentile(local,[5,50])
+    if not bar < 0.5*slit: return None,None # no bars nearby (ex. a long slit)
+    inside = spatial > (bar+slit)/2
+
+    start, end = low, high+1
+    while start > 0 and inside[start-1]: start -= 1
+    while end < len(spatial) and inside[end]: end += 1
+    if end-start > max_height: return None,None
+    return start, end
+
     
-def make_blank(arr,upper_sigma=3,lower_sigma=5,see=False):
+def signal_rows(spatial,upper_sigma=3,lower_sigma=5,pad=5):
+    '''
+    Flags the rows of a spatial profile that have a discernible signal, then widens
+    every flagged row i to rows i-pad through i+pad-1 to be safe that the full signal
+    profiles are covered (one binary dilation instead of a loop over the rows).
+    Unlike the old loop, flagged rows near the bottom of the frame (i < pad) are
+    widened too; there its slice blank[i-pad:i+pad] started at a negative index
+    and came back empty, so those rows were never blanked.
+    
+    INPUTS ---- spatial:        1xN array, collapsed FITS (see collapse_2D())
+                upper_sigma:    int, upper limit for finding signal
+                lower_sigma:    int, lower limit set large so slit gaps
+                                aren't clipped from the FITS profile
+                pad:            int, rows added on either side of a flagged row
+                                
+    RETURNS --- rows:           1xN bool array, True for rows to blank out
+    '''
+    mask = sigma_clip(spatial,sigma_lower=lower_sigma,sigma_upper=upper_sigma)
+    rows = np.ma.getmaskarray(mask) | np.isnan(spatial)
+    return binary_dilation(rows,structure=np.ones(2*pad,dtype=bool))
+
+
+def row_intervals(rows):
+    '''
+    Compact form of a row mask.
+    
+    INPUTS ---- rows:       1xN bool array, True for blanked rows
+    RETURNS --- intervals:  Mx2 int array, [start,end) of each run of blanked rows
+    '''
+    edges = np.diff(np.concatenate(([0],rows.astype(np.int8),[0])))
+    return np.flatnonzero(edges).reshape(-1,2)
+
+
+def edge_strips(blank,nstrips=8,height=40,gap=20,margin=10):
+    '''
+    Picks the strips of rows around the highest-contrast slit edges, which is where
+    the information for the slit drift sits (the rest of the frame is mostly flat).
+
+    INPUTS ---- blank:      1xN array, spatial profile with the signal blanked out
+                            (i.e., the output of make_blank())
+                nstrips:    int, most strips to return
+                height:     int, rows per strip
+                gap:        int, fewest rows between strips (set >= the largest shift
+                            searched, so rows of different strips are never compared)
+                margin:     int, rows ignored at the bottom & top of the frame
+
+    RETURNS --- starts:     1xM int array, first row of each strip (sorted, M <= nstrips)
+    '''
+    contrast = np.abs(np.gradient(blank))
+    contrast[np.isnan(contrast)] = 0 # edges of the blanked regions aren't slit edges
+    good = np.concatenate(([0],np.cumsum(~np.isnan(blank))))
+
+    starts = []
+    for row in np.argsort(contrast)[::-1]:
+        if len(starts) == nstrips or contrast[row] == 0: break
+        start = row - height//2
+        if start < margin or start+height > len(blank)-margin: continue
+        if good[start+height]-good[start] < height//2: continue # mostly blanked out
+        if any(abs(start-s) < height+gap for s in starts): continue
+        starts.append(start)
+    return np.sort(np.asarray(starts,dtype=int))
+
+
+def make_blank(arr,upper_sigma=3,lower_sigma=5,see=False,spatial=None,low_memory=False):
     '''
     This function takes a collapsed raw image (spatially) and masks out regions that have a discernible signal, so that only the slit gaps, skylines, and noise remain.
     
@@ -94,23 +250,18 @@ def make_blank(arr,upper_sigma=3,lower_sigma=5,see=False):
                 upper_sigma:    int, upper limit for finding signal
                 lower_sigma:    int, lower limit set large so slit gaps
                                 aren't clipped from the FITS profile
+                spatial:        1xN array, precomputed spatial profile (ex. from
+                                a preview, see preview.py); arr isn't used if given
+                low_memory:     bool, see collapse_2D()
                                 
     RETURNS --- blank:          1xN array, index of spatial profile where the
                                 bad rows (i.e., signal) have been set to NaN 
     '''
-    spatial = collapse_2D(arr) # getting spatial profile of mask
+    if spatial is None: spatial = collapse_2D(arr,low_memory=low_memory) # getting spatial profile of mask
     
     # masking out all real signals, but want to keep slit gaps
-    mask = sigma_clip(spatial,sigma_lower=lower_sigma,sigma_upper=upper_sigma)
     blank = spatial.copy()
-    blank[mask.mask] = np.nan # blocks out the big signals
-    
-    # running through index values for those flagged -- setting indx +/- 5 to
-    # NaNs as well to be safe that the full signal profiles are covered
-    indx = np.arange(len(blank))
-    indx = indx[np.isnan(blank)] # returns the index of the NaNs
-    for i in indx:
-        blank[i-5:i+5] = np.nan
+    blank[signal_rows(spatial,upper_sigma,lower_sigma)] = np.nan # blocks out the big signals
     
     if see == True:
         plt.figure(figsize=(11,5))
@@ -125,7 +276,44 @@ def make_blank(arr,upper_sigma=3,lower_sigma=5,see=False):
     return blank
 
 
-def return_blank2D(arr,upper_sigma=2.5,lower_sigma=5,see=False):
+def blank_rows(arr,upper_sigma=2.5,lower_sigma=5,see=False,low_memory=False):
+    '''
+    Same as return_blank2D(), but only returns which rows to blank instead of
+    a NaN-filled copy of the frame.  See row_intervals() for a compact version.
+    
+    RETURNS --- rows:           1xN bool array, True for rows with signal
+    '''
+    spatial = make_blank(arr,upper_sigma=upper_sigma,lower_sigma=lower_sigma,see=see,low_memory=low_memory)
+    return np.isnan(spatial)
+
+
+def weight_rows(arr,rows,block=128):
+    '''
+    Gives the blanked rows (and any NaN pixels) zero weight in a zero-mean
+    cross-correlation, without making a NaN-filled copy: they are set in place to the 
+    mean of the remaining pixels, so they become exactly 0 once the mean is subtracted.
+    This is the same as what image_registration does with NaNs.
+    
+    INPUTS ---- arr:        NxN float array that you own, changed in place
+                rows:       1xN bool array, True for rows to ignore
+                block:      int, rows per block when adding up the good pixels
+    
+    RETURNS --- arr:        same array, for convenience
+    '''
+    total, count = 0., 0
+    for i in range(0,len(arr),block):
+        keep = arr[i:i+block][~rows[i:i+block]]
+        good = ~np.isnan(keep)
+        total += np.sum(keep[good],dtype=np.float64)
+        count += np.count_nonzero(good)
+    fill = total/count if count > 0 else 0.
+    
+    arr[rows] = fill
+    np.nan_to_num(arr,copy=False,nan=fill)
+    return arr
+
+
+def return_blank2D(arr,upper_sigma=2.5,lower_sigma=5,see=False,inplace=False,low_memory=False):
     '''
     This function runs the make_blank() function and applies the output to mask the 2D such that only the slit gaps, skylines, and noise remain.
     
@@ -134,15 +322,17 @@ def return_blank2D(arr,upper_sigma=2.5,lower_sigma=5,see=False):
                 upper_sigma:    int, upper limit for finding signal
                 lower_sigma:    int, lower limit set large so slit gaps
                                 aren't clipped from the FITS profile
+                inplace:        bool, blank "arr" itself instead of a copy
+                                (arr needs to be a float array you own)
+                low_memory:     bool, see collapse_2D()
                                 
     RETURNS --- blank2D:        NxN array, index of spatial profile where the
                                 bad rows (i.e., signal) have been set to NaN 
     '''
-    spatial = make_blank(arr,upper_sigma=upper_sigma,lower_sigma=lower_sigma,see=see)
-    indx = np.arange(len(spatial))
-    mask = indx[np.isnan(spatial)] # points out where NaNs are
+    mask = blank_rows(arr,upper_sigma=upper_sigma,lower_sigma=lower_sigma,see=see,low_memory=low_memory)
     
-    blank2D = arr.copy()
+    if inplace == True: blank2D = arr
+    else: blank2D = arr.copy()
     blank2D[mask] = np.nan
     
     return blank2D # FITS image with those points masked out
\ No newline at end of file
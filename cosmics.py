@@ -0,0 +1,124 @@
+'''
+Cosmic-ray rejection for stacks of cut-outs.
+
+Drift.cut_out() sigma-clips each row of a cut-out on its own & fills the clipped pixels
+with the median of the whole cut-out, which also clips (& flattens) the peak of the star
+in rows where the spectrum is bright.  clean_stack() instead works on all the cut-outs of
+a nod at once (NxRxC, frames x rows x columns):
+
+    1.  the median of the frames is a model of the star & sky without cosmic rays
+        (they never hit the same pixel twice), scaled & offset row by row to match each
+        frame, since the sky & the star's flux change from frame to frame
+    2.  a pixel is a hit if it's well above that model (in units of the noise of its
+        row & column, since the skylines are noisier) AND sharp -- its Laplacian is
+        large -- so the star moving or the seeing changing (which are smooth over a
+        few pixels) aren't mistaken for cosmic rays
+    3.  hits (& their neighbours that are above the model) are replaced by the model,
+        the local estimate for that frame & row
+
+With fewer than "min_frames" frames, the model is a running median along each row.
+'''
+
+import numpy as np
+from scipy.ndimage import median_filter
+
+
+def laplacian(stack):
+    '''
+    Discrete Laplacian of each cut-out (4*pixel - its 4 neighbours), positive for
+    pixels brighter than their surroundings.  Edges are padded by repeating them.
+    '''
+    pad = np.pad(stack,((0,0),(1,1),(1,1)),mode='edge')
+    return 4*pad[:,1:-1,1:-1] - pad[:,:-2,1:-1] - pad[:,2:,1:-1] - pad[:,1:-1,:-2] - pad[:,1:-1,2:]
+
+
+def stack_model(stack,min_frames=3,width=5):
+    '''
+    Cosmic-ray free model of each cut-out: the median of the frames, scaled & offset
+    row by row to fit each frame (least squares along the row).  With fewer than
+    "min_frames" frames, a running median of the "width" columns around each pixel
+    (along its row) instead.
+
+    INPUTS ---- stack:      NxRxC array, cut-outs from the same nod
+                min_frames: int, fewest frames for the median of the frames
+                width:      int, columns in the running median
+
+    RETURNS --- model:      NxRxC array
+    '''
+    if len(stack) < min_frames:
+        # leaving the pixel itself out, so a hit doesn't pull up its own model
+        footprint = np.ones((1,1,width),dtype=bool)
+        footprint[0,0,width//2] = False
+        return median_filter(stack,footprint=footprint,mode='nearest')
+
+    ref = np.median(stack,axis=0)[None]
+    ref_c = ref - ref.mean(axis=2,keepdims=True)
+    var = np.sum(ref_c**2,axis=2,keepdims=True)
+    scale = np.sum((stack - stack.mean(axis=2,keepdims=True))*ref_c,axis=2,keepdims=True)
+    scale = np.where(var > 0,scale/np.where(var > 0,var,1),1)
+    offset = stack.mean(axis=2,keepdims=True) - scale*ref.mean(axis=2,keepdims=True)
+    return scale*ref + offset
+
+
+def find_hits(stack,model,nsigma=5.,sharpness=2.,grow=2.5):
+    '''
+    Flags the cosmic rays in a stack of cut-outs given a model of them.
+
+    INPUTS ---- stack:      NxRxC array, cut-outs from the same nod
+                model:      NxRxC array, from stack_model()
+                nsigma:     float, how far above the model (in noise) a hit has to be
+                sharpness:  float, how much larger (in the same units) its Laplacian
+                            has to be; a single hot pixel has a Laplacian 4x its height,
+                            a smooth bump about a third of it
+                grow:       float, neighbours of hits this far above the model are
+                            flagged too (0 turns it off)
+
+    RETURNS --- hits:       NxRxC bool array
+    '''
+    resid = stack - model
+    # noise of each column relative to the others (higher on the skylines; never lower,
+    # since a quiet column is just the scatter of the estimate), then of each row of each
+    # frame from the spread of the residuals along it -- the 10th to 90th percentiles, as
+    # the residuals from a median of a few frames are too peaked for the quartiles
+    columns = np.median(np.abs(resid).reshape(-1,resid.shape[2]),axis=0)
+    columns = np.maximum(columns/max(np.median(columns),1e-30),1)[None,None]
+    low, high = np.percentile(resid/columns,[10,90],axis=2,keepdims=True)
+    noise = columns * (high - low) / 2.563
+    noise[noise <= 0] = np.inf
+
+    hits = (resid > nsigma*noise) & (laplacian(resid) > sharpness*nsigma*noise)
+    if grow > 0 and hits.any():
+        # the 8 neighbours of each hit (there are few, so no full-size dilation)
+        n, r, c = np.nonzero(hits)
+        near = np.zeros_like(hits)
+        for dr in [-1,0,1]:
+            for dc in [-1,0,1]:
+                near[n,np.clip(r+dr,0,hits.shape[1]-1),np.clip(c+dc,0,hits.shape[2]-1)] = True
+        hits |= near & (resid > grow*noise)
+    return hits
+
+
+def clean_stack(stack,nsigma=5.,sharpness=2.,grow=2.5,min_frames=3,inplace=False):
+    '''
+    Finds the cosmic rays in a stack of cut-outs from the same nod & replaces them
+    with the row-by-row model of each frame (see the top of this module).
+
+    INPUTS ---- stack:      NxRxC array (or list of RxC arrays), cut-outs from the same nod
+                nsigma:     float, see find_hits()
+                sharpness:  float, see find_hits()
+                grow:       float, see find_hits()
+                min_frames: int, see stack_model()
+                inplace:    bool, change "stack" instead of a copy
+
+    RETURNS --- cleaned:    NxRxC array
+                hits:       NxRxC bool array, the pixels replaced
+    '''
+    stack = np.asarray(stack)
+    if not np.issubdtype(stack.dtype,np.floating): stack = stack.astype(float)
+    elif inplace == False: stack = stack.copy()
+    if stack.size == 0: return stack, np.zeros(stack.shape,dtype=bool)
+
+    model = stack_model(stack,min_frames)
+    hits = find_hits(stack,model,nsigma,sharpness,grow)
+    stack[hits] = model[hits]
+    return stack, hits
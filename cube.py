@@ -0,0 +1,174 @@
+'''
+Memory-mapped frame cubes for a whole nod sequence.
+
+Every per-frame routine in Drift() used to read the FITS files on its own.  This module
+converts the raw frames of each nod into one float32 3D array (frames x rows x columns)
+saved as a .npy file on local scratch, with a table of the header information next to it.
+Once a Drift() object has the cubes attached (see attach_cubes()), read_frame() hands back
+read-only views of the cube, so slicing a star cut-out or a set of rows costs no copy,
+and repeated analyses of the same night skip the FITS decoding (and header reads) entirely.
+
+Files on scratch, per nod (<home> is a short hash of the data directory, so that two
+archives with the same night & mask don't share cubes):
+    <home>_<date>_<mask>_nod<A/B>.npy           the cube
+    <home>_<date>_<mask>_nod<A/B>_frames.txt    one row per frame of header information,
+                                                with the file's modification time
+and per night:
+    <home>_<date>_<mask>_listing.txt            every raw file of the night looked at
+
+attach_cubes() checks the cubes against the directory: a frame that changed (or went
+missing) remakes them, & frames added since are read into the end of the cubes.
+'''
+
+import numpy as np
+import pandas as pd
+import astropy.io.fits as fits
+import rawfits as rf
+import hashlib
+import os
+
+# header information kept with each cube
+header_keys = ['OBJECT','GRATMODE','YOFFSET','UTC','AIRMASS','ROTPPOSN','EL','AZ','PARANG']
+
+
+def cube_name(drift_obj,scratch='/tmp/kvs-cubes/'):
+    home = hashlib.md5(os.path.abspath(drift_obj.home).encode()).hexdigest()[:8]
+    return f'{scratch}{home}_{drift_obj.date}_{drift_obj.mask}'.replace(' ','-')
+
+
+def cube_files(drift_obj,nod,scratch='/tmp/kvs-cubes/'):
+    name = cube_name(drift_obj,scratch) + f'_nod{nod}'
+    return name+'.npy', name+'_frames.txt'
+
+
+def listing_file(drift_obj,scratch='/tmp/kvs-cubes/'):
+    return cube_name(drift_obj,scratch) + '_listing.txt'
+
+
+def modified(drift_obj,filename):
+    return os.path.getmtime(drift_obj.home+'%s/'%drift_obj.date+filename)
+
+
+def build_cube(drift_obj,frames,nod,scratch='/tmp/kvs-cubes/',old=None):
+    '''
+    Reads in each raw frame once & writes it into a memory-mapped float32 cube.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                frames:     list, raw frames for one nod (in order)
+                nod:        str, name of the nod, ex. "A"
+                scratch:    str, directory for the cubes (local disk is best)
+                old:        (cube, table) to extend, from load_cube(); its frames are
+                            copied from the old cube & only "frames" are read
+
+    RETURNS --- cube:       (N,ny,nx) read-only memmap
+                table:      pandas DataFrame, header information for each frame
+    '''
+    path = drift_obj.home+'%s/'%drift_obj.date
+    cubefile, tablefile = cube_files(drift_obj,nod,scratch)
+    os.makedirs(scratch,exist_ok=True)
+    old_cube, old_table = old if old is not None else (None,None)
+    n_old = 0 if old_table is None else len(old_table)
+
+    rows, cube = [], None
+    for i,filename in enumerate(frames):
+        data, head = rf.getdata(path+filename,header=True)
+        if cube is None:
+            cube = np.lib.format.open_memmap(cubefile+'.tmp',mode='w+',dtype=np.float32,\
+                                             shape=(n_old+len(frames),)+data.shape)
+            if n_old > 0: cube[:n_old] = old_cube
+        cube[n_old+i] = data
+        rows.append([filename]+[head.get(key) for key in header_keys]+[modified(drift_obj,filename)])
+    if cube is not None:
+        cube.flush()
+        del cube
+        os.replace(cubefile+'.tmp',cubefile) # only complete cubes get the real name
+
+    table = pd.DataFrame(rows,columns=['file']+header_keys+['MTIME'])
+    if n_old > 0: table = pd.concat([old_table,table],ignore_index=True)
+    table.to_csv(tablefile,sep='\t',index=False)
+    return load_cube(drift_obj,nod,scratch)
+
+
+def load_cube(drift_obj,nod,scratch='/tmp/kvs-cubes/'):
+    '''
+    Opens a cube made by build_cube() without reading it into memory.
+
+    RETURNS --- cube:       (N,ny,nx) read-only memmap
+                table:      pandas DataFrame, header information for each frame
+    '''
+    cubefile, tablefile = cube_files(drift_obj,nod,scratch)
+    table = pd.read_csv(tablefile,delimiter='\t',dtype={'UTC':str,'OBJECT':str})
+    if len(table) == 0: return np.zeros((0,0,0),dtype=np.float32), table
+    return np.load(cubefile,mmap_mode='r'), table
+
+
+def is_current(drift_obj,table):
+    '''
+    True if every frame in a cube's table is still there, unchanged since it was read.
+    '''
+    if 'MTIME' not in table: return False # made before the times were kept
+    for filename,mtime in zip(table['file'],table['MTIME']):
+        try:
+            if abs(modified(drift_obj,filename) - mtime) > 1e-3: return False
+        except OSError: return False
+    return True
+
+
+def new_frames(drift_obj,files,listing):
+    '''
+    Sorts the raw files that aren't in "listing" into nods (only their headers are read).
+
+    RETURNS --- frames:     dict, nod --> new frames of the mask, in order
+    '''
+    from tracker import frame_nod
+    frames = {'A':[], 'B':[]}
+    for filename in files:
+        if filename in listing: continue
+        nod = frame_nod(drift_obj,rf.getheader(drift_obj.home+'%s/'%drift_obj.date+filename))
+        if nod is not None: frames[nod].append(filename)
+    return frames
+
+
+def attach_cubes(drift_obj,scratch='/tmp/kvs-cubes/',rebuild=False):
+    '''
+    Builds (or reuses) the cubes for both nods and attaches them to the Drift() object,
+    so that its read_frame() & header() use the cubes from then on.  Cubes made before
+    are remade if one of their frames changed, & extended with the frames added since.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                scratch:    str, directory for the cubes
+                rebuild:    bool, remake the cubes even if they exist
+
+    RETURNS --- cubes:      dict, nod --> (cube, table)
+    '''
+    drift_obj.cube_index = drift_obj.cube_meta = drift_obj.cube_listing = None # reading from the raw frames
+    listing = drift_obj.raw_frames() # before reading any frames, so none are missed
+    cubes = {}
+    files = [f for nod in 'AB' for f in cube_files(drift_obj,nod,scratch)] + [listing_file(drift_obj,scratch)]
+    if all(os.path.exists(f) for f in files) and rebuild == False:
+        for nod in 'AB': cubes[nod] = load_cube(drift_obj,nod,scratch)
+        if not all(is_current(drift_obj,cubes[nod][1]) for nod in 'AB'): cubes = {}
+    if len(cubes) > 0:
+        seen = set(pd.read_csv(listing_file(drift_obj,scratch),delimiter='\t')['file'])
+        seen.update(f for nod in 'AB' for f in cubes[nod][1]['file'])
+        for nod,frames in new_frames(drift_obj,listing,seen).items():
+            if len(frames) > 0: cubes[nod] = build_cube(drift_obj,frames,nod,scratch,old=cubes[nod])
+    else:
+        nod_A, nod_B = drift_obj.split_dither()
+        for nod,frames in zip('AB',[nod_A,nod_B]):
+            cubes[nod] = build_cube(drift_obj,frames,nod,scratch)
+    # the files listed are either in the cubes now or not frames of the mask
+    listing = sorted(set(listing).union(f for nod in 'AB' for f in cubes[nod][1]['file']))
+    pd.DataFrame({'file':listing}).to_csv(listing_file(drift_obj,scratch),sep='\t',index=False)
+
+    index, meta = {}, {}
+    for nod in 'AB':
+        cube, table = cubes[nod]
+        for i,row in enumerate(table.to_dict('records')):
+            filename = row.pop('file')
+            row.pop('MTIME',None)
+            index[filename] = (cube,i)
+            # keywords missing from a frame are left out (FITS headers can't hold NaN)
+            meta[filename] = fits.Header({k:v for k,v in row.items() if not pd.isna(v)})
+    drift_obj.cube_index, drift_obj.cube_meta, drift_obj.cube_listing = index, meta, set(listing)
+    return cubes
@@ -0,0 +1,184 @@
+'''
+Differential atmospheric refraction (DAR) predictor.
+
+The star-only drift (see plots-data/README.md) is partly guider flexure & partly DAR: the
+guider keeps the star fixed at its own (visible) wavelength, while the star's position in
+the near-IR moves as the refraction at the two wavelengths changes over the night.  This
+module predicts that motion projected along the slit, for every frame at once:
+
+    refraction at a wavelength      R = (n-1) tan(z)      (n from Filippenko 1982, PASP 94, 715,
+                                                           at Mauna Kea pressure & temperature)
+    differential refraction         dR = R(band) - R(guider), towards the zenith
+    along the slit                  dR * cos(q - PA), q the parallactic angle & PA the sky
+                                    position angle of the slit
+
+The predictions are in the same sign convention as the star offsets from get_star_drift()
+(first frame of each nod minus each frame), so correct_offsets() is one array operation.
+
+The orientation is set by "rotator_offset" (ROTPPOSN --> sky PA; MOSFIRE's convention is
+PA = ROTPPOSN - 90) & "slit_sign" (which way along the slit the offsets count as positive).
+Either one being off by 180 degrees flips the correction, so that it doubles the DAR trend
+instead of removing it.  fit_slit_sign() measures the sign on nights with a large DAR
+signal (a long night at low elevation), see correct_star_drift(fit_sign=True).
+'''
+
+import numpy as np
+
+# central wavelengths (microns) of the MOSFIRE bands & the guider
+band_wavelength = {'Y':1.048, 'J':1.253, 'H':1.637, 'K':2.162}
+guider_wavelength = 0.70 # visible guider camera
+
+# conditions on Mauna Kea (defaults for the refractive index)
+pressure = 456.     # mmHg (~608 mbar)
+temperature = 0.    # C
+water = 1.          # mmHg, water vapor pressure (tiny in the near-IR anyway)
+latitude = 19.8263  # degrees, Keck
+
+rotator_offset = -90.   # sky PA of the slit = ROTPPOSN + rotator_offset (degrees)
+slit_sign = 1           # +1 if moving towards the slit's PA makes the star offsets positive
+
+
+def refractive_index(wave,P=pressure,T=temperature,f=water):
+    '''
+    (n - 1) of air at a wavelength, from Filippenko (1982).
+
+    INPUTS ---- wave:   float or array, wavelength in microns
+                P:      float, pressure in mmHg
+                T:      float, temperature in C
+                f:      float, water vapor pressure in mmHg
+
+    RETURNS --- n-1:    float or array
+    '''
+    sig2 = 1/np.asarray(wave,dtype=float)**2
+    n_sea = 64.328 + 29498.1/(146-sig2) + 255.4/(41-sig2) # (n-1)*1e6 at 760 mmHg, 15 C
+    n_site = n_sea * P*(1+(1.049-0.0157*T)*1e-6*P) / (720.883*(1+0.003661*T))
+    n_site -= (0.0624-0.000680*sig2)/(1+0.003661*T) * f
+    return n_site * 1e-6
+
+
+def parallactic_angle(az,el,lat=latitude):
+    '''
+    Parallactic angle (degrees, the PA of the direction towards the zenith) from the
+    azimuth (from north through east) & elevation, for when PARANG isn't available.
+    '''
+    az, el, lat = np.radians(az), np.radians(el), np.radians(lat)
+    q = np.arctan2(np.sin(az), np.cos(el)*np.tan(lat) - np.sin(el)*np.cos(az))
+    return np.degrees(q)
+
+
+def dar_shift(el,band,guider=guider_wavelength,P=pressure,T=temperature,f=water):
+    '''
+    Differential refraction (") of a band relative to the guider, towards the zenith.
+    Negative because the near-IR is refracted less than the guider's wavelength.
+
+    INPUTS ---- el:     float or array, elevation in degrees
+                band:   str, MOSFIRE band (Y, J, H, K) or wavelength in microns
+    '''
+    wave = band_wavelength[band] if isinstance(band,str) else band
+    dn = refractive_index(wave,P,T,f) - refractive_index(guider,P,T,f)
+    z = np.radians(90 - np.asarray(el,dtype=float))
+    return 206265 * dn * np.tan(z)
+
+
+def dar_along_slit(el,rotpposn,parang,band,**kwargs):
+    '''
+    DAR projected along the slit (") for each frame, in the sign convention of the
+    star offsets.  Everything is vectorized, so this runs on a whole night at once.
+
+    INPUTS ---- el:         float or array, elevation in degrees
+                rotpposn:   float or array, rotator position (ROTPPOSN) in degrees
+                parang:     float or array, parallactic angle in degrees
+                band:       str, MOSFIRE band (Y, J, H, K)
+                **kwargs:   passed to dar_shift() (ex. P, T, f, guider)
+
+    RETURNS --- dar:        float or array, predicted position along the slit (")
+    '''
+    pa = np.asarray(rotpposn,dtype=float) + rotator_offset
+    angle = np.radians(np.asarray(parang,dtype=float) - pa)
+    return slit_sign * dar_shift(el,band,**kwargs) * np.cos(angle)
+
+
+def header_arrays(drift_obj,frames):
+    '''
+    Pulls what the predictions need from the headers of a list of frames.  PARANG is
+    used when it's there, otherwise the parallactic angle comes from AZ & EL.
+
+    RETURNS --- el, rotpposn, parang:   arrays, one value per frame (degrees)
+    '''
+    el, rot, parang = [],[],[]
+    for filename in frames:
+        head = drift_obj.header(filename)
+        el.append(head['EL'])
+        rot.append(head['ROTPPOSN'])
+        q = head.get('PARANG',None)
+        if q is None: q = parallactic_angle(head['AZ'],head['EL'])
+        parang.append(q)
+    return np.asarray(el,dtype=float), np.asarray(rot,dtype=float), np.asarray(parang,dtype=float)
+
+
+def predict_frames(drift_obj,frames,band=None):
+    '''
+    Predicted DAR along the slit (") for a list of frames, relative to the first frame
+    (the reference frame in get_star_drift()).
+    '''
+    if band is None: band = drift_obj.band
+    dar = dar_along_slit(*header_arrays(drift_obj,frames),band)
+    return dar - dar[0]
+
+
+def correct_offsets(offsets,dar):
+    '''
+    Removes the predicted DAR from measured star offsets, leaving the guider flexure
+    (and anything else).  Works on any shape, ex. the offsets of a whole archive.
+
+    INPUTS ---- offsets:    array, star offsets (") from get_star_drift()
+                dar:        array, predicted DAR along the slit (") for the same frames
+
+    RETURNS --- residual:   array, offsets with the DAR removed (relative to the
+                            first frame, same as the offsets)
+    '''
+    offsets, dar = np.asarray(offsets,dtype=float), np.asarray(dar,dtype=float)
+    return offsets - (dar - dar[...,:1])
+
+
+def fit_slit_sign(offsets,dar):
+    '''
+    Measures which way the DAR runs along the slit, by fitting the star offsets with the
+    predicted DAR (& a constant).  Only meaningful when the DAR changes by more than the
+    guider flexure over the frames, ex. a long night or one that sets to low elevation.
+
+    INPUTS ---- offsets:    array or list of arrays, star offsets (") from get_star_drift()
+                dar:        same shape, predicted DAR along the slit (") for the same frames
+
+    RETURNS --- sign:       int, +1 if the predictions already have the right orientation,
+                            -1 if they're flipped (multiply "slit_sign" by it)
+                scale:      float, fitted scale of the predictions (~1 if the DAR model
+                            accounts for the drift)
+    '''
+    offsets = np.concatenate([np.ravel(o) for o in offsets]) if isinstance(offsets,list) else np.ravel(offsets)
+    dar = np.concatenate([np.ravel(d) for d in dar]) if isinstance(dar,list) else np.ravel(dar)
+    good = np.isfinite(offsets) & np.isfinite(dar)
+    design = np.vstack([dar[good],np.ones(good.sum())]).T
+    scale = np.linalg.lstsq(design,offsets[good],rcond=None)[0][0]
+    return (1 if scale >= 0 else -1), abs(scale)
+
+
+def correct_star_drift(drift_obj,offset,fit_sign=False):
+    '''
+    Corrects the output of get_star_drift() for DAR, for both nods.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                offset:     2xN list, star offsets for each nod (from get_star_drift())
+                fit_sign:   bool, measure the orientation from this night with fit_slit_sign()
+                            instead of trusting "slit_sign" (needs a large DAR signal)
+
+    RETURNS --- residual:   2xN list, star offsets with DAR removed
+                dar:        2xN list, predicted DAR for each nod
+    '''
+    nod_A, nod_B = drift_obj.split_dither()
+    dars = [predict_frames(drift_obj,frames) for frames in [nod_A,nod_B]]
+    if fit_sign == True:
+        sign = fit_slit_sign(list(offset),dars)[0]
+        dars = [sign*dar for dar in dars]
+    residual = [correct_offsets(off,dar) for off,dar in zip(offset,dars)]
+    return residual, dars
@@ -19,6 +19,11 @@ from datetime import datetime as dt
 from astropy.stats import sigma_clip
 import image_registration as ir # github.com/keflavich/image_registration
 import collapse_profile as coll # written by TAH
+import xcorr as xc
+import prefetch as pf
+import rawfits as rf
+import profiles as pr
+import cosmics as cr
 import pandas as pd
 import shutil
 import os
@@ -51,12 +56,172 @@ class Drift:
 	col_start = 0   # the xvalue for the first column (avoid skylines please)
 	col_end = 0     # the xvalue for the last column (avoid skylines please)
 	
+	# keeps frames as float32 & blanks them in place (see collapse_profile.py)
+	low_memory = False
+	
+	# frames cached in memory-mapped cubes (see cube.py & attach_cubes())
+	cube_index = None   # filename --> (cube, index of frame in cube)
+	cube_meta = None    # filename --> header information stored with the cube
+	cube_listing = None # raw files of the night already looked at when the cubes were made
+	
+	# cross-correlation used by cross_correlations(), either "image_registration",
+	# "masked" (weights out the blanked rows & NaNs explicitly, see xcorr.py), or
+	# "strips" (masked, but only on strips of rows around the slit edges)
+	xcorr = 'image_registration'
+	xcorr_maxoff = 20   # largest shift in pixels searched by the "masked" & "strips" engines
+	n_strips = 8        # number of slit-edge strips used by the "strips" engine
+	strip_height = 40   # rows per strip
+	strip_reference = None  # (reference, first rows of strips, strips, row weights)
+	blank_reference = None  # (reference, blanked reference frame, blanked rows)
+	
+	# frames read ahead in background threads by the loops (see prefetch.py)
+	prefetch_depth = 2      # frames read ahead (0 turns it off)
+	prefetch_memory = 512   # most MB held by the frames read ahead
+	
+	# model fit to the star's profile: "gaussian", "moffat", or "gaussian_halo" (see profiles.py),
+	# or "fast" to measure the FWHM from the half-maximum crossings without fitting
+	profile_model = 'gaussian'
+	
+	# cosmic rays in the star's cut-out: "clip" sigma-clips each cut-out's rows (see cut_out()),
+	# "stack" compares all the cut-outs of a nod at once in fit_all() (see cosmics.py)
+	cosmics = 'clip'
+	
+	# sky subtracted from the star's cut-outs in fit_all() (not fit_model()): the median of the
+	# last "sky_frames" frames of the other nod (0 turns it off, see sky.py), kept in memory-
+	# mapped files in "sky_scratch" if given
+	sky_frames = 0
+	sky_scratch = None
+	sky_state = None    # (settings, sky.RollingSky) carried over between calls
+	
+	# boxes (row_start, row_end, col_start, col_end) of all the stars in the mask, for
+	# tracking several stars at once (see multistar.py & autoconfig.configure_stars())
+	stars = None
+	
+	# SQLite catalogue of the archive (see catalogue.py), used by mask_frames() if set
+	catalogue = None
+	
+	# READING IN RAW FRAMES
+	def read_frame(self,filename):
+		'''
+		Reads in the data for a raw frame.  If the frame is in an attached cube,
+		a read-only view of the cube is returned and the FITS file isn't opened.
+		Otherwise the caller owns the returned array (float32 in low_memory mode).
+		'''
+		if self.cube_index is not None and filename in self.cube_index:
+			cube, i = self.cube_index[filename]
+			return cube[i]
+		data = rf.getdata(self.home+'%s/'%self.date+filename) # .fits, .fits.fz, or .fits.gz
+		# raw frames are already 4-byte floats (big-endian is fine), so this only
+		# converts other types; a copy here would undo astropy's lazy memory-mapped read
+		if self.low_memory == True and not (data.dtype.kind == 'f' and data.dtype.itemsize == 4):
+			data = data.astype(np.float32)
+		return data
+	
+	def header(self,filename):
+		'''
+		Reads in the header for a raw frame (or the header information stored
+		with an attached cube).
+		'''
+		if self.cube_meta is not None and filename in self.cube_meta:
+			return self.cube_meta[filename]
+		return rf.getheader(self.home+'%s/'%self.date+filename)
+	
+	def read_rows(self,filename,starts,height):
+		'''
+		Reads in only some strips of rows of a raw frame (without reading the rest
+		of the frame from disk).  The caller owns the returned array.
+		
+		INPUTS ---- filename:   str, name of raw MOSFIRE file to be read in
+			        starts:     1xK int array, first row of each strip
+			        height:     int, rows per strip
+		
+		RETURNS --- strips:     KxheightxN float array
+		'''
+		dtype = np.float32 if self.low_memory == True else np.float64
+		if self.cube_index is not None and filename in self.cube_index:
+			cube, i = self.cube_index[filename]
+			return np.stack([cube[i,s:s+height] for s in starts]).astype(dtype)
+		# only reads (or decompresses) the requested rows
+		return rf.read_rows(self.home+'%s/'%self.date+filename,starts,height).astype(dtype)
+	
+	def prefetch(self,frames,reference=None,reader=None):
+		'''
+		Iterates over (filename, data) for a list of frames, reading the next frames
+		in the background while the current one is being worked on.  With a reference
+		frame & the "strips" engine, only the strips of rows are read.
+		
+		INPUTS ---- frames:     list, names of raw MOSFIRE files (in order)
+			        reference:  str, reference frame of a cross-correlation loop
+			        reader:     function, reads one frame (default: the full frame),
+			                    ex. cut_out() to only read the star's slit
+		'''
+		if reader is not None: pass
+		elif reference is not None and self.xcorr == 'strips':
+			starts = self.reference_strips(reference)[0]
+			reader = lambda f: self.read_rows(f,starts,self.strip_height)
+		else: reader = self._read_now
+		if self.prefetch_depth == 0: return ((f,reader(f)) for f in frames)
+		return pf.Prefetcher(frames,reader,depth=self.prefetch_depth,\
+						max_bytes=self.prefetch_memory*1024**2)
+	
+	def _read_now(self,filename):
+		# astropy reads lazily, which would leave the reading to the thread using the data
+		data = self.read_frame(filename)
+		if isinstance(data,np.memmap) or not data.flags.owndata: data = np.array(data)
+		return data
+	
+	def sky_subtracted(self,frames,clip=True):
+		'''
+		Iterates over (filename, cut-out) with the sky from the other nod subtracted
+		(see sky.py).  The sky is kept between calls, so the next call carries on from
+		the last frame read (ex. fit_all(nod_B) after fit_all(nod_A) reads no frames
+		again, & neither does asking for the frames one at a time).
+		'''
+		import sky
+		settings = (self.home,self.date,self.mask,self.row_start,self.row_end,
+					self.col_start,self.col_end,self.sky_frames,self.sky_scratch,clip)
+		if self.sky_state is not None and self.sky_state[0] != settings:
+			self.sky_state[1].close()
+			self.sky_state = None
+		rolling = None if self.sky_state is None else self.sky_state[1]
+		nods = None
+		# the nods are only split again if there are new frames (ex. while tracking a night)
+		if rolling is None or not set(frames) <= set(rolling.nod_of):
+			nods = self.split_dither()
+			if rolling is not None and rolling.add_nods(*nods): nods = None
+		if nods is None and not rolling.available(frames): # frames already handed out
+			nods = [[f for f in rolling.night if rolling.nod_of[f] == n] for n in [0,1]]
+		if nods is not None: # starting (over)
+			if len(nods[0]) == 0 or len(nods[1]) == 0:
+				raise Exception('Need frames in both nods for the sky model.')
+			if rolling is not None: rolling.close()
+			rolling = sky.RollingSky(self,self.sky_frames,self.sky_scratch,clip)
+			rolling.add_nods(*nods)
+			self.sky_state = (settings,rolling)
+		return rolling.subtracted(frames)
+	
+	def attach_cubes(self,scratch='/tmp/kvs-cubes/',rebuild=False):
+		'''
+		Converts the frames for both nods into memory-mapped cubes on local scratch
+		(or reuses cubes made before), so that later reads skip the FITS files entirely.
+		'''
+		import cube
+		return cube.attach_cubes(self,scratch=scratch,rebuild=rebuild)
+	
+	def auto_configure(self,nframes=3):
+		'''
+		Finds the star's slit & columns from the first frames of both nods and fills
+		in row_start, row_end, col_start, & col_end (see autoconfig.py).
+		'''
+		import autoconfig
+		return autoconfig.configure(self,nframes=nframes)
+	
 	# LIST OF RAW FRAMES FOR CHOSEN MASK
 	# -- full list of frames
-	def mask_frames(self):
+	def raw_frames(self):
 		'''
-		Returns the list of MOSFIRE raw frames that are targeting the mask
-		of choice. Will make distinction between calibrations and on-sky data.
+		Returns the names of all the raw frames of the night (any mask), sorted,
+		from the directory listing alone (no headers are read).
 		'''
 		path = self.home+'%s/'%self.date
 		#print(path)
@@ -69,12 +234,28 @@ class Drift:
 		#allfiles = allfiles[]
 		mfiles = [f[:7] for f in allfiles] # fast way to ignore other files
 		raw_frames = allfiles[np.asarray(mfiles) == 'm'+mfile]
-		raw_frames = np.sort(raw_frames)
+		raw_frames = [f for f in raw_frames if rf.extension(f) is not None] # .fits, .fits.fz, .fits.gz
+		return list(np.sort(raw_frames))
+	
+	def mask_frames(self):
+		'''
+		Returns the list of MOSFIRE raw frames that are targeting the mask
+		of choice. Will make distinction between calibrations and on-sky data.
+		'''
+		if self.cube_meta is not None: # frames already known from the cubes, & any added since
+			frames = list(self.cube_meta.keys())
+			for f in self.raw_frames():
+				if f not in self.cube_listing and self.header(f).get('OBJECT') == self.mask: frames.append(f)
+			return sorted(frames)
+		if self.catalogue is not None: # frames already known from the catalogue
+			return [f for f,gratmode,yoffset in self.catalogue_frames()]
+		
+		raw_frames = self.raw_frames()
 		
 		mask_frames = []
 		for f in raw_frames:
 			#print(f)
-			head = fits.getheader(path+f)
+			head = self.header(f)
 			try:
 			    if head['OBJECT'] == self.mask:
 			        #print(f)
@@ -82,6 +263,22 @@ class Drift:
 			except KeyError: pass
 		return mask_frames
 	
+	def catalogue_frames(self):
+		'''
+		Returns (filename, GRATMODE, YOFFSET) for the frames of the mask from the
+		catalogue (see catalogue.py), plus the frames written since the last scan,
+		which are the only headers read.
+		'''
+		import catalogue as cat
+		table = cat.query(night=self.date,dbfile=self.catalogue)
+		rows = table.loc[table.object == self.mask,['file','gratmode','yoffset']].values.tolist()
+		known = set(table.file[table.object.notna()]) # unreadable when scanned --> read again
+		for f in self.raw_frames():
+			if f in known: continue
+			head = self.header(f)
+			if head.get('OBJECT') == self.mask: rows.append([f,head.get('GRATMODE'),head.get('YOFFSET')])
+		return sorted([tuple(row) for row in rows],key=lambda row: row[0])
+	
 	# -- splitting into both dithers
 	def split_dither(self):
 		'''
@@ -96,25 +293,41 @@ class Drift:
 		represents the number of nods.
 		'''
 		path = self.home+'%s/'%self.date
-		mask_frames = self.mask_frames()
+		if self.catalogue is not None: # GRATMODE & YOFFSET from the catalogue
+			modes = self.catalogue_frames()
+		else: modes = ((f,head['GRATMODE'],head.get('YOFFSET')) for f,head in \
+					   ((f,self.header(f)) for f in self.mask_frames()))
 		
 		nod_A, nod_B = [],[]
-		for filename in mask_frames:
-			head = fits.getheader(path+filename)
-			if head['GRATMODE'] == 'spectroscopy': # removes alignment frames
-			    if head['YOFFSET'] == self.dither: nod_A.append(filename)
-			    elif head['YOFFSET'] == -self.dither: nod_B.append(filename)
+		for filename,gratmode,yoffset in modes:
+			if gratmode == 'spectroscopy': # removes alignment frames
+			    if yoffset == self.dither: nod_A.append(filename)
+			    elif yoffset == -self.dither: nod_B.append(filename)
 			    else: raise Exception('ABAB dither pattern not found.')
 			else: pass
 			    
 		print('Number of frames in nod A: %s, in nod B: %s'%(len(nod_A),len(nod_B)),end='\n\n')
 		return nod_A, nod_B
-	
+
+	# -- name of a frame from its number
+	def frame_file(self,number):
+		'''
+		Returns the name of raw frame "number" for this date, with whichever
+		extension (.fits, .fits.fz, .fits.gz) it has.
+		'''
+		if self.cube_meta is not None: # frames already known from the cubes
+			for filename in self.cube_meta:
+				if rf.frame_number(filename) == int(number): return filename
+		mfile = 'm'+dt.strptime(self.date,'%Y%b%d').strftime('%y%m%d')
+		return rf.find_file(self.home+'%s/'%self.date,mfile+f'_{int(number):04d}')
+
 	
 	# FITTING MODEL TO STAR'S PROFILE
-	def cut_out(self,filename):
+	def cut_out(self,filename,data=None,clip=True):
 		'''
-		Creates the cutout for the star's 2D spectrum.
+		Creates the cutout for the star's 2D spectrum.  If the frame was already
+		read in (ex. by prefetch()), it can be given as "data".  With clip=False,
+		the cosmic rays are left in (for cosmics.clean_stack()).
 		
 		NOTE: when the new code is implemented here (see collapse_profile.py), the 2D cutout
 		returned will be used for the seeing map and the star drift tracker (like usual).
@@ -123,8 +336,18 @@ class Drift:
 		'''
 		path = self.home+'%s/'%self.date  
 		
-		star_img = fits.getdata(path+filename)
-		profile_2D = star_img[self.row_start:self.row_end,self.col_start:self.col_end].copy()
+		rows = slice(self.row_start,self.row_end)
+		if data is not None: star_img = data
+		elif rf.is_compressed(filename) and (self.cube_index is None or filename not in self.cube_index):
+			# only decompresses the tiles covering the star's slit
+			star_img = rf.read_rows(path+filename,[self.row_start],self.row_end-self.row_start)[0]
+			rows = slice(None)
+		else: star_img = self.read_frame(filename)
+		# copying just the cut-out (so the full frame can be freed)
+		if self.low_memory == True: dtype = np.float32
+		else: dtype = star_img.dtype
+		profile_2D = star_img[rows,self.col_start:self.col_end].astype(dtype)
+		if clip == False: return profile_2D
 		
 		# CLIPPING OUT COSMIC RAYS
 		# --> the threshold is sigma=2 because the code runs on the 
@@ -136,7 +359,7 @@ class Drift:
 		
 		return profile_2D
 		
-	def fit_model(self,filename):
+	def fit_model(self,filename,data=None,cutout=None):
 		'''
 		Creating the mask star's profile given a handful of columns to sum 
 		over (to increase the S/N), this function fits this profile.
@@ -155,6 +378,8 @@ class Drift:
 		---> because raw spectrum curves
 		
 		INPUTS ---- filename:   str, name of raw MOSFIRE file to be read in
+			        data:       array, the frame if it was already read in (optional)
+			        cutout:     array, the star's cut-out if it was already made (optional)
 			        row_start:  int, the yvalue for the bottom of the star's slit
 			        row_end:    int, the yvalue for the top of the star's slit
 			        col_start:  int, the xvalue for the first column (no skylines please)
@@ -163,46 +388,73 @@ class Drift:
 		RETURNS --- mean:       float, center pixel of profile
 			        A:          float, value of counts at peak
 			        sig:        float, standard deviation -- can get FWHM by ~2.35*sig
+			                    (for models other than "gaussian", FWHM/2.35)
 
 		'''
 		path = self.home+'%s/'%self.date    
-		
-		def gauss(xaxis, mean, A, sig, B): 
-			# simple gaussian fit
-			return A * np.exp(-np.power(xaxis-mean, 2.)/(2*np.power(sig, 2.))) + B
 
 		# -- reading in data for the star
-		profile_2D = self.cut_out(filename)
+		profile_2D = self.cut_out(filename,data=data) if cutout is None else cutout
 		profile = np.sum(profile_2D,axis=1) # summing over a few columns to increase S/N
 
 		# ---- fitting the profile of the star
-		x = np.arange(len(profile))
-		peak = profile.tolist().index(max(profile)) # index for spatial peak of emission
-		#print(peak,end=',')
-		popt, wavcov = curve_fit(gauss,x,profile,p0=[x[peak],profile[peak],4.,0.],\
-					bounds=(0,[np.inf,np.inf,30,np.inf]))
-
-		mean, A, sig, B = popt
-		return mean, A, sig
+		mean, A, sig = self.fit_profiles([profile])
+		return mean[0], A[0], sig[0]
 	
-	def cross_correlations(self,reference,filename):
+	def fit_profiles(self,profiles,model=None):
+		'''
+		Fits "profile_model" to many profiles at once (see profiles.py), which is
+		about as fast as fitting one.  Fits that don't converge come back as NaN.
+		With "fast", nothing is fit (see profiles.fast_fwhm()).
+		
+		INPUTS ---- profiles:   list of 1D arrays, collapsed profiles of the star
+		            model:      str, overrides "profile_model" (optional)
+		
+		RETURNS --- mean, A, sig:   arrays, as for fit_model()
+		'''
+		if model is None: model = self.profile_model
+		if model == 'fast': return pr.fast_fwhm(profiles)
+		params, ok = pr.batch_fit(profiles,model)
+		params[~ok] = np.nan
+		return pr.summary(params,model)
+	
+	def cross_correlations(self,reference,filename,data=None):
 		'''
 		Takes filenames of reference frame & another frame, reads in data, & calculates
 		the shift of the second frame from the reference using cross-correlations.
+		The blanked reference is kept (see blank_reference()), so a loop over frames
+		with the same reference only blanks it once.
 		
 		INPUTS ---- reference:      str, name of raw MOSFIRE file to use as ref.
 			        filename:       str, name of raw MOSFIRE file to be read in
+			        data:           array, the frame (or its strips, for the "strips"
+			                        engine) if it was already read in, ex. by prefetch();
+			                        a full frame is blanked in place
 		
 		RETURNS --- xshift,yshift:  (float,float), shift of frame relative to reference
 		'''
 		path = self.home+'%s/'%self.date
-		ref_frame = fits.getdata(path+reference)
-		raw_frame = fits.getdata(path+filename)
+		if self.xcorr == 'strips': return self.strip_correlations(reference,filename,data=data)
+		
+		ref_frame, ref_rows = self.blank_reference_frame(reference)
+		raw_frame = self.read_frame(filename) if data is None else data
+		# frames from a cube are read-only views & the blanking changes the frame
+		if not raw_frame.flags.writeable: raw_frame = raw_frame.copy()
 		
 		# masking out rows with signal in both
 		# default sigma clipping: upper_sig=2.5, lower_sig=5
-		ref_frame = coll.return_blank2D(ref_frame)
-		raw_frame = coll.return_blank2D(raw_frame)
+		# --> the masked rows get zero weight in the (zero-mean) cross-correlation,
+		# --> set in place in the frames we own, so no NaN-filled copies are made
+		# --> the clipping NaNs the peaks of the skylines too, so the clipped pixels
+		# --> are filled (as image_registration does) rather than ignored
+		raw_rows = coll.blank_rows(raw_frame,low_memory=self.low_memory)
+		raw_frame = coll.weight_rows(raw_frame,raw_rows)
+		
+		if self.xcorr == 'masked': # the masked rows get zero weight
+			dtype = np.float32 if self.low_memory == True else np.float64
+			xshift,yshift = xc.masked_cross_correlation_shifts(ref_frame,raw_frame,\
+						ref_weight=~ref_rows,img_weight=~raw_rows,maxoff=self.xcorr_maxoff,dtype=dtype)
+			return xshift,yshift
 		
 		# running the cross-correlation
 		xshift,yshift = ir.cross_correlation_shifts(ref_frame,raw_frame)
@@ -210,6 +462,107 @@ class Drift:
 			                 # essentially tracks the drift of the slit
 		
 	
+	def blank_reference_frame(self,reference):
+		'''
+		Blanks the reference frame for cross_correlations() (rows with signal found &
+		filled, see collapse_profile.blank_rows()), once per reference; the result is
+		kept in "blank_reference" and must not be changed.
+		
+		RETURNS --- ref_frame:  NxN array, blanked reference frame
+			        ref_rows:   1xN bool array, True for rows with signal
+		'''
+		settings = (reference,self.low_memory)
+		if self.blank_reference is not None and self.blank_reference[0] == settings:
+			return self.blank_reference[1:]
+		
+		ref_frame = self.read_frame(reference)
+		if not ref_frame.flags.writeable: ref_frame = ref_frame.copy()
+		ref_rows = coll.blank_rows(ref_frame,low_memory=self.low_memory)
+		ref_frame = coll.weight_rows(ref_frame,ref_rows)
+		self.blank_reference = (settings,ref_frame,ref_rows)
+		return ref_frame,ref_rows
+	
+	def reference_strips(self,reference):
+		'''
+		Picks the slit-edge strips from the reference frame's blanked spatial profile
+		(see collapse_profile.edge_strips()).  Done once per reference, the strips are
+		kept in "strip_reference" for the following frames.
+		
+		RETURNS --- starts:     1xK int array, first row of each strip
+			        strips:     KxheightxN array, the reference's strips
+			        weights:    Kxheight bool array, False for rows with signal
+		'''
+		settings = (reference,self.n_strips,self.strip_height,self.xcorr_maxoff)
+		if self.strip_reference is not None and self.strip_reference[0] == settings:
+			return self.strip_reference[1:]
+		
+		ref_frame = self.read_frame(reference)
+		if not ref_frame.flags.writeable: ref_frame = ref_frame.copy()
+		blank = coll.make_blank(ref_frame,upper_sigma=2.5,low_memory=self.low_memory)
+		starts = coll.edge_strips(blank,nstrips=self.n_strips,height=self.strip_height,gap=self.xcorr_maxoff)
+		if len(starts) == 0: raise Exception('No slit edges found in %s.'%reference)
+		
+		rows = starts[:,None] + np.arange(self.strip_height)
+		strips = np.asarray(ref_frame[rows],dtype=np.float32 if self.low_memory == True else np.float64)
+		weights = ~np.isnan(blank[rows])
+		coll.weight_rows(strips.reshape(-1,strips.shape[-1]),~weights.ravel()) # see strip_correlations()
+		self.strip_reference = (settings,starts,strips,weights)
+		return starts,strips,weights
+	
+	def strip_correlations(self,reference,filename,data=None):
+		'''
+		Same as cross_correlations(), but only reads & correlates the strips of rows
+		around the slit edges (see reference_strips()), which is a much smaller FFT
+		and a fraction of the reading.  The rows with signal in the reference are
+		given zero weight in both frames, since the slits barely move between frames.
+		
+		RETURNS --- xshift,yshift:  (float,float), shift of frame relative to reference
+		'''
+		starts,ref_strips,weights = self.reference_strips(reference)
+		if data is None: raw_strips = self.read_rows(filename,starts,self.strip_height)
+		else: raw_strips = np.array(data,dtype=ref_strips.dtype) # changed in place below
+		# clipping cosmic rays row by row & filling them, same as for the full frames
+		rows = raw_strips.reshape(-1,raw_strips.shape[-1]) # view
+		coll.collapse_2D(rows,low_memory=self.low_memory)
+		coll.weight_rows(rows,~weights.ravel())
+		
+		xshift,yshift = xc.masked_cross_correlation_shifts(ref_strips,raw_strips,ref_weight=weights,\
+						img_weight=weights,maxoff=self.xcorr_maxoff,dtype=ref_strips.dtype)
+		return xshift,yshift
+	
+	def compare_cross_correlations(self,reference,frames,engines=['masked','strips']):
+		'''
+		Runs cross_correlations() with different engines on the same frames, to check
+		the accuracy (& speed) of one against another.  The first engine is taken as
+		the truth when printing the differences.
+		
+		INPUTS ---- reference:  str, name of raw MOSFIRE file to use as ref.
+			        frames:     list, names of raw MOSFIRE files
+			        engines:    list, values of "xcorr" to compare
+		
+		RETURNS --- df:         pandas DataFrame, shifts for each engine & frame
+		'''
+		import time
+		engine = self.xcorr
+		df = pd.DataFrame({'file':frames})
+		runtime = {}
+		for name in engines:
+			self.xcorr = name
+			start = time.perf_counter()
+			shifts = np.asarray([self.cross_correlations(reference,f) for f in frames])
+			runtime[name] = (time.perf_counter()-start)/len(frames)
+			df[f'xshift_{name}'],df[f'yshift_{name}'] = shifts[:,0],shifts[:,1]
+		self.xcorr = engine
+		
+		truth = engines[0]
+		print('%20s %10s %10s %12s'%('engine','x rms','y rms','s per frame'))
+		for name in engines:
+			dx = df[f'xshift_{name}']-df[f'xshift_{truth}']
+			dy = df[f'yshift_{name}']-df[f'yshift_{truth}']
+			print('%20s %10.3f %10.3f %12.2f'%(name,np.sqrt(np.mean(dx**2)),np.sqrt(np.mean(dy**2)),runtime[name]))
+		return df
+	
+	
 	def get_UTC(self,filename):
 		'''
 		Pulling UTC information for a given filename or multiple filenames.
@@ -219,16 +572,15 @@ class Drift:
 		'''
 		path = self.home+'%s/'%self.date
 		
-		try: len(filename); one = False # more than one file
-		except TypeError: one = True
+		one = isinstance(filename,str) # one file or more than one file
 			
 		if one == True:
-			head = fits.getheader(path+filename)
+			head = self.header(filename)
 			utc = head['utc']
 		else:
 			utc = []
 			for i in range(len(filename)):
-			    head = fits.getheader(path+filename[i])
+			    head = self.header(filename[i])
 			    utc.append(head['utc'])
 			    
 		return utc
@@ -243,16 +595,15 @@ class Drift:
 		'''
 		path = self.home+'%s/'%self.date
 		
-		try: len(filename); one = False # more than one file
-		except TypeError: one = True
+		one = isinstance(filename,str) # one file or more than one file
 			
 		if one == True:
-			head = fits.getheader(path+filename)
-			air = head['utc']
+			head = self.header(filename)
+			air = head['airmass']
 		else:
 			air = []
 			for i in range(len(filename)):
-			    head = fits.getheader(path+filename[i])
+			    head = self.header(filename[i])
 			    air.append(head['airmass'])
 			    
 		return air
@@ -268,16 +619,15 @@ class Drift:
 		'''
 		path = self.home+'%s/'%self.date
 		
-		try: len(filename); one = False # more than one file
-		except TypeError: one = True
+		one = isinstance(filename,str) # one file or more than one file
 			
 		if one == True:
-			head = fits.getheader(path+filename)
+			head = self.header(filename)
 			pa,el = head['rotpposn'],head['el']
 		else:
 			pa,el = [],[]
 			for i in range(len(filename)):
-			    head = fits.getheader(path+filename[i])
+			    head = self.header(filename[i])
 			    pa.append(head['rotpposn'])
 			    el.append(head['el'])
 			    
@@ -286,28 +636,48 @@ class Drift:
 	
 	# CONVENIENCE FUNCTIONS
 	# retrieving the fit for an entire dataset
-	def fit_all(self,frames):
+	def fit_all(self,frames,model=None):
 		'''
 		Runs the fitting function on a large number of frames.
 		Returns the fit parameters and the frame numbers.
+		(model overrides "profile_model", see fit_profiles())
+		
+		With cosmics = "stack", the frames should all be from the same nod.
 		'''
-		all_centers, all_As, all_sigs, frame_number = [],[],[],[]
-		for filename in frames:
+		stack = self.cosmics == 'stack'
+		reader = (lambda f: self.cut_out(f,clip=False)) if stack == True else self.cut_out
+		# cuts out the star's slit from the next frames meanwhile (only those
+		# rows are decompressed for .fits.fz frames, see rawfits.py)
+		if self.sky_frames > 0: cut_outs = self.sky_subtracted(frames,clip=not stack)
+		else: cut_outs = self.prefetch(frames,reader=reader)
+		profiles, frame_number = [],[]
+		for filename,profile_2D in cut_outs:
 			#print(filename)
-			mean, A, sig = self.fit_model(filename)
-			all_centers.append(mean)
-			all_As.append(A)
-			all_sigs.append(sig)
-			frame_number.append(int(filename[-8:-5]))
-	
-		return all_centers, all_As, all_sigs, frame_number
+			if stack == True: profiles.append(profile_2D)
+			else: profiles.append(np.sum(profile_2D,axis=1)) # same profile as fit_model()
+			frame_number.append(rf.frame_number(filename))
+		if len(profiles) == 0: return [],[],[],frame_number
+		if stack == True: # cosmic rays found by comparing the frames
+			cleaned, hits = cr.clean_stack(profiles,inplace=True)
+			profiles = list(np.sum(cleaned,axis=2))
+		
+		# -- fitting all of the frames at once
+		all_centers, all_As, all_sigs = self.fit_profiles(profiles,model)
+		return list(all_centers), list(all_As), list(all_sigs), frame_number
 	
 	# plotting all of the profiles for inspection
-	def show_me_all_profiles(self,frames):
+	def show_me_all_profiles(self,frames,preview=False,cache='previews/'):
 		'''
 		Given frames, makes the cutouts, collapses spectrally,
 		and plots all of the profiles for inspection.
+		
+		If preview=True, the profiles are read from the preview files instead
+		of the raw frames (see preview.py), which is much faster for a full night.
 		'''
+		if preview == True:
+			import preview as pv
+			return pv.show_me_all_profiles(self,frames,cache=cache)
+		
 		path = self.home+'%s/'%self.date    
 
 		# plotting the profiles
@@ -0,0 +1,158 @@
+'''
+Online drift-rate & alerting stage.
+
+Rather than inspecting the drift_map() plots by eye, the DriftMonitor() here takes the
+star offsets & slit shifts one frame at a time (ex. from mask_drift.stream_drift()) and
+
+    --  fits rolling linear drift rates against UTC for the star & the slit (per nod),
+    --  classifies the drift as described in plots-data/README.md:
+            "star only"         the star drifts but the slit doesn't --> likely guider
+                                flexure (or differential atmospheric refraction, DAR)
+            "star and slit"     both drift together --> likely an internal FCS problem
+            "slit only"         the mask moves but the star doesn't (worth a look)
+            "stable"            neither is drifting
+    --  raises an alert on the frame where an offset, or a drift rate, crosses its limit.
+
+Everything is kept in fixed-length deques, so the memory used doesn't grow over the night.
+'''
+
+import numpy as np
+from collections import deque
+from tracker import RollingLinearFit, FrameLister, utc_hours, pixscale
+
+
+def measured(row,key):
+    '''
+    A measurement from a row as a float, NaN if it's missing (or None, as in the
+    exported series, see gui_export.py).
+    '''
+    value = row.get(key,None)
+    return np.nan if value is None else float(value)
+
+
+class DriftMonitor:
+    '''
+    Streams star offsets & slit shifts and raises alerts.
+
+    INPUTS ---- window:         int, frames (per nod) in the rolling rate fits
+                min_frames:     int, frames needed in a fit before rates are used
+                rate_limit:     float, drift rate (" per hour) above which the
+                                star or slit counts as drifting
+                offset_limit:   float, offset (") from the nod's reference frame
+                                that raises an alert right away
+                history:        int, number of alerts & classifications kept
+                alert:          function called with each new alert (default: print)
+    '''
+    def __init__(self,window=10,min_frames=4,rate_limit=0.5,offset_limit=0.5,history=100,alert=None):
+        self.window = window
+        self.min_frames = min_frames
+        self.rate_limit = rate_limit
+        self.offset_limit = offset_limit
+        self.alert = alert if alert is not None else self._print
+
+        self.t0 = None
+        self.star = {}  # nod --> RollingLinearFit of star offset (") vs. time (hours)
+        self.slit = {}  # nod --> RollingLinearFit of slit offset (") vs. time (hours)
+        self.active = set()                 # alerts currently raised
+        self.alerts = deque(maxlen=history)
+        self.classes = deque(maxlen=history)
+        # for mask_drift.stream_drift(): the frames not measured yet & the reference
+        # frame of each nod, so a poll only reads & fits the new frames
+        self.frames = FrameLister()
+        self.references = {}    # nod --> (reference frame, centre of the star in it)
+
+    @staticmethod
+    def _print(alert):
+        print('ALERT frame %s (nod %s, %s UTC): %s'%(alert['frame'],alert['nod'],alert['utc'],alert['message']))
+
+    def _hours(self,utc):
+        t = utc_hours(utc)
+        if self.t0 is None: self.t0 = t
+        if t < self.t0 - 12: t += 24 # past midnight UTC
+        return t - self.t0
+
+    def _rate(self,fits,nod):
+        fit = fits.get(nod)
+        if fit is None or fit.sums[0] < self.min_frames: return np.nan
+        return fit.slope()
+
+    def classify(self,star_rate,slit_rate):
+        star = abs(star_rate) > self.rate_limit
+        slit = abs(slit_rate) > self.rate_limit
+        if star and slit: return 'star and slit'
+        if star: return 'star only'
+        if slit: return 'slit only'
+        return 'stable'
+
+    def _raise(self,key,row,message):
+        # only raised on the frame the problem shows up, not on every frame after
+        if key in self.active: return None
+        self.active.add(key)
+        alert = {'frame':row['frame'], 'nod':row['nod'], 'utc':row['utc'], 'kind':key[0], 'message':message}
+        self.alerts.append(alert)
+        self.alert(alert)
+        return alert
+
+    def update(self,row):
+        '''
+        Adds one frame.
+
+        INPUTS ---- row:    dict with frame, nod, utc, star_offset ("), and optionally
+                            slit_yshift (pixels), ex. from mask_drift.stream_drift()
+
+        RETURNS --- status: dict, drift rates (" per hour), classification, & any
+                            alerts raised by this frame
+        '''
+        nod, hours = row['nod'], self._hours(row['utc'])
+        star = measured(row,'star_offset')
+        # the slit moving up by dy pixels moves the star by the same amount, which
+        # is an offset of -dy*0.18" in the sign convention of the star offsets
+        slit = -measured(row,'slit_yshift') * pixscale
+
+        for fits,value in zip([self.star,self.slit],[star,slit]):
+            if np.isnan(value): continue
+            if nod not in fits: fits[nod] = RollingLinearFit(self.window)
+            fits[nod].add(hours,value)
+
+        star_rate, slit_rate = self._rate(self.star,nod), self._rate(self.slit,nod)
+        kind = self.classify(star_rate,slit_rate)
+        self.classes.append((row['frame'],kind))
+
+        raised = []
+        # -- offsets: raised on the first frame past the limit -- #
+        for name,value in zip(['star','slit'],[star,slit]):
+            if np.isnan(value): continue
+            key = (name+' offset',nod)
+            if abs(value) > self.offset_limit:
+                raised.append(self._raise(key,row,'%s is %.2f" from the reference frame'%(name,value)))
+            else: self.active.discard(key) # back within the limit
+
+        # -- drift rates: raised when a kind of drift starts in a nod -- #
+        # (the nods are fit separately, so a stable nod doesn't end the other's drift)
+        self.active = {key for key in self.active if not (key[0] == 'drift rate' and \
+                       key[2] == nod and key[1] != kind)}
+        if kind != 'stable':
+            rate = np.nanmax(np.abs([star_rate,slit_rate]))
+            raised.append(self._raise(('drift rate',kind,nod),row,'%s drift of %.2f"/hour'%(kind,rate)))
+        raised = [alert for alert in raised if alert is not None]
+
+        return {'frame':row['frame'], 'nod':nod, 'star_rate':star_rate, 'slit_rate':slit_rate,
+                'classification':kind, 'alerts':raised}
+
+
+def monitor_night(drift_obj,monitor=None,slit=True,start=-1):
+    '''
+    Runs the measurements for a mask frame by frame through a DriftMonitor.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                monitor:    DriftMonitor, (default: a new one)
+                slit:       bool, also run the slit cross-correlations
+                start:      int, only frames after this frame number are used
+
+    RETURNS --- monitor:    the updated DriftMonitor
+                statuses:   list of dicts, one per frame (see DriftMonitor.update())
+    '''
+    from mask_drift import stream_drift
+    if monitor is None: monitor = DriftMonitor()
+    statuses = [monitor.update(row) for row in stream_drift(drift_obj,slit=slit,start=start,monitor=monitor)]
+    return monitor, statuses
@@ -0,0 +1,80 @@
+'''
+Compares the masked cross-correlation in xcorr.py to image_registration's
+cross_correlation_shifts(), for accuracy & runtime.
+
+Accuracy is checked on test.fits shifted by known (sub-pixel) amounts, with different
+rows blanked in each frame (as done by collapse_profile.blank_rows()), and on the fake
+shifted star used in test_cross_correlations.py.  Runtime is measured on a full-size
+(2048x2048) frame.
+'''
+
+import numpy as np
+from astropy.io import fits
+from scipy.ndimage import shift
+import image_registration as ir # github.com/keflavich/image_registration
+import time
+import sys
+sys.path.append('..')
+import xcorr as xc
+import argparse
+
+parser = argparse.ArgumentParser(description="Benchmarking the cross-correlation engines.",
+			usage='benchmark_cross_correlations.py [-n NTRIALS] [-s SIZE] [-m MAXOFF]')
+
+parser.add_argument('-n','--ntrials',help='Number of random shifts to test. (default: 20)',default=20,type=int)
+parser.add_argument('-s','--size',help='Size of the frame used for timing. (default: 2048)',default=2048,type=int)
+parser.add_argument('-m','--maxoff',help='Largest shift searched by the masked engine. (default: 10)',default=10,type=int)
+args = parser.parse_args()
+
+engines = {'image_registration': lambda a,b: ir.cross_correlation_shifts(a,b),
+		   'masked': lambda a,b: xc.masked_cross_correlation_shifts(a,b,maxoff=args.maxoff),
+		   'masked float32': lambda a,b: xc.masked_cross_correlation_shifts(a,b,maxoff=args.maxoff,dtype=np.float32)}
+
+
+# -- accuracy on test.fits -- #
+d0 = fits.getdata('test.fits').astype(float)
+rng = np.random.default_rng(42)
+errors = {name:[] for name in engines}
+
+for i in range(args.ntrials):
+	dy,dx = rng.uniform(-3,3,2)
+	ref = d0.copy()
+	img = shift(d0,(dy,dx),order=3)
+	# blanking a different band of rows in each frame
+	r0,r1 = rng.integers(10,len(d0)-20,2)
+	ref[r0:r0+8] = np.nan
+	img[r1:r1+8] = np.nan
+
+	for name,engine in engines.items():
+		xshift,yshift = engine(ref,img)
+		errors[name].append([xshift-dx,yshift-dy])
+
+print('Shift errors on test.fits (%s random shifts, pixels):'%args.ntrials)
+print('%20s %10s %10s %10s %10s'%('engine','x bias','x rms','y bias','y rms'))
+for name,err in errors.items():
+	err = np.asarray(err)
+	bias,rms = np.mean(err,axis=0),np.sqrt(np.mean(err**2,axis=0))
+	print('%20s %10.3f %10.3f %10.3f %10.3f'%(name,bias[0],rms[0],bias[1],rms[1]))
+
+
+# -- fake shifted star -- #
+fake2 = np.zeros((50,50))
+fake2[10:14] = np.nan
+fake2[40:43,40:43] = 3
+fake3 = np.zeros((50,50))
+fake3[10:14] = np.nan
+fake3[38:41,35:38] = 3
+print('\nFake star (true shift: -5, -2):')
+for name,engine in engines.items():
+	xshift,yshift = engine(fake2,fake3)
+	print('%20s %10.3f %10.3f'%(name,xshift,yshift))
+
+
+# -- runtime on a full frame -- #
+big = rng.normal(0,1,(args.size,args.size)).astype(np.float32)
+big2 = np.roll(big,(2,-1),axis=(0,1))
+print('\nRuntime on a %sx%s frame:'%(args.size,args.size))
+for name,engine in engines.items():
+	start = time.perf_counter()
+	engine(big,big2)
+	print('%20s %10.2f s'%(name,time.perf_counter()-start))
@@ -34,6 +34,9 @@ import matplotlib.gridspec as gd
 from datetime import datetime as dt
 import image_registration as ir # github.com/keflavich/image_registration
 import argparse
+import sys
+sys.path.append('..')
+from prefetch import Prefetcher # reads frames ahead in the background
 
 # reading input information
 parser = argparse.ArgumentParser(description="Running cross-correlation on engineering data.",
@@ -43,6 +46,7 @@ parser = argparse.ArgumentParser(description="Running cross-correlation on engin
 parser.add_argument('-p','--path',help='Path to files.',required=True)
 parser.add_argument('-o','--FCS',help='FCS on? (y/n)',required=True)
 parser.add_argument('-b','--band',help='Band data were taken in. (J/H)',required=True)
+parser.add_argument('-d','--depth',help='Frames read ahead in the background. (default: 2)',default=2,type=int)
 args = parser.parse_args()
 
 # reading in data
@@ -84,14 +88,14 @@ print('Range of elevation:',np.sort(elevations))
 print('Range of rotpposn:',np.sort(rotpposns),end='\n\n')
 
 # running through all frames
+# --> the next frames are read in the background while each one is cross-correlated
 print(f'Running through all {len(df)} frames.')
-for i in df.index.values:
+filenames = [home+date+'/'+f for f in df.file]
+for i,(filename,d1) in zip(df.index.values,Prefetcher(filenames,depth=args.depth)):
 	if i%10 == 0: print(f'\nAt number {i} of {len(df)} frames...',end=' ')
 	else: print(i,end=',')
 
-	filename = home+date+'/'+df.loc[i,'file']
 	#print(filename,end=', ')
-	d1 = fits.getdata(filename)
 	xshift,yshift = ir.cross_correlation_shifts(d0,d1) # returns xshift, yshift
 	df.loc[i,'xshift'] = round(xshift,6) # enough precision
 	df.loc[i,'yshift'] = round(yshift,6) # enough precision
@@ -21,6 +21,49 @@ import matplotlib.patheffects as PathEffects
 df = pd.read_csv('../MOSFIRE_information/fcs_model_parameters.txt',\
                  index_col=0,delimiter='\s+') # parameter names are index
 
+# order of the model parameters that change the shape of the shifts
+# (used when refitting the model, see flexure_uncertainty.py)
+param_names = ['a','ph','k','beta','x02','y02']
+
+def band_filter(band):
+    '''
+    Returns the column of the parameter table used for a given band.
+    '''
+    if band == 'Y' or band == 'J': return 'YJ'
+    elif band == 'H' or band == 'K': return 'HK'
+    else: return 'Mirror'
+
+def model_params(band):
+    '''
+    Returns the current model parameters for a given band, in the order of "param_names".
+    '''
+    filt = band_filter(band)
+    return np.array([df.loc[p,filt] for p in param_names])
+
+def flexure_shifts(PA,Z,a,ph,k,beta,x02,y02):
+    '''
+    The model itself, written so that it can be evaluated for many parameter sets at once.
+    Every input broadcasts with numpy rules, so parameters with shape (N,1) and PA,Z with 
+    shape (M,) return (N,M) arrays of shifts.
+    
+    INPUTS ---- PA:         float or array, rotation of instrument
+                Z:          float or array, elevation
+                a,ph,k,...: float or array, model parameters (see "param_names")
+                
+    RETURNS --- deltaX:     float or array, pixel shift in x-direction (before centering)
+                deltaY:     float or array, pixel shift in y-direction (before centering)
+    '''
+    amp = a*np.sin(Z)
+    Yc = y02*(1-np.cos(Z))
+    Xc = x02*(1-np.cos(Z))
+    
+    cos_p, sin_p = np.cos(PA+ph), np.sin(PA+ph)
+    cos_b, sin_b = np.cos(beta), np.sin(beta)
+    
+    deltaX = Xc + amp*cos_p*sin_b - amp*k*sin_p*cos_b
+    deltaY = Yc + amp*cos_p*cos_b + amp*k*sin_p*sin_b
+    return deltaX, deltaY
+
 def flexure_comp(PA,Z,band):
     '''
     This code returns the pixels shifts given an instrument "attitude".
@@ -32,21 +75,10 @@ def flexure_comp(PA,Z,band):
     RETURNS --- xshift: float, pixel shift in x-direction
                 yshift: float, pixel shift in y-direction
     '''
-    
-    if band == 'Y' or band == 'J': filt = 'YJ'
-    elif band == 'H' or band == 'K': filt = 'HK'
-    else: filt = 'Mirror'
-        
-    a, y02, x02 = df.loc['a',filt], df.loc['y02',filt], df.loc['x02',filt]
-    ph, k, beta = df.loc['ph',filt], df.loc['k',filt], df.loc['beta',filt]
+    filt = band_filter(band)
     centerx, centery = df.loc['centerx',filt], df.loc['centery',filt]
     
-    amp = a*np.sin(Z)
-    Yc = y02*(1-np.cos(Z))
-    Xc = x02*(1-np.cos(Z))
-    
-    deltaX = Xc + amp*np.cos(PA+ph)*np.sin(beta) - amp*k*np.sin(PA+ph)*np.cos(beta)
-    deltaY = Yc + amp*np.cos(PA+ph)*np.cos(beta) + amp*k*np.sin(PA+ph)*np.sin(beta)
+    deltaX, deltaY = flexure_shifts(PA,Z,*model_params(band))
     
     xshift = deltaX - centerx
     yshift = deltaY - centery
@@ -63,9 +95,7 @@ def tip_tilt_corrections(PA,Z,band):
     RETURNS --- thetax: float, tip correction
                 thetay: float, tilt correction
     '''
-    if band == 'Y' or band == 'J': filt = 'YJ'
-    elif band == 'H' or band == 'K': filt = 'HK'
-    else: filt = 'Mirror'
+    filt = band_filter(band)
         
     xshift,yshift = flexure_comp(PA,Z,band)
     xscale, yscale = df.loc['xscale',filt], df.loc['yscale',filt]
@@ -13,6 +13,7 @@ from scipy.optimize import curve_fit
 import matplotlib.gridspec as gd
 import matplotlib.patheffects as PathEffects
 from current_model import * # current model written up by Taylor
+from flexure_uncertainty import shift_bands, posterior_file, fit_names
 import argparse
 
 # reading input information
@@ -21,6 +22,7 @@ parser = argparse.ArgumentParser(description="Looking at the cross-correlations
 			epilog='Contact Taylor Hutchison at aibhleog@tamu.edu with questions.')
 parser.add_argument('-b','--band',help='Band data were taken in. (J/H)',required=True)
 parser.add_argument('-s','--savefig',help='Save figure? (y/n)')
+parser.add_argument('-u','--uncertainty',help='Draw posterior bands from flexure_uncertainty.py? (y/n)')
 args = parser.parse_args()
 
 
@@ -33,6 +35,11 @@ rotpposns = np.sort(list(set(df.rotpposn)))
 print('Range of elevation:',elevations)
 print('Range of rotpposn:',rotpposns,end='\n\n')
 
+# posterior samples for the refit model (see flexure_uncertainty.py)
+if args.uncertainty == 'y':
+    samples = pd.read_csv(posterior_file('Off',band),delimiter='\t')[fit_names].values
+    rot_grid = np.linspace(rotpposns[0],rotpposns[-1],100)
+
 # -- color scheme and kwargs for legend -- #
 cmap = plt.get_cmap('viridis')
 colors = cmap(np.linspace(0,1.2,len(elevations)+1))
@@ -75,6 +82,11 @@ for e in range(len(elevations)):
     
     ax.plot(rots,mod_yvals,zorder=0,lw=1,color=colors[e])
     
+    # adding 68% band from the refit model
+    if args.uncertainty == 'y':
+        xband,yband = shift_bands(samples,np.radians(rot_grid),np.radians(90-el))
+        ax.fill_between(rot_grid,yband[0],yband[2],color=colors[e],alpha=0.3,lw=0,zorder=0)
+    
     # residual subplot
     ax2.scatter(rots,yvals-mod_yvals,color=colors[e],s=60,edgecolor='k')
     ax2.axhline(0,ls=':',color='k',zorder=0)
@@ -0,0 +1,272 @@
+'''
+NOTE:   This script reads in data ran from the cross-correlations script in this
+            repository.  If you would like access to this data, please email
+            the author and provide an explanation for why you would need it.
+
+Measures how well the FCS model parameters (see "current_model.py") are constrained by
+the engineering data.  The comparison scripts only give point estimates, so this module
+refits the model to the measured x & y shifts and returns parameter posteriors using either:
+    1) bootstrap refits of the measurements, or
+    2) an affine-invariant ensemble sampler (the "stretch move" from emcee)
+
+Both are spread across a process pool, and the likelihood is vectorized so that every
+walker (or parameter set) is evaluated in one numpy call.  The posteriors are written to
+plots-data/data_FCS/, and shift_bands() turns them into the predicted-shift bands that
+fcs_off_compare.py draws (run it with "-u y").
+
+Fit parameters: the shape parameters in "param_names" plus a zeropoint in x & y
+(the zeropoints absorb the reference frame & the "manual" y-shift in the compare plots).
+'''
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+from multiprocessing import Pool
+from current_model import * # current model written up by Taylor
+import argparse
+
+fit_names = param_names + ['x0','y0']
+
+
+def read_measurements(fcs,band,home='../KVS-data/'):
+    '''
+    Reads in the cross-correlation measurements for the engineering data.
+
+    INPUTS ---- fcs:    str, FCS state, "On" or "Off"
+                band:   str, band data were taken in (J/H)
+                home:   str, path to the KVS-data/ folder
+
+    RETURNS --- PA,Z:   (array,array), rotpposn & zenith angle in radians
+                xs,ys:  (array,array), measured x & y shifts in pixels
+    '''
+    df = pd.read_csv(f'{home}individual_FCS_datasets/keck_FCS_{fcs}_{band}_measurements.dat',\
+                     delimiter='\t')
+    PA = np.radians(df.rotpposn.values)
+    Z = np.radians(90-df.el.values) # 90-el because zenith
+    return PA, Z, df.xshift.values, df.yshift.values
+
+
+def model_xy(theta,PA,Z):
+    '''
+    Measured-frame version of the model, (x0 - deltaX, y0 - deltaY),
+    the same way the compare scripts shift the model onto the data.
+
+    INPUTS ---- theta:  (8,) or (N,8) array, parameters in "fit_names" order
+                PA,Z:   arrays, rotpposn & zenith angle in radians
+
+    RETURNS --- x,y:    arrays of shape (M,) or (N,M)
+    '''
+    theta = np.asarray(theta,dtype=float)
+    if theta.ndim == 2: theta = theta.T[:,:,None] # (8,N,1) broadcasts against (M,)
+    deltaX, deltaY = flexure_shifts(PA,Z,*theta[:6])
+    return theta[6] - deltaX, theta[7] - deltaY
+
+
+def _residuals(theta,PA,Z,xs,ys):
+    x,y = model_xy(theta,PA,Z)
+    return np.concatenate((x-xs,y-ys))
+
+
+def best_fit(PA,Z,xs,ys,band='J',p0=None,nphase=12):
+    '''
+    Least-squares fit of the model to the measured shifts.  The phase is periodic,
+    so the starting point is taken as the best of a coarse grid in "ph".
+
+    INPUTS ---- PA,Z:   arrays, rotpposn & zenith angle in radians
+                xs,ys:  arrays, measured x & y shifts in pixels
+                band:   str, band used for the starting parameters
+                p0:     array, starting parameters (default: current model)
+                nphase: int, number of starting phases to try
+
+    RETURNS --- theta:  (8,) array, best fit parameters in "fit_names" order
+    '''
+    if p0 is None:
+        p0 = np.append(model_params(band),[0.,0.])
+        # zeropoints are linear, so start them at the mean offset
+        deltaX, deltaY = flexure_shifts(PA,Z,*p0[:6])
+        p0[6], p0[7] = np.mean(xs+deltaX), np.mean(ys+deltaY)
+
+    # picking the starting phase with a single vectorized call
+    starts = np.repeat(np.asarray(p0,dtype=float)[None,:],nphase,axis=0)
+    starts[:,1] = p0[1] + np.linspace(0,2*np.pi,nphase,endpoint=False)
+    x,y = model_xy(starts,PA,Z)
+    chi2 = np.sum((x-xs)**2,axis=1) + np.sum((y-ys)**2,axis=1)
+    start = starts[np.argmin(chi2)]
+
+    fit = least_squares(_residuals,start,args=(PA,Z,xs,ys))
+    return fit.x
+
+
+def _bootstrap_chunk(args):
+    '''
+    Worker for bootstrap(); refits "nboot" resampled versions of the data.
+    '''
+    PA,Z,xs,ys,theta,nboot,seed = args
+    rng = np.random.default_rng(seed)
+    out = np.zeros((nboot,len(theta)))
+    for i in range(nboot):
+        indx = rng.integers(0,len(PA),size=len(PA)) # resampling with replacement
+        out[i] = least_squares(_residuals,theta,args=(PA[indx],Z[indx],xs[indx],ys[indx])).x
+    return out
+
+
+def bootstrap(PA,Z,xs,ys,nboot=2000,workers=4,seed=None,theta=None):
+    '''
+    Bootstrap refits of the model, spread across a process pool.
+
+    INPUTS ---- PA,Z:       arrays, rotpposn & zenith angle in radians
+                xs,ys:      arrays, measured x & y shifts in pixels
+                nboot:      int, total number of refits
+                workers:    int, number of processes
+                seed:       int, seed for reproducible resampling
+                theta:      array, best fit to start each refit from
+
+    RETURNS --- samples:    (nboot,8) array, refit parameters
+    '''
+    if theta is None: theta = best_fit(PA,Z,xs,ys)
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = np.diff(np.linspace(0,nboot,workers+1).astype(int))
+    jobs = [(PA,Z,xs,ys,theta,n,s) for n,s in zip(sizes,seeds)]
+
+    with Pool(workers) as pool:
+        chunks = pool.map(_bootstrap_chunk,jobs)
+    return np.vstack(chunks)
+
+
+def log_prob(thetas,PA,Z,xs,ys,sigma):
+    '''
+    Gaussian log-likelihood with flat priors (amplitude kept positive),
+    evaluated for every parameter set in "thetas" at once.
+
+    INPUTS ---- thetas:     (N,8) array, parameter sets
+                sigma:      (float,float), scatter of the x & y measurements
+
+    RETURNS --- lp:         (N,) array, log-probability of each parameter set
+    '''
+    x,y = model_xy(thetas,PA,Z)
+    chi2 = np.sum(((x-xs)/sigma[0])**2,axis=1) + np.sum(((y-ys)/sigma[1])**2,axis=1)
+    lp = -0.5*chi2
+    lp[thetas[:,0] <= 0] = -np.inf
+    return lp
+
+
+def _sampler_chain(args):
+    '''
+    Worker for ensemble_sampler(); runs one independent set of walkers using the
+    stretch move (Goodman & Weare 2010), updating half of the walkers at a time.
+    '''
+    PA,Z,xs,ys,sigma,theta,nwalkers,nsteps,burn,seed = args
+    rng = np.random.default_rng(seed)
+    ndim, a = len(theta), 2. # a=2 is the usual stretch scale
+
+    walkers = theta + 1e-3*rng.standard_normal((nwalkers,ndim))
+    lp = log_prob(walkers,PA,Z,xs,ys,sigma)
+    chain = np.zeros((nsteps-burn,nwalkers,ndim))
+
+    half = nwalkers//2
+    halves = [(slice(0,half),slice(half,nwalkers)),(slice(half,nwalkers),slice(0,half))]
+    for step in range(nsteps):
+        for move,comp in halves:
+            S, C = walkers[move], walkers[comp] # views, so updates stick
+            z = ((a-1)*rng.random(len(S))+1)**2 / a
+            partners = C[rng.integers(0,len(C),size=len(S))]
+            proposal = partners + z[:,None]*(S-partners)
+
+            lp_prop = log_prob(proposal,PA,Z,xs,ys,sigma)
+            log_ratio = (ndim-1)*np.log(z) + lp_prop - lp[move]
+            accept = np.log(rng.random(len(S))) < log_ratio
+            S[accept] = proposal[accept]
+            lp[move][accept] = lp_prop[accept]
+        if step >= burn: chain[step-burn] = walkers
+    return chain.reshape(-1,ndim)
+
+
+def ensemble_sampler(PA,Z,xs,ys,nwalkers=64,nsteps=3000,burn=1000,workers=4,seed=None,theta=None):
+    '''
+    Samples the posterior of the model parameters with independent ensembles of walkers,
+    one per process.  The measurement scatter is set by the residuals of the best fit.
+
+    INPUTS ---- PA,Z:       arrays, rotpposn & zenith angle in radians
+                xs,ys:      arrays, measured x & y shifts in pixels
+                nwalkers:   int, walkers per process (even number)
+                nsteps:     int, steps per walker (including burn-in)
+                burn:       int, steps thrown out as burn-in
+                workers:    int, number of processes
+                seed:       int, seed for reproducible chains
+
+    RETURNS --- samples:    (workers*nwalkers*(nsteps-burn),8) array, posterior samples
+    '''
+    if theta is None: theta = best_fit(PA,Z,xs,ys)
+    x,y = model_xy(theta,PA,Z)
+    sigma = (np.std(x-xs),np.std(y-ys))
+
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    jobs = [(PA,Z,xs,ys,sigma,theta,nwalkers,nsteps,burn,s) for s in seeds]
+    with Pool(workers) as pool:
+        chains = pool.map(_sampler_chain,jobs)
+    return np.vstack(chains)
+
+
+def shift_bands(samples,PA,Z,percentiles=(16,50,84),chunk=2000):
+    '''
+    Predicted-shift bands from the posterior samples, evaluated in chunks of samples so
+    that the (samples x positions) arrays stay small.
+
+    INPUTS ---- samples:        (N,8) array, posterior samples
+                PA,Z:           arrays, rotpposn & zenith angle in radians
+                percentiles:    tuple, percentiles to return
+
+    RETURNS --- xband,yband:    (len(percentiles),M) arrays of predicted shifts
+    '''
+    PA, Z = np.broadcast_arrays(np.atleast_1d(PA),np.atleast_1d(Z))
+    x = np.zeros((len(samples),len(PA)))
+    y = np.zeros((len(samples),len(PA)))
+    for i in range(0,len(samples),chunk):
+        x[i:i+chunk], y[i:i+chunk] = model_xy(samples[i:i+chunk],PA,Z)
+    return np.percentile(x,percentiles,axis=0), np.percentile(y,percentiles,axis=0)
+
+
+def posterior_file(fcs,band,home='../plots-data/'):
+    return f'{home}data_FCS/flexure_posterior_FCS_{fcs}-{band}.dat'
+
+
+def summarize(samples):
+    '''
+    Returns a dataframe with the median & 68% interval for each parameter.
+    '''
+    lo, med, hi = np.percentile(samples,[16,50,84],axis=0)
+    return pd.DataFrame({'median':med,'minus':med-lo,'plus':hi-med},index=fit_names)
+
+
+
+if __name__ == '__main__':
+    # reading input information
+    parser = argparse.ArgumentParser(description="Posteriors for the FCS model parameters from the engineering data.",
+                usage='flexure_uncertainty.py ...')
+    parser.add_argument('-b','--band',help='Band data were taken in. (J/H)',required=True)
+    parser.add_argument('-o','--FCS',help='FCS on? (y/n)',required=True)
+    parser.add_argument('-m','--method',help='bootstrap or mcmc (default: bootstrap)',default='bootstrap')
+    parser.add_argument('-n','--number',help='Number of bootstrap refits or steps per walker.',type=int,default=2000)
+    parser.add_argument('-w','--workers',help='Number of processes.',type=int,default=4)
+    parser.add_argument('--seed',help='Seed for reproducible results.',type=int)
+    args = parser.parse_args()
+    assert args.FCS == 'y' or args.FCS == 'n', 'Need to specify y or n for "FCS on?".'
+
+    if args.FCS == 'y': FCS_on_off = 'On'
+    else: FCS_on_off = 'Off'
+
+    PA,Z,xs,ys = read_measurements(FCS_on_off,args.band)
+    theta = best_fit(PA,Z,xs,ys,band=args.band)
+    print('Best fit:',dict(zip(fit_names,np.round(theta,4))),end='\n\n')
+
+    if args.method == 'mcmc':
+        samples = ensemble_sampler(PA,Z,xs,ys,nsteps=args.number,burn=args.number//3,\
+                                   workers=args.workers,seed=args.seed,theta=theta)
+    else:
+        samples = bootstrap(PA,Z,xs,ys,nboot=args.number,workers=args.workers,\
+                            seed=args.seed,theta=theta)
+
+    print(summarize(samples),end='\n\n')
+    print('Writing posterior samples to file.')
+    pd.DataFrame(samples,columns=fit_names).to_csv(posterior_file(FCS_on_off,args.band),\
+                                                   sep='\t',index=False)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+
+import sys
+sys.path.append('..')
+import accuracy as acc # accuracy harness, in the main directory
+
+# runs the fast variants of each stage (& the stack cosmic-ray rejection & the sky
+# subtraction) on a short synthetic night & checks that the seeing, star drift, &
+# slit drift come back within their budgets
+def test_pipeline_within_budgets(tmp_path):
+	night = acc.default_night(nframes=6)
+	chosen = {'star':{v:acc.variants['star'][v] for v in ['gaussian','fast','stack','sky']},
+			  'slit':{'strips':acc.variants['slit']['strips']}}
+	report = acc.run(home=str(tmp_path)+'/',night=night,variants=chosen)
+	failed = report[~report.passed]
+	assert len(failed) == 0, "Measurements over budget:\n" + failed.to_string()
+
+
+# the harness should catch a measurement that's off
+def test_budget_catches_bias(tmp_path):
+	night = acc.default_night(nframes=4)
+	tight = dict(acc.budgets,seeing=(0.,0.,1.)) # no seeing measurement is perfect
+	report = acc.run(home=str(tmp_path)+'/',night=night,stages=['star'],
+					 variants={'star':{'gaussian':{}}},budgets=tight)
+	assert not report.set_index('measurement').loc['seeing','passed'], "A zero budget should fail."
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import numpy as np
+import sys
+sys.path.append('..')
+import collapse_profile as coll # star_pairs() & slit_bounds(), in the main directory
+import fake_night as fn
+
+# a star is a positive peak with a negative one "sep" rows away; a peak on its own (ex.
+# a slit edge that didn't cancel) isn't
+def test_star_pairs():
+	rng = np.random.default_rng(1)
+	diff = rng.normal(0,1,600)
+	diff[100], diff[128] = 80, -80   # star, sep 28
+	diff[300], diff[329] = 40, -40   # fainter star, 1 row off
+	diff[450] = 100                  # no counterpart
+	pairs = coll.star_pairs(diff,28)
+	assert [p[:2] for p in pairs] == [(100,128),(300,329)], "Got %s."%pairs
+	assert pairs[0][2] > pairs[1][2] > 10
+	assert [p[:2] for p in coll.star_pairs(diff,28,nmax=1)] == [(100,128)]
+	assert [p[:2] for p in coll.star_pairs(diff,0)][:2] == [(100,128),(300,329)] # any nearby
+
+
+# the slit's edges come from the bars on either side; there are none on a long slit
+def test_slit_bounds():
+	profile = np.full(400,100.)
+	for bar in [50,99,148]: profile[bar:bar+5] = 3.
+	assert coll.slit_bounds(profile,110,130) == (104,148)
+	assert coll.slit_bounds(profile,60,70) == (55,99)
+	assert coll.slit_bounds(np.full(400,100.),110,130) == (None,None)
+
+
+# auto_configure() finds the star's slit on an fpack'ed night & the settings track it
+def test_auto_configure(tmp_path):
+	night = fn.FakeNight()
+	night.nframes, night.shape, night.nslits, night.star_slits = 6, (512,2048), 10, (5,)
+	night.extension = '.fits.fz'
+	night.write(str(tmp_path)+'/')
+	drift_obj = night.drift_object(str(tmp_path)+'/')
+	drift_obj.row_start = drift_obj.row_end = drift_obj.col_start = drift_obj.col_end = None
+
+	info = drift_obj.auto_configure(nframes=2)
+	row_start, row_end, col_start, col_end = night.star_boxes()[0]
+	assert abs(info['row_start']-row_start) <= 2 and abs(info['row_end']-row_end) <= 2, "Got %s."%info
+	middle = (col_start+col_end)/2
+	assert info['col_start'] < middle < info['col_end'] and info['col_end']-info['col_start'] >= 200
+	assert (drift_obj.row_start,drift_obj.col_end) == (info['row_start'],info['col_end'])
+	assert abs(info['row_A']-info['row_B'] - 2*night.dither/fn.pixscale) <= 3
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import pytest
+import sys
+sys.path.append('..')
+import catalogue as cat # archive catalogue, in the main directory
+import fake_night as fn
+
+# with a catalogue, splitting the nods only opens the frames written since the last scan
+def test_split_dither_from_catalogue(tmp_path):
+	home, dbfile = str(tmp_path)+'/archive/', str(tmp_path)+'/catalogue.db'
+	night = fn.FakeNight()
+	night.nframes = 8
+	night.write(home,frames=range(4))
+	assert cat.build_catalogue(home,dbfile,workers=1) > 0
+
+	drift_obj = night.drift_object(home)
+	reads = []
+	header = drift_obj.header
+	drift_obj.header = lambda filename: reads.append(filename) or header(filename)
+	drift_obj.catalogue = dbfile
+	nod_A, nod_B = drift_obj.split_dither()
+	assert (len(nod_A),len(nod_B)) == (2,2) and len(reads) == 0, "No headers should be read."
+
+	night.write(home,frames=range(4,8))
+	nod_A, nod_B = drift_obj.split_dither()
+	assert (len(nod_A),len(nod_B)) == (4,4), "Frames written since the scan should be found."
+	assert sorted(reads) == sorted(nod_A[2:]+nod_B[2:]), "Only the new frames' headers should be read."
+
+
+# column filters go in as parameters, & unknown columns are refused
+def test_query_filters(tmp_path):
+	home, dbfile = str(tmp_path)+'/archive/', str(tmp_path)+'/catalogue.db'
+	night = fn.FakeNight()
+	night.nframes = 4
+	night.write(home)
+	cat.build_catalogue(home,dbfile,workers=1)
+	frames = cat.query(night=night.date,object=night.mask,gratmode='spectroscopy',dbfile=dbfile)
+	assert len(frames) == 4
+	assert len(cat.query(object="x' or '1'='1",dbfile=dbfile)) == 0
+	with pytest.raises(KeyError): cat.query(**{'object = 1 or 1':1},dbfile=dbfile)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import numpy as np
+import sys
+sys.path.append('..')
+import cosmics as cr # cosmic-ray rejection, in the main directory
+
+# cut-outs of a star whose spectrum runs along the rows, drifting & broadening from frame
+# to frame, on a sky with a few skylines, plus noise
+def star_stack(nframes=6,rows=30,cols=200,drift=0.4,seed=3):
+	rng = np.random.default_rng(seed)
+	r = np.arange(rows)[None,:,None]
+	t = np.arange(nframes)[:,None,None]
+	center, sigma = 14 + drift*t, 2 + 0.15*t
+	star = 400*np.exp(-0.5*((r-center)/sigma)**2) * np.ones((1,1,cols))
+	sky = 50 + 300*np.isin(np.arange(cols),[40,41,150])[None,None]
+	truth = star + sky
+	return truth + rng.normal(0,5,truth.shape), truth
+
+
+# injected single & two-pixel hits are flagged & replaced, & the moving star isn't
+def test_hits_flagged_and_replaced():
+	stack, truth = star_stack()
+	injected = [(1,10,60),(3,20,120),(3,20,121),(5,14,90)] # the last one on the star's peak
+	for n,r,c in injected: stack[n,r,c] += 800
+	cleaned, hits = cr.clean_stack(stack)
+	for n,r,c in injected:
+		assert hits[n,r,c], "Hit at %s not flagged."%((n,r,c),)
+		assert abs(cleaned[n,r,c] - truth[n,r,c]) < 30, "Hit at %s not replaced by the model."%((n,r,c),)
+	near = np.zeros_like(hits)
+	for n,r,c in injected: near[n,max(r-1,0):r+2,max(c-1,0):c+2] = True
+	stray = hits & ~near
+	assert stray.sum() <= 3, "%i pixels flagged away from the hits."%stray.sum()
+	assert np.all((stack - truth)[stray] > 10), "Pixels flagged that aren't noise spikes."
+
+
+# a star that drifts & broadens a lot from frame to frame isn't a cosmic ray
+def test_moving_star_not_flagged():
+	stack, truth = star_stack(drift=1.5)
+	cleaned, hits = cr.clean_stack(stack)
+	# (the odd 4-sigma noise spike aside)
+	assert hits.sum() <= 3, "%i pixels flagged."%hits.sum()
+	assert np.all((stack - truth)[hits] > 10), "Pixels of the star flagged."
+	assert np.array_equal(cleaned[~hits],stack[~hits])
+
+
+# with fewer than min_frames frames, the model is a running median along the rows
+def test_few_frames_fallback():
+	stack, truth = star_stack(nframes=2)
+	stack[0,8,30] += 800
+	stack[1,20,100:102] += 800
+	cleaned, hits = cr.clean_stack(stack,min_frames=3)
+	assert hits[0,8,30] and hits[1,20,100] and hits[1,20,101]
+	assert abs(cleaned[0,8,30] - truth[0,8,30]) < 30
+	model = cr.stack_model(stack,min_frames=3)
+	neighbours = np.sort(np.r_[stack[0,12,48:50],stack[0,12,51:53]]) # (leaving the pixel out)
+	assert neighbours[1] <= model[0,12,50] <= neighbours[2], "Model isn't the running median of the row."
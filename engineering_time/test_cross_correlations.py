@@ -3,6 +3,10 @@
 import image_registration as ir # github.com/keflavich/image_registration
 import astropy.io.fits as fits
 import numpy as np
+from scipy.ndimage import shift
+import sys
+sys.path.append('..')
+import xcorr as xc # masked cross-correlation, in the main directory
 d0 = fits.getdata('test.fits')
 
 # this test just makes sure that the cross_correlation_shifts is working
@@ -39,4 +43,45 @@ fake3[38:41,35:38] = 3      # shifted star
 
 def test_star_NaNs():
     corr = ir.cross_correlation_shifts(fake2,fake3)
-    assert round(corr[0]) == -5 and round(corr[1]) == -2, "Running cross-correlation on fake data with same rows of NaNs and shifted star should have an effect. NaNs should not have an impact."
\ No newline at end of file
+    assert round(corr[0]) == -5 and round(corr[1]) == -2, "Running cross-correlation on fake data with same rows of NaNs and shifted star should have an effect. NaNs should not have an impact."
+
+
+# NEXT TESTS
+# same tests for the masked cross-correlation in xcorr.py
+def test_masked_same_frame():
+    corr = xc.masked_cross_correlation_shifts(d0,d0)
+    assert round(corr[0],1) == 0.0 and round(corr[1],1) == 0.0, "Running the masked cross-correlation on the same object should return an xshift and yshift that are essentially zero."
+
+def test_masked_NaNs_not_counted():
+    corr = xc.masked_cross_correlation_shifts(fake,fake1)
+    assert round(corr[0],1) == 0.0 and round(corr[1],1) == 0.0, "NaN rows should get zero weight in the masked cross-correlation."
+
+def test_masked_star_NaNs():
+    corr = xc.masked_cross_correlation_shifts(fake2,fake3)
+    assert round(corr[0]) == -5 and round(corr[1]) == -2, "The masked cross-correlation should follow the same sign convention as image_registration."
+
+def test_masked_row_weights():
+    # the masked-out rows given as weights instead of NaNs
+    rows = np.ones(50,dtype=bool)
+    rows[10:14] = False
+    corr = xc.masked_cross_correlation_shifts(np.nan_to_num(fake2),np.nan_to_num(fake3),ref_weight=rows,img_weight=rows)
+    assert round(corr[0]) == -5 and round(corr[1]) == -2, "1D weights should mask out whole rows."
+
+def test_masked_subpixel():
+    # test.fits shifted by a fraction of a pixel, with a row of NaNs in each
+    d1 = shift(d0.astype(float),(1.3,-0.7),order=3)
+    d2 = d0.astype(float)
+    d1[50:60] = np.nan
+    d2[120:125] = np.nan
+    corr = xc.masked_cross_correlation_shifts(d2,d1,maxoff=10)
+    assert abs(corr[0]+0.7) < 0.1 and abs(corr[1]-1.3) < 0.1, "The masked cross-correlation should recover sub-pixel shifts."
+
+def test_masked_strips():
+    # correlating strips of rows is the same as the full frames with only those rows weighted
+    d1 = shift(d0.astype(float),(0.6,-1.4),order=3)
+    rows = np.asarray([[20],[110]]) + np.arange(40)
+    weights = np.zeros(len(d0),dtype=bool)
+    weights[rows.ravel()] = True
+    strips = xc.masked_ncc(d0[rows],d1[rows],maxoff=10)[0]
+    full = xc.masked_ncc(d0,d1,ref_weight=weights,img_weight=weights,maxoff=10)[0]
+    assert np.allclose(strips,full), "Strips should give the same correlation as the full frames weighted to the same rows."
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import sys
+sys.path.append('..')
+import cube # frame cubes, in the main directory
+import fake_night as fn
+import rawfits as rf
+
+# cubes made early in the night should pick up the frames written after them
+def test_cubes_extended_with_new_frames(tmp_path):
+	home, scratch = str(tmp_path)+'/data/', str(tmp_path)+'/cubes/'
+	night = fn.FakeNight()
+	night.nframes = 6
+	night.write(home,frames=range(4))
+	night.drift_object(home).attach_cubes(scratch=scratch)
+
+	night.write(home,frames=[4,5])
+	drift_obj = night.drift_object(home)
+	cubes = drift_obj.attach_cubes(scratch=scratch)
+	assert [len(cubes[nod][1]) for nod in 'AB'] == [3,3], "The new frames should be added to the cubes."
+	last = sorted(drift_obj.cube_meta)[-1]
+	assert np.array_equal(drift_obj.read_frame(last),rf.getdata(home+night.date+'/'+last).astype(np.float32))
+
+
+# a frame that changed remakes the cubes, & the same night in another archive gets its own
+def test_cubes_checked_against_files(tmp_path):
+	scratch = str(tmp_path)+'/cubes/'
+	night = fn.FakeNight()
+	night.nframes = 4
+	for home in ['one/','two/']: night.write(str(tmp_path)+'/'+home)
+	for home in ['one/','two/']: night.drift_object(str(tmp_path)+'/'+home).attach_cubes(scratch=scratch)
+	assert len([f for f in os.listdir(scratch) if f.endswith('.npy')]) == 4, "Each archive should have its own cubes."
+
+	home = str(tmp_path)+'/one/'
+	drift_obj = night.drift_object(home)
+	first = sorted(drift_obj.split_dither()[0])[0]
+	night.seeing = 2.
+	night.write(home,frames=[0])
+	drift_obj.attach_cubes(scratch=scratch)
+	assert np.array_equal(drift_obj.read_frame(first),rf.getdata(home+night.date+'/'+first).astype(np.float32)), \
+		"A changed frame should be read again."
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import numpy as np
+import sys
+sys.path.append('..')
+import dar # DAR predictor, in the main directory
+import fake_night as fn
+from mask_drift import get_star_drift
+
+# a night setting from 75 to 35 degrees with the slit close to the parallactic angle, & the
+# star moving along the slit by exactly the predicted DAR (first frame minus each frame)
+def dar_night(sign=1):
+	night = fn.FakeNight()
+	night.nframes, night.el, night.az, night.pa = 12, (75.,35.), 150., 120.
+	el = fn.per_frame(night.el,night.times())
+	predicted = dar.dar_along_slit(el,night.pa,dar.parallactic_angle(night.az,el),night.band)
+	night.star_drift = -sign * predicted / fn.pixscale
+	return night
+
+
+def test_dar_correction_flattens_offsets(tmp_path):
+	night = dar_night()
+	night.write(str(tmp_path)+'/')
+	drift_obj = night.drift_object(str(tmp_path)+'/')
+	frames, offset = get_star_drift(drift_obj)
+	residual, dars = dar.correct_star_drift(drift_obj,offset)
+	for off,res in zip(offset,residual):
+		assert np.ptp(off) > 0.2, "The fake night should have a large DAR signal."
+		assert np.max(np.abs(res)) < 0.02, "Corrected offsets should be flat, got %s."%res
+
+
+# with the orientation flipped, fitting the sign should still remove the DAR
+def test_dar_sign_fit(tmp_path):
+	night = dar_night(sign=-1)
+	night.write(str(tmp_path)+'/')
+	drift_obj = night.drift_object(str(tmp_path)+'/')
+	frames, offset = get_star_drift(drift_obj)
+	nod_A, nod_B = drift_obj.split_dither()
+	sign, scale = dar.fit_slit_sign(list(offset),[dar.predict_frames(drift_obj,f) for f in [nod_A,nod_B]])
+	assert sign == -1 and abs(scale-1) < 0.05, "Fitted sign %i & scale %.3f."%(sign,scale)
+	residual, dars = dar.correct_star_drift(drift_obj,offset,fit_sign=True)
+	for res in residual:
+		assert np.max(np.abs(res)) < 0.02, "Corrected offsets should be flat, got %s."%res
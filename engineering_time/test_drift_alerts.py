@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import numpy as np
+import sys
+sys.path.append('..')
+import drift_alerts as da # online drift alerts, in the main directory
+
+# ABAB frames 2 minutes apart (UTC string, as in the headers)
+def frames(n):
+	for i in range(n):
+		minutes = 10*60 + 2*i
+		yield i+1, 'AB'[i%2], '%02i:%02i:00.0'%(minutes//60,minutes%60), 2*i/60
+
+# nod A is flat & nod B drifts at 2"/hour: the stable A frames shouldn't reset the
+# drift alert of nod B, so it's raised once, not on every B frame
+def test_drift_alert_raised_once_per_nod():
+	alerts = []
+	monitor = da.DriftMonitor(offset_limit=10,alert=alerts.append)
+	for frame,nod,utc,hours in frames(30):
+		offset = 0. if nod == 'A' else 2.*hours
+		monitor.update({'frame':frame, 'nod':nod, 'utc':utc, 'star_offset':offset})
+	rates = [a for a in alerts if a['kind'] == 'drift rate']
+	assert len(rates) == 1 and rates[0]['nod'] == 'B', "One drift alert for nod B was expected, got %s."%rates
+
+
+# a nod that stops drifting & starts again should be alerted again
+def test_drift_alert_raised_again_after_stable():
+	alerts = []
+	monitor = da.DriftMonitor(window=4,offset_limit=10,alert=alerts.append)
+	for frame,nod,utc,hours in frames(60):
+		drifting = frame <= 20 or frame > 40
+		offset = 2.*hours if drifting else 2.*20*2/60
+		if frame > 40: offset += 2.*(hours - 40*2/60)
+		monitor.update({'frame':frame, 'nod':'A', 'utc':utc, 'star_offset':offset})
+	rates = [a for a in alerts if a['kind'] == 'drift rate']
+	assert len(rates) == 2, "Drift should be alerted when it starts & again when it restarts, got %s."%rates
+
+
+# missing measurements come back as None from the exported series (see gui_export.py)
+def test_drift_alert_missing_values():
+	monitor = da.DriftMonitor(offset_limit=10,alert=lambda alert: None)
+	for frame,nod,utc,hours in frames(6):
+		status = monitor.update({'frame':frame, 'nod':nod, 'utc':utc, 'star_offset':None, 'slit_yshift':None})
+	assert status['classification'] == 'stable' and np.isnan(status['star_rate']), "Missing values should be skipped, got %s."%status
+
+
+# watching a night from its first frame: a nod without frames is skipped, & a poll only
+# reads the headers of new files & fits the new frames
+def test_monitor_night_from_first_frame(tmp_path):
+	import fake_night as fn
+	home = str(tmp_path)+'/'
+	night = fn.FakeNight()
+	night.nframes = 6
+	night.write(home,frames=[0])
+	drift_obj = night.drift_object(home)
+	monitor = da.DriftMonitor(alert=lambda alert: None)
+	monitor, statuses = da.monitor_night(drift_obj,monitor,slit=False)
+	assert [status['nod'] for status in statuses] == ['A']
+
+	night.write(home,frames=range(1,6))
+	reads, fits = [], []
+	header, fit_model = drift_obj.header, drift_obj.fit_model
+	drift_obj.header = lambda filename: reads.append(filename) or header(filename)
+	drift_obj.fit_model = lambda filename,**kwargs: fits.append(filename) or fit_model(filename,**kwargs)
+	monitor, statuses = da.monitor_night(drift_obj,monitor,slit=False)
+	assert [status['nod'] for status in statuses] == ['B','A','B','A','B']
+	assert len(fits) == 5 and len(set(reads)) == 5, "Only the new frames should be read & fit."
+	monitor, statuses = da.monitor_night(drift_obj,monitor,slit=False)
+	assert len(statuses) == 0
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import numpy as np
+import flexure_uncertainty as fu # FCS model posteriors, in this directory
+
+# synthetic engineering data: the current J-band model (plus zeropoints) at a spread of
+# rotator angles & zenith angles, with 0.05 pixels of noise on each shift
+def synthetic(n=80,noise=0.05,seed=2):
+	rng = np.random.default_rng(seed)
+	truth = np.append(fu.model_params('J'),[0.5,-0.3])
+	PA, Z = rng.uniform(0,2*np.pi,n), np.radians(rng.uniform(5,65,n))
+	x, y = fu.model_xy(truth,PA,Z)
+	return truth, PA, Z, x+rng.normal(0,noise,n), y+rng.normal(0,noise,n)
+
+
+def wrapped(samples,truth):
+	# the phase (& beta) are angles, so compared modulo 2 pi
+	samples = np.array(samples,dtype=float,ndmin=2)
+	for i in [fu.fit_names.index('ph'),fu.fit_names.index('beta')]:
+		samples[:,i] = truth[i] + (samples[:,i]-truth[i]+np.pi) % (2*np.pi) - np.pi
+	return samples
+
+
+def test_best_fit_recovers_model():
+	truth, PA, Z, xs, ys = synthetic()
+	theta = wrapped(fu.best_fit(PA,Z,xs,ys,band='J'),truth)[0]
+	assert np.allclose(theta,truth,atol=0.1), "Best fit %s, truth %s."%(theta,truth)
+
+
+# the bootstrap & the sampler both put the known parameters inside their posteriors,
+# with about the same widths, & the same seed gives the same samples
+def test_posteriors_recover_model():
+	truth, PA, Z, xs, ys = synthetic()
+	theta = fu.best_fit(PA,Z,xs,ys,band='J')
+	boot = fu.bootstrap(PA,Z,xs,ys,nboot=60,workers=2,seed=5,theta=theta)
+	assert boot.shape == (60,len(fu.fit_names))
+	assert np.array_equal(boot,fu.bootstrap(PA,Z,xs,ys,nboot=60,workers=2,seed=5,theta=theta))
+	mcmc = fu.ensemble_sampler(PA,Z,xs,ys,nwalkers=32,nsteps=400,burn=200,workers=2,seed=5,theta=theta)
+	assert mcmc.shape == (2*32*200,len(fu.fit_names))
+
+	widths = []
+	for samples in [boot,mcmc]:
+		summary = fu.summarize(wrapped(samples,truth))
+		width = (summary.minus + summary.plus) / 2
+		pull = np.abs(summary['median'] - truth) / width
+		assert np.all(pull < 4), "Truth outside the posterior:\n%s"%summary.assign(truth=truth)
+		widths.append(width.values)
+	ratio = widths[1]/widths[0]
+	assert np.all((ratio > 0.33) & (ratio < 3)), "Bootstrap & sampler widths disagree: %s."%ratio
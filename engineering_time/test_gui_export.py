@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pandas as pd
+import os
+import sys
+sys.path.append('..')
+import gui_export as gui # export layer for the GUI, in the main directory
+
+def frames(first,last):
+	return pd.DataFrame([{'frame':n, 'nod':'AB'[n%2], 'utc':'08:%02i:00'%n, 'seeing':0.6+0.01*n,
+						  'airmass':1.2, 'star_offset':np.nan if n == 3 else 0.02*n,
+						  'slit_yshift':0.1, 'el':60.} for n in range(first,last+1)])
+
+
+# appending adds only the frames past the last one written, read_since() picks up
+# only the bytes past its offset, & the viewer isn't rewritten
+def test_append_and_read_since(tmp_path):
+	home = str(tmp_path)+'/'
+	path = gui.export_table(frames(1,3),'2018nov25','mask',home=home)
+	with open(path+'viewer.html') as f: viewer = f.read()
+
+	table, offset = gui.read_since('2018nov25','mask',home=home)
+	assert list(table.frame) == [1,2,3]
+	assert offset == os.path.getsize(path+'series.jsonl')
+	assert table.star_offset.isna().tolist() == [False,False,True] # NaN as null
+
+	assert gui.append_frames(frames(2,5),'2018nov25','mask',home=home) == 2
+	assert gui.append_frames(frames(4,5),'2018nov25','mask',home=home) == 0
+	meta = gui.read_meta('2018nov25','mask',home=home)
+	assert meta['n_frames'] == 5 and meta['last_frame'] == 5
+	with open(path+'viewer.html') as f: assert f.read() == viewer, "Viewer rewritten on append."
+
+	table, offset = gui.read_since('2018nov25','mask',offset=offset,home=home)
+	assert list(table.frame) == [4,5]
+	assert np.allclose(table.seeing,[0.64,0.65])
+
+	# a line still being written is left for the next call
+	partial = '[6,"A","08:06'
+	with open(path+'series.jsonl','a') as f: f.write(partial)
+	table, again = gui.read_since('2018nov25','mask',offset=offset,home=home)
+	assert len(table) == 0 and again == offset == os.path.getsize(path+'series.jsonl') - len(partial)
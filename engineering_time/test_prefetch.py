@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import numpy as np
+import threading
+import time
+import pytest
+import sys
+sys.path.append('..')
+import prefetch as pf # prefetching reader, in the main directory
+
+# a reader of 1000-byte "frames" that keeps count of the reads it has started
+class Reader:
+	def __init__(self,delays=None,fail=None):
+		self.started, self.lock = 0, threading.Lock()
+		self.delays, self.fail = delays or {}, fail
+
+	def __call__(self,key):
+		with self.lock: self.started += 1
+		time.sleep(self.delays.get(key,0))
+		if key == self.fail: raise IOError(f'cannot read {key}')
+		return np.full(125,key,dtype=float)
+
+
+# frames come out in the order they went in, even when later ones are read first
+def test_prefetch_order():
+	reader = Reader(delays={0:0.05,1:0.03,2:0.01})
+	out = list(pf.Prefetcher(range(8),reader,depth=4,workers=4))
+	assert [key for key,data in out] == list(range(8))
+	assert all(data[0] == key for key,data in out)
+
+
+# never more than "depth" frames, or "max_bytes" worth of them, are read ahead
+@pytest.mark.parametrize('depth,max_bytes,ahead',[(2,10**6,2),(10,2500,2),(10,500,1)])
+def test_prefetch_bounded(depth,max_bytes,ahead):
+	reader = Reader()
+	most = 0
+	for i,(key,data) in enumerate(pf.Prefetcher(range(10),reader,depth=depth,max_bytes=max_bytes,workers=4)):
+		time.sleep(0.01) # time for the reads ahead to start
+		most = max(most,reader.started-(i+1))
+	assert most == ahead, "%i frames read ahead (expected %i)."%(most,ahead)
+
+
+# a failed read is raised where its frame would have come out
+def test_prefetch_exception():
+	got = []
+	with pytest.raises(IOError,match='cannot read 3'):
+		for key,data in pf.Prefetcher(range(6),Reader(fail=3),depth=2):
+			got.append(key)
+	assert got == [0,1,2]
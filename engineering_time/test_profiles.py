@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.optimize import curve_fit
+import sys
+sys.path.append('..')
+import profiles as pr # profile models & batched fitter, in the main directory
+
+# noisy Gaussian profiles like the star's, with a range of centres, heights, & widths
+def noisy_gaussians(k=300,n=40,seed=1):
+	rng = np.random.default_rng(seed)
+	x = np.arange(n,dtype=float)
+	true = np.stack([rng.uniform(15,25,k),rng.uniform(100,1000,k),rng.uniform(1.5,5,k),rng.uniform(0,20,k)],axis=1)
+	model, jac = pr.gaussian(np.broadcast_to(x,(k,n)),true)
+	return model + rng.normal(0,5,(k,n))
+
+
+# batch_fit() should find the same Gaussians as the curve_fit() version it replaced
+# (same starting point & bounds); measured differences are ~1e-5 px at most
+def test_batch_fit_matches_curve_fit():
+	profiles = noisy_gaussians()
+	params, ok = pr.batch_fit(profiles,'gaussian')
+	assert ok.all(), "Every fit should converge."
+
+	gauss = lambda x,mean,A,sig,B: A*np.exp(-0.5*((x-mean)/sig)**2) + B
+	x = np.arange(profiles.shape[1],dtype=float)
+	for p,y in zip(params,profiles):
+		peak = np.argmax(y)
+		popt = curve_fit(gauss,x,y,p0=[x[peak],y[peak],4.,0.],bounds=(0,[np.inf,np.inf,30,np.inf]))[0]
+		assert abs(p[0]-popt[0]) < 1e-4, "Centres differ: %s vs %s."%(p,popt)
+		assert abs(p[2]-popt[2]) < 1e-4, "Widths differ: %s vs %s."%(p,popt)
+
+
+# the analytic derivatives of every model should match finite differences
+def test_model_derivatives():
+	x = np.broadcast_to(np.arange(40,dtype=float),(3,40))
+	params = {'gaussian':[[20.3,500,3.1,10],[12.,80,1.7,0],[25.5,1000,4.4,30]],
+			  'moffat':[[20.3,500,3.1,2.5,10],[12.,80,1.7,1.5,0],[25.5,1000,4.4,4.,30]],
+			  'gaussian_halo':[[20.3,500,3.1,50,3.,10],[12.,80,1.7,10,2.,0],[25.5,1000,4.4,100,5.,30]]}
+	for name,p in params.items():
+		p = np.array(p,dtype=float)
+		model, jac = pr.models[name].function(x,p)
+		for i in range(p.shape[1]):
+			h = 1e-6 * np.maximum(np.abs(p[:,i]),1)
+			up, down = p.copy(), p.copy()
+			up[:,i] += h
+			down[:,i] -= h
+			numeric = (pr.models[name].function(x,up)[0] - pr.models[name].function(x,down)[0]) / (2*h[:,None])
+			scale = np.max(np.abs(numeric)) + 1e-12
+			assert np.max(np.abs(jac[...,i] - numeric)) < 1e-5*scale, "%s: derivative by %s is off."%(name,pr.models[name].params[i])
+
+
+# faint Moffat-shaped profiles fit with a core + halo shouldn't shrink the core to nothing
+def test_halo_fit_on_moffat_profiles():
+	rng = np.random.default_rng(0)
+	k, n = 300, 40
+	true = np.stack([rng.uniform(15,25,k),rng.uniform(10,50,k),rng.uniform(1,4,k),rng.uniform(1,4,k),rng.uniform(0,20,k)],axis=1)
+	profiles = pr.moffat(np.broadcast_to(np.arange(n,dtype=float),(k,n)),true)[0] + rng.normal(0,10,(k,n))
+	y, w = pr.pad_profiles(profiles)
+	with np.errstate(all='ignore'): p0 = pr.halo_guess(y,w) # (the Gaussian fit it starts from can try sig = 0)
+	with np.errstate(divide='raise',invalid='raise'): params, ok = pr.batch_fit(profiles,'gaussian_halo',p0=p0)
+	assert np.all(np.isfinite(params)), "Some fits came back NaN."
+	assert np.all(params[:,2] >= pr.models['gaussian_halo'].lower[2]), "The core width went below its bound."
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import numpy as np
+import sys
+sys.path.append('..')
+import rawfits as rf # reading compressed raw frames, in the main directory
+import fake_night as fn
+
+# a short night on a quarter of the detector, written with the given extension
+def small_night(extension):
+	night = fn.FakeNight()
+	night.nframes, night.shape, night.nslits, night.star_slits = 4, (512,2048), 10, (5,)
+	night.extension = extension
+	return night
+
+
+def write_nights(tmp_path):
+	paths = {}
+	for ext in rf.extensions:
+		home = str(tmp_path)+'/%s/'%ext.strip('.').replace('.','_')
+		small_night(ext).write(home)
+		paths[ext] = home
+	return paths
+
+
+# the same frames read back from .fits, .fits.fz, & .fits.gz files agree (fpack quantizes
+# floats, so to a fraction of the noise there), whole or a few rows & boxes at a time
+def test_compressed_round_trip(tmp_path):
+	paths = write_nights(tmp_path)
+	night = small_night('.fits')
+	stem = rf.frame_stem(night.filename(night.first_frame+night.n_align))
+	plain = rf.getdata(paths['.fits']+night.date+'/'+stem+'.fits')
+	starts, boxes = np.array([0,100,497]), [(10,40,5,300),(200,260,1500,2048)]
+
+	for ext in rf.compressed:
+		path = paths[ext]+night.date+'/'
+		filename = rf.find_file(path,stem)
+		assert filename == stem+ext and rf.is_compressed(filename)
+		assert rf.frame_number(filename) == night.first_frame+night.n_align
+
+		data, header = rf.getdata(path+filename,header=True)
+		assert header['OBJECT'] == night.mask and rf.getheader(path+filename)['YOFFSET'] == night.dither
+		noise = np.sqrt(np.maximum(plain,0) + night.read_noise**2)
+		tol = 0 if ext == '.fits.gz' else 0.2*noise
+		assert data.shape == plain.shape and np.all(np.abs(data-plain) <= tol)
+
+		strips = rf.read_rows(path+filename,starts,15)
+		assert strips.shape == (3,15,2048)
+		for strip,s in zip(strips,starts): assert np.array_equal(strip,data[s:s+15])
+		for cut,(r0,r1,c0,c1) in zip(rf.read_boxes(path+filename,boxes),boxes):
+			assert np.array_equal(cut,data[r0:r1,c0:c1])
+
+
+# a Drift() object finds & splits the frames of a compressed night by their headers
+def test_drift_on_compressed_night(tmp_path):
+	night = small_night('.fits.fz')
+	night.write(str(tmp_path)+'/')
+	drift_obj = night.drift_object(str(tmp_path)+'/')
+	nod_A, nod_B = drift_obj.split_dither()
+	assert len(nod_A) == len(nod_B) == night.nframes//2
+	assert all(f.endswith('.fits.fz') for f in nod_A+nod_B)
+	cut = drift_obj.cut_out(nod_A[0])
+	assert cut.shape == (drift_obj.row_end-drift_obj.row_start,drift_obj.col_end-drift_obj.col_start)
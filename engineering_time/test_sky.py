@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import sys
+sys.path.append('..')
+import sky # rolling sky model, in the main directory
+import fake_night as fn
+
+def sky_night(tmp_path,nframes=16):
+	home = str(tmp_path)+'/'
+	night = fn.FakeNight()
+	night.nframes = nframes
+	night.write(home)
+	drift_obj = night.drift_object(home)
+	drift_obj.sky_frames = 4
+	return drift_obj
+
+
+# counts the cut-outs read through a Drift() object
+def counted(drift_obj):
+	reads = []
+	cut_out = drift_obj.cut_out
+	drift_obj.cut_out = lambda filename,*args,**kwargs: reads.append(filename) or cut_out(filename,*args,**kwargs)
+	return reads
+
+
+# fitting one nod & then the other reads the night once, & nothing is left behind
+def test_sky_both_nods_one_pass(tmp_path):
+	drift_obj = sky_night(tmp_path)
+	nod_A, nod_B = drift_obj.split_dither()
+	expected = dict(sky.rolling_sky(drift_obj,nod_A+nod_B,4,nods=(nod_A,nod_B)))
+	reads = counted(drift_obj)
+
+	got = dict(drift_obj.sky_subtracted(nod_A))
+	rolling = drift_obj.sky_state[1]
+	assert rolling.spilled <= set(nod_B) and len(rolling.spilled) > 0, "Nod B should be spilled, not kept."
+	got.update(drift_obj.sky_subtracted(nod_B))
+	assert sorted(reads) == sorted(nod_A+nod_B), "Every frame should be read once."
+	assert len(rolling.spilled) == 0 and os.listdir(rolling.spill) == [], "Spilled cut-outs should be deleted."
+	for f in expected: assert np.allclose(got[f],expected[f])
+
+
+# asking for the frames one at a time carries on from the last frame read
+def test_sky_one_frame_at_a_time(tmp_path):
+	drift_obj = sky_night(tmp_path,nframes=8)
+	nod_A, nod_B = drift_obj.split_dither()
+	expected = dict(sky.rolling_sky(drift_obj,nod_A+nod_B,4,nods=(nod_A,nod_B)))
+	reads = counted(drift_obj)
+	for f in sorted(nod_A+nod_B):
+		(filename,cutout), = list(drift_obj.sky_subtracted([f]))
+		assert np.allclose(cutout,expected[f])
+	assert len(reads) == 8 and len(drift_obj.sky_state[1].spilled) == 0
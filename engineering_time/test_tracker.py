@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+import numpy as np
+import sys
+sys.path.append('..')
+import tracker as tr # incremental tracker, in the main directory
+import fake_night as fn
+
+# counts the headers read through a Drift() object
+def counted(drift_obj):
+	reads = []
+	header = drift_obj.header
+	drift_obj.header = lambda filename: reads.append(filename) or header(filename)
+	return reads
+
+
+# a poll only reads the headers of new files, & the saved state doesn't grow with the night
+def test_tracker_polls_new_files_only(tmp_path):
+	home = str(tmp_path)+'/'
+	night = fn.FakeNight()
+	night.nframes = 8
+	night.write(home,frames=range(4))
+	drift_obj = night.drift_object(home)
+	reads = counted(drift_obj)
+
+	tracker, rows = tr.track_night(drift_obj,tr.StarTracker(),savefile=False)
+	assert len(rows) == 4
+	del reads[:]
+	tracker, rows = tr.track_night(drift_obj,tracker,savefile=False)
+	assert len(rows) == 0 and len(reads) == 0, "A poll with no new files shouldn't read any headers."
+
+	# a file that's still being written is tried again on the next poll
+	next_file = night.filename(night.first_frame+night.n_align+4)
+	open(home+night.date+'/'+next_file,'w').close()
+	tracker, rows = tr.track_night(drift_obj,tracker,savefile=False)
+	assert len(rows) == 0 and next_file in tracker.frames.waiting
+
+	night.write(home,frames=range(4,8))
+	tracker, rows = tr.track_night(drift_obj,tracker,savefile=False)
+	assert [row['frame'] for row in rows] == list(night.truth()['frame'][4:]), "The new frames should be tracked in order."
+	state = tracker.snapshot()
+	assert state['waiting'] == {} and state['listed'] == rows[-1]['frame']
@@ -0,0 +1,343 @@
+'''
+Synthetic MOSFIRE nights, for testing & load-testing the pipeline without the raw data.
+
+FakeNight() writes a night of raw frames the way Drift() expects to find them
+("home/2021apr23/m210423_0001.fits", ...) with the headers it reads (OBJECT, GRATMODE,
+YOFFSET, FILTER, UTC, AIRMASS, ROTPPOSN, EL, AZ), and keeps a table of what was put in
+(see truth()) so the recovered seeing & drift can be checked against it.  Each frame has
+
+    --  a mask of slits (rows, with bars between them) whose spectra cover different
+        columns, moving with the (programmable) flexure of the slits
+    --  sky continuum & skylines in every slit
+    --  one or more stars, nodding by 2*dither between ABAB frames, with programmable
+        seeing, drift along the slit, & transparency
+    --  cosmic rays, Poisson-like noise, & read noise
+
+Like Drift(), it's configured through its attributes.  Anything that changes during the
+night (seeing, star_drift, slit_xshift, el, ...) can be given as a number, a (start,end)
+tuple for a linear ramp over the night, an array with one value per frame, or a function
+of the hours since the first frame:
+
+    night = FakeNight()
+    night.nframes = 200
+    night.seeing = (0.5,0.9)                            # " FWHM, getting worse
+    night.star_drift = lambda t: 0.3*np.sin(2*t)        # pixels along the slit
+    night.write('fake-data/')
+    test = night.drift_object('fake-data/')
+
+The structure of the mask is built from outer products & the noise is drawn from a bank
+of random numbers made once, so writing a frame is mostly the time to save it -- fast
+enough for thousands of frames.
+'''
+
+import numpy as np
+import astropy.io.fits as fits
+import pandas as pd
+from datetime import datetime as dt, timedelta
+from tracker import pixscale
+import os
+
+truth_columns = ['frame','nod','utc','airmass','el','pa','seeing','transparency',\
+                 'star_row','star_offset','slit_xshift','slit_yshift']
+
+
+def per_frame(value,t):
+    '''
+    Value of a setting for each frame: a number, a (start,end) tuple for a linear ramp,
+    an array (one per frame), or a function of the time (hours since the first frame).
+    '''
+    if callable(value): return np.broadcast_to(np.asarray(value(t),dtype=float),t.shape).copy()
+    if isinstance(value,tuple) and len(value) == 2:
+        return np.linspace(value[0],value[1],len(t))
+    return np.broadcast_to(np.asarray(value,dtype=float),t.shape).copy()
+
+
+def edges(coords,start,end,softness=0.7):
+    '''
+    Smooth-edged top hats (1 between start & end), one column per (start,end).
+    '''
+    coords = np.asarray(coords,dtype=np.float32)[:,None]
+    # difference of two logistic steps, written with tanh so it can't overflow
+    return (0.5*(np.tanh((coords-start)/(2*softness)) - np.tanh((coords-end)/(2*softness)))).astype(np.float32)
+
+
+class FakeNight(object):
+    '''
+    A synthetic night of MOSFIRE frames of one mask (see the top of this module).
+    '''
+    date = '2021apr23'      # night, as in Drift().date
+    mask = 'FAKEMASK'       # OBJECT
+    band = 'H'              # FILTER
+    dither = 1.25           # YOFFSET of nod A (") -- nod B is -dither
+    nframes = 40            # science frames (ABAB)
+    n_align = 1             # alignment frames (GRATMODE imaging) before the science frames
+    first_frame = 1         # number of the first frame of the night
+    start_utc = '06:00:00.00'
+    cadence = 180.          # seconds from one frame to the next
+    seed = 42               # random numbers (same seed, same night)
+    extension = '.fits'     # or '.fits.fz' / '.fits.gz' (see rawfits.py)
+    shape = (2048,2048)     # detector (rows, columns)
+
+    # -- the mask
+    nslits = 40             # slits, from the bottom of the detector up
+    slit_height = 44        # rows
+    bar_height = 5          # rows between slits
+    slit_bottom = 20        # first row of the first slit
+    spectrum_length = 1750  # columns covered by each slit's spectrum
+    spectrum_spread = 300   # spectra start up to this many columns left/right of centre
+
+    # -- sky
+    sky_level = 80.         # continuum (counts per pixel)
+    nlines = 80             # skylines
+    line_counts = (200,3000)    # range of the peak counts of the skylines
+    line_width = 1.5        # pixels (sigma)
+
+    # -- stars (one entry per star)
+    star_slits = (21,)      # slit holding each star
+    star_counts = (400.,)   # peak counts of each star's spectrum (in the middle)
+    spectrum_width = 700.   # columns (sigma) of the stars' spectra
+
+    # -- changes over the night (see per_frame())
+    seeing = 0.6            # " FWHM
+    transparency = 1.       # fraction of the star's counts that get through
+    star_drift = 0.         # pixels along the slit (positive up the detector)
+    slit_xshift = 0.        # flexure of the slits (pixels, columns)
+    slit_yshift = 0.        # flexure of the slits (pixels, rows)
+    el = (70.,55.)          # elevation (degrees)
+    az = 180.               # azimuth (degrees)
+    pa = 0.                 # ROTPPOSN (degrees)
+
+    # -- detector
+    cosmics = 300           # cosmic rays per frame
+    cosmic_counts = (500,5000)
+    read_noise = 5.         # counts
+    exact_noise = False     # True: draw true Poisson noise for every frame (slower)
+    noise_bank = 2          # frames' worth of random numbers reused for the noise
+
+    def __init__(self):
+        self._layout = None
+
+    # -- layout of the mask (the same for the whole night)
+    def layout(self):
+        '''
+        Rows of each slit & columns of each slit's spectrum, the skylines, & the bank
+        of random numbers for the noise.
+        '''
+        if self._layout is not None: return self._layout
+        rng = np.random.default_rng(self.seed)
+        ny, nx = self.shape
+        bottoms = self.slit_bottom + np.arange(self.nslits)*(self.slit_height+self.bar_height)
+        if bottoms[-1]+self.slit_height >= ny: raise Exception('Too many slits for the detector.')
+        centres = (nx - self.spectrum_length)/2 + rng.uniform(-1,1,self.nslits)*self.spectrum_spread
+        lines = np.sort(rng.uniform(0,nx,self.nlines))
+        line_counts = rng.uniform(*self.line_counts,self.nlines)
+        bank = rng.standard_normal(self.noise_bank*ny*nx + ny*nx,dtype=np.float32)
+        self._layout = {'bottoms':bottoms, 'starts':centres, 'lines':lines,
+                        'line_counts':line_counts, 'bank':bank}
+        return self._layout
+
+    def times(self):
+        # hours since the first science frame
+        return np.arange(self.nframes) * self.cadence / 3600
+
+    def truth(self):
+        '''
+        What goes into each science frame.
+
+        RETURNS --- truth:  pandas DataFrame with "truth_columns"; star_row is the centre
+                            of the first star on the detector, star_offset its offset (")
+                            from the first frame of the same nod (same convention as
+                            get_star_drift()), & the slit shifts are in pixels
+        '''
+        t = self.times()
+        nod = np.where(np.arange(self.nframes) % 2 == 0,'A','B')
+        el = per_frame(self.el,t)
+        start = dt.strptime(self.start_utc,'%H:%M:%S.%f')
+        utc = [(start + timedelta(hours=h)).strftime('%H:%M:%S.%f')[:-4] for h in t]
+
+        bottoms = self.layout()['bottoms']
+        middle = bottoms[self.star_slits[0]] + self.slit_height/2
+        yshift = per_frame(self.slit_yshift,t)
+        star_row = middle + np.where(nod == 'A',1,-1)*self.dither/pixscale + yshift + per_frame(self.star_drift,t)
+        offset = np.zeros(self.nframes)
+        for n in ['A','B']:
+            rows = star_row[nod == n]
+            if len(rows) > 0: offset[nod == n] = (rows[0] - rows) * pixscale
+
+        return pd.DataFrame({'frame':self.first_frame + self.n_align + np.arange(self.nframes),
+                             'nod':nod, 'utc':utc, 'airmass':1/np.sin(np.radians(el)), 'el':el,
+                             'pa':per_frame(self.pa,t), 'seeing':per_frame(self.seeing,t),
+                             'transparency':per_frame(self.transparency,t), 'star_row':star_row,
+                             'star_offset':offset, 'slit_xshift':per_frame(self.slit_xshift,t),
+                             'slit_yshift':yshift})
+
+    def frame(self,row,rng,imaging=False):
+        '''
+        Image for one row of truth().
+
+        INPUTS ---- row:        a row of truth() (ex. from .itertuples())
+                    rng:        numpy Generator, for the noise & cosmic rays
+                    imaging:    bool, an alignment frame (sky & stars, no slits)
+
+        RETURNS --- image:      2D float32 array
+        '''
+        lay = self.layout()
+        ny, nx = self.shape
+        y, x = np.arange(ny,dtype=np.float32), np.arange(nx,dtype=np.float32)
+        dx, dy = row.slit_xshift, row.slit_yshift
+
+        # -- slits (rows) & the columns their spectra cover
+        rows = edges(y,lay['bottoms']+dy,lay['bottoms']+dy+self.slit_height)        # ny x K
+        cols = edges(x,lay['starts']+dx,lay['starts']+dx+self.spectrum_length).T    # K x nx
+        if imaging == True: mask = np.ones((ny,nx),dtype=np.float32)
+        else: mask = rows @ cols
+
+        # -- sky continuum & skylines (moving with the slits)
+        sky = np.full(nx,self.sky_level,dtype=np.float32)
+        profiles = np.exp(-0.5*((x[None]-lay['lines'][:,None]-dx)/self.line_width)**2)
+        sky += (lay['line_counts'] @ profiles).astype(np.float32)
+        image = mask * sky[None]
+
+        # -- stars, nodded & drifting along their slits
+        sig = row.seeing/pixscale/2.35
+        for slit,counts in zip(self.star_slits,self.star_counts):
+            centre = row.star_row + lay['bottoms'][slit] - lay['bottoms'][self.star_slits[0]]
+            near = slice(max(int(centre-10*sig),0),min(int(centre+10*sig)+2,ny)) # rows with any light
+            profile = counts * row.transparency * np.exp(-0.5*((y[near]-centre)/sig)**2)
+            middle = lay['starts'][slit] + self.spectrum_length/2 + dx
+            spectrum = np.exp(-0.5*((x-middle)/self.spectrum_width)**2).astype(np.float32)
+            if imaging == True: image[near] += np.outer(profile,spectrum)
+            else: image[near] += np.outer(profile*rows[near,slit],spectrum*cols[slit])
+
+        # -- noise
+        if self.exact_noise == True:
+            image = rng.poisson(np.clip(image,0,None)).astype(np.float32)
+            image += self.read_noise * rng.standard_normal((ny,nx),dtype=np.float32)
+        else:
+            start = rng.integers(0,len(lay['bank'])-ny*nx)
+            noise = lay['bank'][start:start+ny*nx].reshape(ny,nx) # a view, no new random numbers
+            scale = np.maximum(image,0)
+            scale += self.read_noise**2
+            np.sqrt(scale,out=scale)
+            scale *= noise
+            image += scale
+
+        # -- cosmic rays (some hitting two pixels)
+        hits = rng.integers(0,[ny,nx],(self.cosmics,2))
+        counts = rng.uniform(*self.cosmic_counts,self.cosmics).astype(np.float32)
+        image[hits[:,0],hits[:,1]] += counts
+        two = rng.random(self.cosmics) < 0.3
+        image[np.minimum(hits[two,0]+1,ny-1),hits[two,1]] += counts[two]/2
+        return image
+
+    def header(self,row,imaging=False):
+        h = fits.Header()
+        h['OBJECT'] = self.mask
+        h['GRATMODE'] = 'imaging' if imaging == True else 'spectroscopy'
+        h['YOFFSET'] = self.dither if row.nod == 'A' else -self.dither
+        h['FILTER'] = self.band
+        h['UTC'] = row.utc
+        h['AIRMASS'] = round(float(row.airmass),4)
+        h['EL'] = round(float(row.el),4)
+        h['AZ'] = float(per_frame(self.az,np.zeros(1))[0])
+        h['ROTPPOSN'] = float(row.pa)
+        return h
+
+    def filename(self,number):
+        return 'm%s_%04d%s'%(dt.strptime(self.date,'%Y%b%d').strftime('%y%m%d'),number,self.extension)
+
+    def write_frame(self,path,number,image,header):
+        if self.extension == '.fits.fz':
+            hdul = fits.HDUList([fits.PrimaryHDU(),fits.CompImageHDU(image,header)])
+            hdul.writeto(path+self.filename(number),overwrite=True)
+        else: fits.writeto(path+self.filename(number),image,header,overwrite=True)
+
+    def write(self,home='fake-data/',frames=None,savetruth=True):
+        '''
+        Writes the night to home/date/ (alignment frames first, then the science
+        frames) along with the truth table.
+
+        INPUTS ---- home:       str, directory above the nights (as Drift().home)
+                    frames:     slice or list, only write these science frames (ex. to
+                                split a long night between processes); the alignment
+                                frames are written with the first one
+                    savetruth:  bool, write truth() to home/date/truth_<mask>.txt
+
+        RETURNS --- truth:      pandas DataFrame, see truth()
+        '''
+        path = home+'%s/'%self.date
+        os.makedirs(path,exist_ok=True)
+        truth = self.truth()
+        todo = np.arange(self.nframes)
+        if frames is not None: todo = todo[frames]
+
+        if len(todo) > 0 and todo[0] == 0:
+            for i in range(self.n_align):
+                rng = np.random.default_rng([self.seed,1,i])
+                row = next(truth.iloc[:1].itertuples())
+                self.write_frame(path,self.first_frame+i,self.frame(row,rng,imaging=True),self.header(row,imaging=True))
+        for i in todo:
+            row = next(truth.iloc[i:i+1].itertuples())
+            rng = np.random.default_rng([self.seed,0,i]) # the same frame whichever process writes it
+            self.write_frame(path,row.frame,self.frame(row,rng),self.header(row))
+
+        if savetruth == True: truth.to_csv(truth_file(home,self.date,self.mask),sep='\t',index=False)
+        return truth
+
+    def star_boxes(self,trim=2):
+        '''
+        (row_start, row_end, col_start, col_end) of each star, as found by autoconfig.py,
+        at the start of the night.
+        '''
+        lay = self.layout()
+        boxes = []
+        for slit in self.star_slits:
+            bottom, start = lay['bottoms'][slit], lay['starts'][slit]
+            middle = start + self.spectrum_length/2
+            width = min(self.spectrum_width,self.spectrum_length/2)
+            boxes.append((int(bottom+trim),int(bottom+self.slit_height-trim),
+                          int(middle-width),int(middle+width)))
+        return boxes
+
+    def drift_object(self,home='fake-data/'):
+        '''
+        A Drift() object set up for this night & the first star.
+        '''
+        from drift import Drift
+        drift_obj = Drift()
+        drift_obj.home, drift_obj.date, drift_obj.mask = home, self.date, self.mask
+        drift_obj.dither, drift_obj.band = self.dither, self.band
+        boxes = self.star_boxes()
+        drift_obj.row_start, drift_obj.row_end, drift_obj.col_start, drift_obj.col_end = boxes[0]
+        if len(boxes) > 1: drift_obj.stars = boxes
+        return drift_obj
+
+
+def truth_file(home,date,mask):
+    return home+f'{date}/truth_{mask}.txt'
+
+
+def read_truth(home,date,mask):
+    return pd.read_csv(truth_file(home,date,mask),sep='\t')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Writing a synthetic night of MOSFIRE frames.",
+                usage='fake_night.py [-o HOME] [-n NFRAMES] [-d DATE] [-m MASK] [-s SEEING] [-x EXT]')
+    parser.add_argument('-o','--home',help='Directory the night is written to. (default: fake-data/)',default='fake-data/')
+    parser.add_argument('-n','--nframes',help='Number of science frames. (default: 40)',type=int,default=40)
+    parser.add_argument('-d','--date',help='Night, ex. 2021apr23',default=FakeNight.date)
+    parser.add_argument('-m','--mask',help='Mask name (OBJECT).',default=FakeNight.mask)
+    parser.add_argument('-s','--seeing',help='Seeing at the start & end of the night, ex. 0.5,0.9',default='0.6')
+    parser.add_argument('-x','--extension',help='.fits, .fits.fz, or .fits.gz',default='.fits')
+    parser.add_argument('-r','--seed',help='Random seed.',type=int,default=FakeNight.seed)
+    args = parser.parse_args()
+
+    night = FakeNight()
+    night.nframes, night.date, night.mask = args.nframes, args.date, args.mask
+    night.extension, night.seed = args.extension, args.seed
+    seeing = [float(s) for s in args.seeing.split(',')]
+    night.seeing = seeing[0] if len(seeing) == 1 else tuple(seeing[:2])
+    night.write(args.home)
+    print('Wrote %s frames to %s%s/'%(night.nframes+night.n_align,args.home,night.date))
@@ -5,42 +5,50 @@ This code is just used to make the custom colorbars for the seeing and drift map
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
+from functools import lru_cache
 
-def elevation_cmap(cen,dmin,dmax,size):
+# every colormap is built from this many color samples, no matter how many
+# points are being plotted (it used to be 10x the number of frames)
+cmap_resolution = 1000
+
+def elevation_cmap(cen,dmin,dmax,size=None):
 	'''
 	Returns the colormap that we want for the elevation colorbars.
+	Each (cen,dmin,dmax) colormap is only built once, see _build_cmap().
+	"size" is no longer needed, but is kept so older calls still work.
 	'''
-	# coming up with a range that helps us figure out where the color is
-	t = np.linspace(dmin,dmax,size)
-	s = np.linspace(0,1,size)
-	n = size*10
+	return _build_cmap('elevation',float(cen),float(dmin),float(dmax))
 
-	x = cen/(dmax-dmin) # helps in centering the zeropoint
-	#print('x: %s, Min: %s, Max: %s\n'%(x,dmin,dmax))
 
-	lower = plt.cm.Reds(np.linspace(0.6,0,int(n*round(x-0.01*x,2))))
-	upper = plt.cm.Blues(np.linspace(0,1,int(n*round(1-(x+0.01*x),2))))
-	colors = np.vstack((lower, upper))
-	tmap = matplotlib.colors.LinearSegmentedColormap.from_list('elevation', colors)
-	return tmap
+def airmass_cmap(cen,dmin,dmax,size=None):
+	'''
+	Returns the colormap that we want for the airmass colorbar.
+	Each (cen,dmin,dmax) colormap is only built once, see _build_cmap().
+	"size" is no longer needed, but is kept so older calls still work.
+	'''
+	return _build_cmap('airmass',float(cen),float(dmin),float(dmax))
 
 
-def airmass_cmap(cen,dmin,dmax,size):
+@lru_cache(maxsize=None)
+def _build_cmap(name,cen,dmin,dmax):
 	'''
-	Returns the colormap that we want for the airmass colorbar.
+	Builds & memoizes the custom colormaps.  The same colormap object is handed
+	back for repeat calls, so copy it first if you need to change it.
 	'''
-	# coming up with a range that helps us figure out where the color is
-	t = np.linspace(dmin,dmax,size)
-	s = np.linspace(0,1,size)
-	n = size*10
+	n = cmap_resolution
 
-	x = cen/(dmax-dmin)-0.6 # helps in centering the zeropoint
+	if name == 'elevation':
+		x = cen/(dmax-dmin) # helps in centering the zeropoint
+		lower = plt.cm.Reds(np.linspace(0.6,0,int(n*round(x-0.01*x,2))))
+		upper = plt.cm.Blues(np.linspace(0,1,int(n*round(1-(x+0.01*x),2))))
+	else:
+		x = cen/(dmax-dmin)-0.6 # helps in centering the zeropoint
+		upper = plt.cm.Reds(np.linspace(0,0.6,int(n*round(x-0.01*x,2))))
+		lower = plt.cm.Blues(np.linspace(1,0,int(n*round(1-(x+0.01*x),2))))
 	#print('x: %s, Min: %s, Max: %s\n'%(x,dmin,dmax))
 
-	upper = plt.cm.Reds(np.linspace(0,0.6,int(n*round(x-0.01*x,2))))
-	lower = plt.cm.Blues(np.linspace(1,0,int(n*round(1-(x+0.01*x),2))))
 	colors = np.vstack((lower, upper))
-	tmap = matplotlib.colors.LinearSegmentedColormap.from_list('airmass', colors)
+	tmap = matplotlib.colors.LinearSegmentedColormap.from_list(name, colors)
 	return tmap
 
 
@@ -62,5 +70,7 @@ class FixPointNormalize(matplotlib.colors.Normalize):
 	    matplotlib.colors.Normalize.__init__(self, vmin, vmax, clip)
 
 	def __call__(self, value, clip=None):
+	    self.autoscale_None(value)
 	    x, y = [self.vmin, self.fixme, self.vmax], [0, self.fixhere, 1]
-	    return np.ma.masked_array(np.interp(value, x, y)) 
+	    return np.ma.masked_array(np.interp(value, x, y), mask=np.ma.getmask(value))
+
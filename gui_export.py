@@ -0,0 +1,262 @@
+'''
+Export layer for the MOSFIRE GUI.
+
+seeing_map() only saves a matplotlib PDF, which is slow to make & has to be remade
+from scratch for every new frame.  This module instead writes, for each date & mask:
+
+    meta.json       small description of the mask & the columns (rewritten on append)
+    series.jsonl    one compact JSON array per frame -- new frames are appended
+    viewer.html     lightweight viewer (no outside libraries), written once; it reads
+                    series.jsonl itself, so the directory has to be served over http
+                    (ex. python -m http.server) rather than opened from disk
+
+The GUI (or the viewer) only has to read the bytes past the last offset it saw to pick
+up the new frames, see read_since().  The rows come from the result tables made by
+render_maps.night_table(), or from anything with the same columns.
+'''
+
+import numpy as np
+import pandas as pd
+import json
+import os
+
+# columns written for every frame, and how many decimals to keep
+series_columns = ['frame','nod','utc','seeing','airmass','star_offset','slit_yshift','el']
+decimals = {'seeing':3, 'airmass':3, 'star_offset':3, 'slit_yshift':3, 'el':2}
+
+
+def export_dir(date,mask,home='plots-data/'):
+    return f'{home}gui/{date}_{mask}/'
+
+
+def _compact(row):
+    '''
+    Turns one frame into a short list in the order of "series_columns".
+    NaNs & missing values become null so the file stays valid JSON.
+    '''
+    out = []
+    for col in series_columns:
+        val = row.get(col,None)
+        if col == 'frame': val = int(val)
+        elif col in decimals:
+            if val is None or np.isnan(val): val = None
+            else: val = round(float(val),decimals[col])
+        elif val is None or (isinstance(val,float) and np.isnan(val)): val = None
+        else: val = str(val)
+        out.append(val)
+    return out
+
+
+def _write_meta(path,date,mask,n_frames,last_frame):
+    meta = {'date':date, 'mask':mask, 'columns':series_columns,
+            'units':{'seeing':'arcsec','star_offset':'arcsec','slit_yshift':'pixels','el':'deg'},
+            'n_frames':n_frames, 'last_frame':last_frame}
+    with open(path+'meta.json.tmp','w') as f: json.dump(meta,f,separators=(',',':'))
+    os.replace(path+'meta.json.tmp',path+'meta.json') # so a poll never sees half a file
+    return meta
+
+
+def read_meta(date,mask,home='plots-data/'):
+    with open(export_dir(date,mask,home)+'meta.json') as f: return json.load(f)
+
+
+def export_table(table,date,mask,home='plots-data/',viewer=True):
+    '''
+    Writes the full time series for a mask, replacing anything already there.
+
+    INPUTS ---- table:  pandas DataFrame, one row per frame (see render_maps.night_table())
+                date:   str, date of the observations, ex. 2018nov25
+                mask:   str, mask name
+                home:   str, path to the plots-data/ folder
+                viewer: bool, also write viewer.html
+
+    RETURNS --- path:   str, directory the files were written to
+    '''
+    path = export_dir(date,mask,home)
+    os.makedirs(path,exist_ok=True)
+    table = table.sort_values(by=['frame'])
+
+    rows = [_compact(row) for row in table.to_dict('records')]
+    with open(path+'series.jsonl','w') as f:
+        for row in rows: f.write(json.dumps(row,separators=(',',':'))+'\n')
+
+    last = rows[-1][0] if len(rows) > 0 else -1
+    _write_meta(path,date,mask,len(rows),last)
+    if viewer == True: write_viewer(date,mask,home)
+    return path
+
+
+def append_frames(new,date,mask,home='plots-data/',viewer=True):
+    '''
+    Appends new frames to an exported time series.  Only frames past the last
+    frame already written are added, so the same rows can be sent twice safely.
+    Only series.jsonl & meta.json change; the viewer picks up the new lines itself.
+
+    INPUTS ---- new:    pandas DataFrame or list of dicts, new frames
+                date:   str, date of the observations, ex. 2018nov25
+                mask:   str, mask name
+                viewer: bool, write viewer.html if this starts the series
+
+    RETURNS --- added:  int, number of frames appended
+    '''
+    path = export_dir(date,mask,home)
+    if not os.path.exists(path+'meta.json'): # first frames of the night
+        new = pd.DataFrame(new)
+        export_table(new,date,mask,home,viewer=viewer)
+        return len(new)
+
+    meta = read_meta(date,mask,home)
+    if isinstance(new,pd.DataFrame): new = new.to_dict('records')
+    rows = [_compact(row) for row in sorted(new,key=lambda r: r['frame'])]
+    rows = [row for row in rows if row[0] > meta['last_frame']]
+    if len(rows) == 0: return 0
+
+    with open(path+'series.jsonl','a') as f:
+        f.write(''.join(json.dumps(row,separators=(',',':'))+'\n' for row in rows))
+    _write_meta(path,date,mask,meta['n_frames']+len(rows),rows[-1][0])
+    return len(rows)
+
+
+def read_since(date,mask,offset=0,home='plots-data/'):
+    '''
+    Reads only the frames written after a given byte offset, which is how a
+    GUI polling for new frames should read the series.
+
+    INPUTS ---- offset: int, byte offset returned by the last call (0 reads everything)
+
+    RETURNS --- table:  pandas DataFrame, the new frames
+                offset: int, byte offset to use for the next call
+    '''
+    with open(export_dir(date,mask,home)+'series.jsonl','rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b'\n') + 1 # ignoring a line that is still being written
+    lines = chunk[:end].decode().splitlines()
+    table = pd.DataFrame([json.loads(l) for l in lines],columns=series_columns)
+    return table, offset+end
+
+
+def write_viewer(date,mask,home='plots-data/'):
+    '''
+    Writes viewer.html next to the series.  Nothing in it changes as frames come in:
+    the page reads series.jsonl when it loads & then polls it for new frames (with a
+    byte range, so only the new ones), so it has to be served over http.
+    '''
+    path = export_dir(date,mask,home)
+    columns = {'columns':series_columns}
+
+    html = viewer_template.replace('__META__',json.dumps(columns,separators=(',',':')))
+    html = html.replace('__TITLE__',f'{mask} ({date})')
+    with open(path+'viewer.html','w') as f: f.write(html)
+    return path+'viewer.html'
+
+
+viewer_template = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>MOSFIRE seeing & drift: __TITLE__</title>
+<style>
+body {font-family: serif; margin: 1em;}
+canvas {display: block; margin-bottom: 1em;}
+#status {color: #555; font-size: 0.9em;}
+</style></head>
+<body>
+<h3>__TITLE__</h3>
+<div id="status"></div>
+<canvas id="seeing" width="960" height="320"></canvas>
+<canvas id="star" width="960" height="320"></canvas>
+<script>
+const meta = __META__;
+let rows = [];
+let offset = 0;
+const col = {}; meta.columns.forEach((c,i) => col[c] = i);
+
+function seconds(utc) {
+  if (utc === null) return NaN; // missing UTC, not plotted
+  const p = utc.split(':');
+  return 3600*(+p[0]) + 60*(+p[1]) + (+p[2]);
+}
+function times() { // unwrapping past midnight UTC
+  const first = rows.find(r => r[col.utc] !== null);
+  const t0 = first ? seconds(first[col.utc]) : 0;
+  return rows.map(r => { let t = seconds(r[col.utc]); return t < t0-43200 ? t+86400 : t; });
+}
+function color(v, lo, hi, flip) { // blue to red, like the PDF maps
+  let f = Math.min(1, Math.max(0, (v-lo)/(hi-lo)));
+  if (flip) f = 1-f;
+  return 'rgb(' + Math.round(40+200*f) + ',' + Math.round(80*(1-Math.abs(2*f-1))+40) + ',' + Math.round(240-200*f) + ')';
+}
+function hhmm(t) {
+  t = t % 86400;
+  return String(Math.floor(t/3600)).padStart(2,'0') + ':' + String(Math.floor(t%3600/60)).padStart(2,'0');
+}
+
+function plot(id, ycol, ccol, ylabel, clo, chi, flip) {
+  const cv = document.getElementById(id), g = cv.getContext('2d');
+  const W = cv.width, H = cv.height, L = 70, R = 20, T = 15, B = 45;
+  g.clearRect(0,0,W,H);
+  if (rows.length == 0) return;
+  const t = times(), y = rows.map((r,i) => isNaN(t[i]) ? null : r[col[ycol]]);
+  const good = y.filter(v => v !== null);
+  if (good.length == 0) return;
+  const tt = t.filter(v => !isNaN(v));
+  let x0 = Math.min(...tt)-120, x1 = Math.max(...tt)+120;
+  let y0 = Math.min(...good), y1 = Math.max(...good), pad = 0.1*(y1-y0) || 0.1;
+  y0 -= pad; y1 += pad;
+  const px = v => L + (v-x0)/(x1-x0)*(W-L-R), py = v => H-B - (v-y0)/(y1-y0)*(H-T-B);
+
+  g.strokeStyle = '#000'; g.strokeRect(L, T, W-L-R, H-T-B);
+  g.fillStyle = '#000'; g.font = '13px serif'; g.textAlign = 'center';
+  for (let i = 0; i <= 6; i++) {
+    const v = x0 + i*(x1-x0)/6;
+    g.fillText(hhmm(v), px(v), H-B+18);
+  }
+  g.fillText('UTC', L+(W-L-R)/2, H-8);
+  g.textAlign = 'right';
+  for (let i = 0; i <= 4; i++) {
+    const v = y0 + i*(y1-y0)/4;
+    g.fillText(v.toFixed(2), L-6, py(v)+4);
+  }
+  g.save(); g.translate(16, T+(H-T-B)/2); g.rotate(-Math.PI/2); g.textAlign = 'center';
+  g.fillText(ylabel, 0, 0); g.restore();
+
+  rows.forEach((r,i) => {
+    if (y[i] === null) return;
+    const cx = px(t[i]), cy = py(y[i]);
+    g.fillStyle = r[col[ccol]] === null ? '#999' : color(r[col[ccol]], clo, chi, flip);
+    g.beginPath();
+    if (r[col.nod] == 'A') g.arc(cx, cy, 5, 0, 2*Math.PI);
+    else { g.moveTo(cx, cy-6); g.lineTo(cx+6, cy+5); g.lineTo(cx-6, cy+5); g.closePath(); }
+    g.fill(); g.stroke();
+  });
+}
+
+function draw() {
+  plot('seeing', 'seeing', 'airmass', 'seeing ["]', 1, 2.5, false);
+  plot('star', 'star_offset', 'el', 'star drift y0 - y ["]', 20, 90, true);
+  const last = rows.length ? rows[rows.length-1] : null;
+  document.getElementById('status').textContent = rows.length + ' frames' +
+    (last ? ', last frame ' + last[col.frame] + (last[col.utc] !== null ? ' at ' + last[col.utc] + ' UTC' : '') : '');
+}
+
+async function poll() {
+  try {
+    const r = await fetch('series.jsonl', {headers: {Range: 'bytes=' + offset + '-'}, cache: 'no-store'});
+    if (r.status == 206 || r.status == 200) {
+      let txt = await r.text();
+      if (r.status == 200) txt = txt.slice(offset); // server ignored the range
+      const end = txt.lastIndexOf('\\n') + 1;
+      if (end > 0) {
+        txt.slice(0, end).trim().split('\\n').forEach(l => rows.push(JSON.parse(l)));
+        offset += end;
+      }
+      draw();
+    }
+  } catch (e) {}
+}
+
+draw();
+if (location.protocol.startsWith('http')) { poll(); setInterval(poll, 10000); }
+else document.getElementById('status').textContent =
+  'series.jsonl can only be read over http: serve this directory (ex. python -m http.server) & open the page from there';
+</script>
+</body></html>
+'''
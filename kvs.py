@@ -0,0 +1,349 @@
+'''
+One command line for the production runs.
+
+measure.py & masking_out_skylines.py are run by editing which rows of keck_masks.dat (or
+which frame) they use, and the other scripts each parse their own options.  This script
+puts every stage behind a subcommand:
+
+    index       catalogue the raw frames of an archive (catalogue.py)
+    seeing      seeing of every frame (seeing_map.get_seeing())
+    star-drift  star's offsets from the first frame of each nod (mask_drift.get_star_drift())
+    slit-drift  slits' shifts from the first frame of each nod (mask_drift.get_slit_drift())
+    flux        star's flux with the skylines masked (masking_out_skylines.star_flux())
+    flexure-fit posteriors of the FCS model parameters (engineering_time/flexure_uncertainty.py)
+    render      drift & seeing maps from the result tables (render_maps.py)
+    watch       drift alerts as the frames of a night come in (drift_alerts.py)
+
+with the same options for all of them -- which nights (rows of keck_masks.dat, or one night
+given on the command line), the number of processes, the scratch directories, & where the
+results are written.  The nights are independent, so they're spread across the processes,
+and a scheduler can run one night per job with "-n", ex.
+
+    python kvs.py seeing -n 0,3,4 -w 3
+    python kvs.py slit-drift --home /data/ --date 2021apr25 --mask MASK3 --dither 1.25 --band H
+    python kvs.py render -n 4 --measure -o /scratch/plots-data/
+    python kvs.py watch -n 5 --interval 60
+'''
+
+from drift import *
+from multiprocessing import Pool
+import ast
+import time
+
+default_masks = 'KVS-data/keck_masks.dat'
+
+
+def read_nights(masks=default_masks,nights=None):
+    '''
+    Rows of the table of nights & masks (as in measure.py).
+
+    INPUTS ---- masks:  str, table of nights & masks
+                nights: list, rows to use (default: all)
+
+    RETURNS --- specs:  list of dicts, one per night (path, date, mask, dither, band,
+                        star_slit, star_cols)
+    '''
+    df = pd.read_csv(masks,delimiter='|',
+        converters={'star_slit': lambda x: x.split(','), 'star_cols': lambda x: x.split(',')})
+    if nights is None: nights = df.index.values
+    return [df.loc[indx].to_dict() for indx in nights]
+
+
+def parse_settings(settings):
+    '''
+    Drift() attributes from "key=value" strings (values read as Python literals if
+    they can be, otherwise kept as strings), ex. ["profile_model=fast", "sky_frames=4"].
+    '''
+    parsed = {}
+    for setting in settings or []:
+        key, value = setting.split('=',1)
+        try: parsed[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError,SyntaxError): parsed[key.strip()] = value.strip()
+    return parsed
+
+
+def night_drift(spec,settings=None,cache=None,catalogue=None,cubes=True):
+    '''
+    Creates the Drift() object for a night (as in measure.py).
+
+    INPUTS ---- spec:       dict, one night from read_nights()
+                settings:   dict, Drift() attributes to set (see parse_settings())
+                cache:      str, scratch directory for the sky buffers & frame cubes
+                catalogue:  str, SQLite catalogue of the archive (see catalogue.py)
+                cubes:      bool, read the frames through cubes in the cache (see cube.py)
+
+    RETURNS --- drift_obj:  a Drift() object with defined variables
+    '''
+    drift_obj = Drift()
+    drift_obj.home = spec['path']
+    drift_obj.date = spec['date']
+    drift_obj.mask = spec['mask']
+    drift_obj.dither = float(spec['dither'])
+    drift_obj.band = spec['band']
+    if catalogue is not None: drift_obj.catalogue = catalogue
+    for key,value in (settings or {}).items(): setattr(drift_obj,key,value)
+
+    if cache is not None:
+        drift_obj.sky_scratch = f'{cache}sky/'
+        if cubes == True: drift_obj.attach_cubes(scratch=f'{cache}cubes/')
+
+    if spec['star_slit'][0].strip() == '': # mask not annotated yet, finding the star
+        drift_obj.auto_configure()
+    else:
+        drift_obj.row_start, drift_obj.row_end = [int(i) for i in spec['star_slit'][:2]]
+        drift_obj.col_start, drift_obj.col_end = [int(i) for i in spec['star_cols'][:2]]
+    return drift_obj
+
+
+def result_file(kind,date,mask,home='plots-data/'):
+    if kind == 'seeing': return f'{home}seeing/seeing_map_{date}_{mask}.txt' # as in measure.py
+    return f'{home}{kind}/{kind}_{date}_{mask}.txt'
+
+
+def save_table(table,filename):
+    os.makedirs(os.path.dirname(filename),exist_ok=True)
+    table.sort_values(by=['frame'],inplace=True)
+    table.reset_index(inplace=True,drop=True)
+    table.to_csv(filename,sep='\t',index=False)
+    return filename
+
+
+# -- stages run on one night at a time -- #
+# each takes the Drift() object & the parsed options, and returns the files written
+
+def seeing_stage(drift_obj,args):
+    from seeing_map import get_seeing
+    frame, utc, seeing, airmass = get_seeing(drift_obj,method=args.method)
+    table = pd.concat([pd.DataFrame({'frame':frame[i], 'utc':utc[i], 'seeing':seeing[i],
+                                     'airmass':airmass[i], 'nod':nod}) for i,nod in enumerate('AB')])
+    return [save_table(table,result_file('seeing',drift_obj.date,drift_obj.mask,args.output))]
+
+
+def star_drift_stage(drift_obj,args):
+    from mask_drift import get_star_drift
+    frame, offset = get_star_drift(drift_obj)
+    table = pd.concat([pd.DataFrame({'frame':frame[i], 'offset':offset[i], 'nod':nod})
+                       for i,nod in enumerate('AB')])
+    return [save_table(table,result_file('star_drift',drift_obj.date,drift_obj.mask,args.output))]
+
+
+def slit_drift_stage(drift_obj,args):
+    from mask_drift import get_slit_drift
+    get_slit_drift(drift_obj,savefile=True,home=args.output)
+    return [f'{args.output}slit_drift/slit_drift_{drift_obj.date}_{drift_obj.mask}_nod{nod}.txt'
+            for nod in 'AB']
+
+
+def flux_stage(drift_obj,args):
+    from masking_out_skylines import star_flux
+    drift_obj.col_start, drift_obj.col_end = 0, 2048 # the whole spectrum
+    rows = []
+    for nod,frames in zip('AB',drift_obj.split_dither()):
+        for filename in frames:
+            med, total_flux = star_flux(drift_obj,filename,offset=args.offset)
+            rows.append({'frame':rf.frame_number(filename), 'utc':drift_obj.get_UTC(filename),
+                         'airmass':drift_obj.get_airmass(filename), 'flux':total_flux, 'nod':nod})
+    table = pd.DataFrame(rows,columns=['frame','utc','airmass','flux','nod'])
+    return [save_table(table,result_file('flux',drift_obj.date,drift_obj.mask,args.output))]
+
+
+def table_stage(drift_obj,args):
+    # the result tables the maps are rendered from (see render_maps.night_table())
+    import render_maps as rm
+    rm.night_table(drift_obj,slit=not args.no_slit,savefile=True,home=args.output)
+    return [rm.table_file(drift_obj.date,drift_obj.mask,args.output)]
+
+
+night_stages = {'seeing':seeing_stage, 'star-drift':star_drift_stage, 'slit-drift':slit_drift_stage,
+                'flux':flux_stage, 'render':table_stage}
+
+
+def _night_job(job):
+    stage, spec, args = job
+    print('Date:', spec['date'], 'Mask:', spec['mask'])
+    drift_obj = night_drift(spec,parse_settings(args.set),args.cache,args.catalogue)
+    return night_stages[stage](drift_obj,args)
+
+
+def run_nights(stage,specs,args):
+    '''
+    Runs a stage on each night, across a process pool if there's more than one worker.
+
+    RETURNS --- written:    list, names of the files written
+    '''
+    jobs = [(stage,spec,args) for spec in specs]
+    if args.workers > 1 and len(jobs) > 1:
+        with Pool(min(args.workers,len(jobs))) as pool:
+            written = pool.map(_night_job,jobs,chunksize=1) # nights take a while each
+    else: written = [_night_job(job) for job in jobs]
+    return [f for night in written for f in night]
+
+
+# -- stages that aren't run night by night -- #
+
+def index_stage(specs,args):
+    import catalogue as cat
+    added = cat.build_catalogue(args.archive,args.catalogue or cat.default_db,
+                                workers=args.workers,rescan=args.rescan)
+    print(f'Catalogued {added} frames.')
+
+
+def flexure_fit_stage(specs,args):
+    # current_model.py reads its parameters relative to engineering_time/, so the fit
+    # runs from there with the data & output paths made absolute
+    data, output = os.path.abspath(args.data)+'/', os.path.abspath(args.output)+'/'
+    here = os.getcwd()
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)),'engineering_time'))
+    sys.path.insert(0,os.getcwd())
+    try:
+        import flexure_uncertainty as fu
+        assert args.band is not None, 'Need --band (J/H) for the flexure fit.'
+        fcs = 'On' if args.FCS == 'y' else 'Off'
+        PA,Z,xs,ys = fu.read_measurements(fcs,args.band,home=data)
+        theta = fu.best_fit(PA,Z,xs,ys,band=args.band)
+        print('Best fit:',dict(zip(fu.fit_names,np.round(theta,4))),end='\n\n')
+
+        if args.method == 'mcmc':
+            samples = fu.ensemble_sampler(PA,Z,xs,ys,nsteps=args.number,burn=args.number//3,\
+                                          workers=args.workers,seed=args.seed,theta=theta)
+        else:
+            samples = fu.bootstrap(PA,Z,xs,ys,nboot=args.number,workers=args.workers,\
+                                   seed=args.seed,theta=theta)
+        print(fu.summarize(samples),end='\n\n')
+
+        filename = fu.posterior_file(fcs,args.band,home=output)
+        os.makedirs(os.path.dirname(filename),exist_ok=True)
+        pd.DataFrame(samples,columns=fu.fit_names).to_csv(filename,sep='\t',index=False)
+        print('Wrote',filename)
+    finally: os.chdir(here)
+
+
+def render_stage(specs,args):
+    import render_maps as rm
+    tables = None
+    if args.measure == True: tables = run_nights('render',specs,args)
+    elif len(specs) > 0:
+        tables = [rm.table_file(spec['date'],spec['mask'],args.output) for spec in specs]
+    saved = rm.render_archive(tables,kinds=tuple(args.kinds.split(',')),home=args.output,
+                              workers=args.workers)
+    print(f'Rendered {len(saved)} maps.')
+
+
+def watch_stage(specs,args):
+    '''
+    Measures the new frames of each night every "interval" seconds & feeds them to a
+    DriftMonitor, which prints the alerts.  The status of every frame is appended to
+    alerts/ in the output store.
+    '''
+    import drift_alerts as da
+    nights = [{'spec':spec, 'drift':None, 'last':-1,
+               'monitor':da.DriftMonitor(rate_limit=args.rate_limit,offset_limit=args.offset_limit)}
+              for spec in specs]
+    while True:
+        for night in nights:
+            spec = night['spec']
+            if night['drift'] is None:
+                # frames change as they come in, so no cubes
+                try: night['drift'] = night_drift(spec,parse_settings(args.set),args.cache,
+                                                  args.catalogue,cubes=False)
+                except Exception as e:
+                    print('Waiting for frames:',spec['date'],spec['mask'],'--',e)
+                    continue
+            monitor, statuses = da.monitor_night(night['drift'],night['monitor'],
+                                                 slit=not args.no_slit,start=night['last'])
+            if len(statuses) == 0: continue
+            night['last'] = max(status['frame'] for status in statuses)
+
+            table = pd.DataFrame([{key:value for key,value in status.items() if key != 'alerts'}
+                                  for status in statuses])
+            table['alerts'] = [len(status['alerts']) for status in statuses]
+            filename = result_file('alerts',spec['date'],spec['mask'],args.output)
+            os.makedirs(os.path.dirname(filename),exist_ok=True)
+            table.to_csv(filename,sep='\t',index=False,mode='a',header=not os.path.exists(filename))
+        if args.once == True: break
+        time.sleep(args.interval)
+
+
+stages = {'index':index_stage, 'flexure-fit':flexure_fit_stage, 'render':render_stage,
+          'watch':watch_stage}
+
+
+
+if __name__ == '__main__':
+    import argparse
+    # options shared by every subcommand
+    shared = argparse.ArgumentParser(add_help=False)
+    shared.add_argument('-w','--workers',help='Number of processes. (default: 4)',type=int,default=4)
+    shared.add_argument('-c','--cache',help='Scratch directory for the sky buffers & frame cubes. (default: none)',
+                        default=None)
+    shared.add_argument('-o','--output',help='Where the results are written. (default: plots-data/)',
+                        default='plots-data/')
+    shared.add_argument('-m','--masks',help=f'Table of nights & masks. (default: {default_masks})',
+                        default=default_masks)
+    shared.add_argument('-n','--nights',help='Rows of the table to run, ex. 0,3,4 (default: all)',default=None)
+    shared.add_argument('--home',help='Path to the MOSFIRE data, for one night not in the table.')
+    shared.add_argument('--date',help='Night, ex. 2021apr25 (with --home, --mask, --dither, & --band).')
+    shared.add_argument('--mask',help='Mask name.')
+    shared.add_argument('--dither',help='Dither of the mask in ".',type=float)
+    shared.add_argument('--band',help='MOSFIRE band.')
+    shared.add_argument('--star-slit',help='Rows of the star\'s slit, ex. 1052,1091 (default: found)',default=' ')
+    shared.add_argument('--star-cols',help='Columns of the star, ex. 622,1622 (default: found)',default=' ')
+    shared.add_argument('--catalogue',help='SQLite catalogue of the archive (see catalogue.py).',default=None)
+    shared.add_argument('--set',help='Drift() attribute, ex. profile_model=fast (can be repeated)',
+                        action='append',default=[])
+
+    parser = argparse.ArgumentParser(description="Running the drift & seeing measurements for MOSFIRE nights.",
+                usage='kvs.py COMMAND [options]')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    index = commands.add_parser('index',parents=[shared],help='Catalogue the raw frames of an archive.')
+    index.add_argument('-a','--archive',help='Path to the archive (one directory per night).',required=True)
+    index.add_argument('-r','--rescan',help='Reread every header.',action='store_true')
+
+    seeing = commands.add_parser('seeing',parents=[shared],help='Seeing of every frame.')
+    seeing.add_argument('-p','--method',help='Profile model, or "fast". (default: Drift.profile_model)',
+                        default=None)
+    commands.add_parser('star-drift',parents=[shared],help='Star drift for both nods.')
+    commands.add_parser('slit-drift',parents=[shared],help='Slit drift for both nods.')
+    flux = commands.add_parser('flux',parents=[shared],help='Star\'s flux with the skylines masked.')
+    flux.add_argument('--offset',help='Rows between the star & the sky rows. (default: 8)',type=int,default=8)
+
+    flexure = commands.add_parser('flexure-fit',parents=[shared],help='Posteriors of the FCS model parameters.')
+    flexure.add_argument('--FCS',help='FCS on? (y/n)',choices=['y','n'],required=True)
+    flexure.add_argument('--method',help='bootstrap or mcmc (default: bootstrap)',default='bootstrap')
+    flexure.add_argument('--number',help='Number of bootstrap refits or steps per walker.',type=int,default=2000)
+    flexure.add_argument('--seed',help='Seed for reproducible results.',type=int)
+    flexure.add_argument('--data',help='Path to the KVS-data/ folder. (default: KVS-data/)',default='KVS-data/')
+
+    render = commands.add_parser('render',parents=[shared],help='Maps from the result tables.')
+    render.add_argument('-k','--kinds',help='Maps to make, ex. star,slit,seeing',default='star,slit,seeing')
+    render.add_argument('--measure',help='Measure the nights first (writes their result tables).',action='store_true')
+    render.add_argument('--no-slit',help='Skip the slit cross-correlations when measuring.',action='store_true')
+
+    watch = commands.add_parser('watch',parents=[shared],help='Drift alerts as the frames come in.')
+    watch.add_argument('--interval',help='Seconds between looks for new frames. (default: 60)',type=float,default=60)
+    watch.add_argument('--once',help='Look once & stop.',action='store_true')
+    watch.add_argument('--no-slit',help='Skip the slit cross-correlations.',action='store_true')
+    watch.add_argument('--rate-limit',help='Drift rate ("/hour) that raises an alert. (default: 0.5)',
+                       type=float,default=0.5)
+    watch.add_argument('--offset-limit',help='Offset (") that raises an alert. (default: 0.5)',
+                       type=float,default=0.5)
+    args = parser.parse_args()
+    if not args.output.endswith('/'): args.output += '/'
+    if args.cache is not None and not args.cache.endswith('/'): args.cache += '/'
+
+    specs = []
+    if args.date is not None: # one night given on the command line
+        assert None not in [args.home,args.mask,args.dither,args.band], \
+            'Need --home, --mask, --dither, & --band with --date.'
+        specs = [{'path':args.home, 'date':args.date, 'mask':args.mask, 'dither':args.dither,
+                  'band':args.band, 'star_slit':args.star_slit.split(','), 'star_cols':args.star_cols.split(',')}]
+    elif args.command not in ['index','flexure-fit'] and \
+            not (args.command == 'render' and args.nights is None and args.measure == False):
+        nights = None if args.nights is None else [int(i) for i in args.nights.split(',')]
+        specs = read_nights(args.masks,nights)
+
+    if args.command in stages: stages[args.command](specs,args)
+    else:
+        written = run_nights(args.command,specs,args)
+        print(f'Wrote {len(written)} files:',*written,sep='\n')
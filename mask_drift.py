@@ -4,6 +4,7 @@ The following methods exist in this module:
 
     get_drift() --- takes a Drift() object and returns drift
                     measurements for both offsets (assumes ABAB)
+    stream_drift() - same measurements, yielded one frame at a time
     drift_map() --- given frame numbers and measured offsets,
                     returns a map of the drift for both nods
                     as a function of frame number (assumes ABAB)
@@ -46,13 +47,15 @@ def get_star_drift(drift_obj):
     return [num_A, num_B], [off_A, off_B]
 
 
-def get_slit_drift(drift_obj):
+def get_slit_drift(drift_obj,savefile=True,home='plots-data/'):
     '''
     Takes raw FITS data and masks out the rows of signal, then runs a
     comparison with a masked reference frame to calculate the x,y shift.
     Used to track the slit drift (can be different than the star drift).
     
     INPUTS ---- drift_obj:  a Drift() object with defined variables
+                savefile:   bool, write the shifts for each nod to slit_drift/
+                home:       str, path to the plots-data/ folder
     
     RETURNS --- four arrays (grouped 2 & 2) describing frame number &  
                 shift for each nod (assumes ABAB)
@@ -66,17 +69,13 @@ def get_slit_drift(drift_obj):
     shifts_A = [[],[]]
     framenum_A = []
     print('Nod A:')
-    #for i in range(len(nod_A)):
-    i = 0
-    while i < len(nod_A):
+    # the next frames are read in the background during each cross-correlation
+    for i,(filename,data) in enumerate(drift_obj.prefetch(nod_A,reference=ref_A)):
         print('A:',i)
-        x,y = drift_obj.cross_correlations(ref_A,nod_A[i])
+        x,y = drift_obj.cross_correlations(ref_A,filename,data=data)
         shifts_A[0].append(x)
         shifts_A[1].append(y)
-        framenum_A.append(int(nod_A[i][-8:-5]))
-        #if len(nod_A) < 25: i += 1
-        #else: i += 5 # in case there are a lot of frames
-        i += 1
+        framenum_A.append(rf.frame_number(filename))
         
     print()
     
@@ -84,33 +83,74 @@ def get_slit_drift(drift_obj):
     shifts_B = [[],[]]
     framenum_B = []
     print('Nod B:')
-    #for i in range(len(nod_B)):
-    i = 0
-    while i < len(nod_B):
+    # the next frames are read in the background during each cross-correlation
+    for i,(filename,data) in enumerate(drift_obj.prefetch(nod_B,reference=ref_B)):
         print('B:',i)
-        x,y = drift_obj.cross_correlations(ref_B,nod_B[i])
+        x,y = drift_obj.cross_correlations(ref_B,filename,data=data)
         shifts_B[0].append(x)
         shifts_B[1].append(y)
-        framenum_B.append(int(nod_B[i][-8:-5]))
-        #if len(nod_B) < 25: i += 1
-        #else: i += 5
-        i += 1
+        framenum_B.append(rf.frame_number(filename))
         
     # saving data to files
-    # nod A
-    zipit = list(zip(framenum_A,shifts_A[0],shifts_A[1]))
-    np.savetxt(f'plots-data/slit_drift/slit_drift_{drift_obj.date}_{drift_obj.mask}_nodA.txt',\
-              zipit,header='frame\toffset',delimiter='\t')
-    # nod B
-    zipit = list(zip(framenum_B,shifts_B[0],shifts_B[1]))
-    np.savetxt(f'plots-data/slit_drift/slit_drift_{drift_obj.date}_{drift_obj.mask}_nodB.txt',\
-              zipit,header='frame\toffset',delimiter='\t')
+    if savefile == True:
+        os.makedirs(f'{home}slit_drift',exist_ok=True)
+        # nod A
+        zipit = list(zip(framenum_A,shifts_A[0],shifts_A[1]))
+        np.savetxt(f'{home}slit_drift/slit_drift_{drift_obj.date}_{drift_obj.mask}_nodA.txt',\
+                  zipit,header='frame\toffset',delimiter='\t')
+        # nod B
+        zipit = list(zip(framenum_B,shifts_B[0],shifts_B[1]))
+        np.savetxt(f'{home}slit_drift/slit_drift_{drift_obj.date}_{drift_obj.mask}_nodB.txt',\
+                  zipit,header='frame\toffset',delimiter='\t')
         
     # the calculated shifts (from reference frame) for both nods
     return [framenum_A,shifts_A], [framenum_B,shifts_B]
         
 
-def drift_map(frame,offset,drift_obj,star=True,savefig=False,see=True):
+def stream_drift(drift_obj,slit=True,start=-1,monitor=None):
+    '''
+    Same measurements as get_star_drift() & get_slit_drift(), but one frame at a time
+    (in order of frame number, both nods), so they can be fed to an online stage like
+    drift_alerts.DriftMonitor() as the frames come in.  A nod without frames yet is
+    skipped until it has some.
+    
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                slit:       bool, also run the slit cross-correlations
+                start:      int, only frames after this frame number are measured
+                monitor:    DriftMonitor, keeps the frames not measured yet & the
+                            reference frames between calls, so that only the headers
+                            of new files are read & only new frames are fit
+    
+    YIELDS ---- row:        dict, frame number, nod, UTC, star offset ("), and
+                            slit x,y shift (pixels) for one frame
+    '''
+    from tracker import FrameLister
+    if monitor is not None: frames, refs = monitor.frames, monitor.references
+    else: frames, refs = FrameLister(), {}
+    
+    new = []
+    for filename,nod in frames.new_frames(drift_obj):
+        if rf.frame_number(filename) > start: new.append((filename,nod))
+        else: # reference is 1st frame of each nod, even before "start"
+            if nod not in refs: refs[nod] = (filename,drift_obj.fit_model(filename)[0])
+            frames.done(filename)
+    nods = dict(new)
+    for filename,data in drift_obj.prefetch([f for f,nod in new]): # reads the next frames meanwhile
+        nod = nods[filename]
+        cen = drift_obj.fit_model(filename,data=data)[0]
+        if nod not in refs: refs[nod] = (filename,cen)
+        ref, ref_cen = refs[nod]
+        row = {'frame':rf.frame_number(filename), 'nod':nod, 'utc':drift_obj.get_UTC(filename),
+               'star_offset':(ref_cen-cen) * 0.18, # "/pixel
+               'slit_xshift':np.nan, 'slit_yshift':np.nan}
+        if slit == True:
+            if drift_obj.xcorr == 'strips': data = None # reads its own strips
+            row['slit_xshift'],row['slit_yshift'] = drift_obj.cross_correlations(ref,filename,data=data)
+        frames.done(filename)
+        yield row
+
+
+def drift_map(frame,offset,drift_obj,star=True,savefig=False,see=True,el=None):
 	'''
 	Produces a star or slit drift map as a function of frame.
 	
@@ -118,6 +158,8 @@ def drift_map(frame,offset,drift_obj,star=True,savefig=False,see=True):
 	            offset:     2XN array, ex. [off_A,off_B]
 	            drift_obj:  a Drift() object with defined variables
 	            star:       bool, tracking star drift or slit drift?
+	            el:         2XN array, ex. [el_A,el_B]; if given, the
+	                        headers aren't reopened for the elevation
 	            savefig:    bool, save figure; default False
 	            see:        bool, show() figure; default True
 	
@@ -126,12 +168,13 @@ def drift_map(frame,offset,drift_obj,star=True,savefig=False,see=True):
 	if star == True: title = 'Star Drift Map'
 	else: title = 'Slit Drift Map'
 	
-	# making the list of files
-	mfile = 'm'+dt.strptime(drift_obj.date,'%Y%b%d').strftime('%y%m%d') # start of the file names
-	mfiles_A, mfiles_B = [mfile+f'_{fr:04d}.fits' for fr in frame[0]],[mfile+f'_{fr:04d}.fits' for fr in frame[1]]
-	# getting the pa and el information
-	pa_A, el_A = drift_obj.get_pa_el(mfiles_A)
-	pa_B, el_B = drift_obj.get_pa_el(mfiles_B)
+	if el is None:
+		# making the list of files (with whichever extension they have)
+		mfiles_A, mfiles_B = [drift_obj.frame_file(fr) for fr in frame[0]],[drift_obj.frame_file(fr) for fr in frame[1]]
+		# getting the pa and el information
+		pa_A, el_A = drift_obj.get_pa_el(mfiles_A)
+		pa_B, el_B = drift_obj.get_pa_el(mfiles_B)
+	else: el_A, el_B = el
 
 	# modifying colormap
 	cen, dmin, dmax = 35,20,90
@@ -17,6 +17,9 @@ It's definitely affected by the seeing (as expected), but also lightly
 affected by the airmass.  Need to think of how to properly account for this
 so that we can really compare the flux changes to see if there's a drift.
 
+star_flux() does this for one frame; "python kvs.py flux" runs it on every frame
+of a night (see kvs.py).
+
 '''
 
 __author__ = 'Taylor Hutchison'
@@ -27,7 +30,8 @@ __version__ = 'May2021'
 from drift import *
 from mask_drift import *
 from seeing_map import *
-import smoothing as sm
+from scipy.ndimage import uniform_filter1d
+from scipy.integrate import trapezoid # np.trapz is gone in newer numpy
 
 
 # from https://stackoverflow.com/questions/37671432/how-to-calculate-running-median-efficiently
@@ -55,133 +59,107 @@ def running_median_insort(seq, window_size):
 
 
 
-frame = 'm210423_0240.fits'
-
-# -- READING IN DATA -- #
-df = pd.read_csv('KVS-data/keck_masks.dat',delimiter='|',
-    converters={'star_slit': lambda x: x.split(','), 'star_cols': lambda x: x.split(',')})
-indx = len(df)-4
-
-
-
-# -- Creating Drift() object -- #
-test = Drift()
-
-test.home = df.loc[indx,'path']
-test.date = df.loc[indx,'date']
-test.mask = df.loc[indx,'mask']
-test.dither = df.loc[indx,'dither']
-test.band = df.loc[indx,'band']
-
-test.row_start = int(df.loc[indx,'star_slit'][0])
-test.row_end = int(df.loc[indx,'star_slit'][1])
-test.col_start = 0
-test.col_end = 2048
-
-# slicing out the star and masking out the skylines
-spectrum = test.cut_out(frame)
-
-profile = np.nansum(spectrum,axis=1)
-loc = profile.tolist().index(max(profile))
-spec = np.nansum(spectrum[loc-2:loc+3],axis=0)
-
-notloc = loc+8
-skylines = np.nansum(spectrum[notloc-2:notloc+3],axis=0)
-
-plt.figure(figsize=(9,5))
-#plt.imshow(spectrum,origin='lower')
-#plt.plot(profile)
-#plt.plot(spec)
-#plt.plot(skylines)
-
-diff = spec-skylines
-plt.plot(diff)
+def star_flux(drift_obj,filename,offset=8,width=181,sigma=2):
+    '''
+    Sums the star's spectrum over the rows around its peak, subtracts the same number
+    of rows "offset" rows away (the skylines), sigma-clips what's left against a running
+    mean of "width" columns (flat window), & smooths it again.
 
-# sigma clipping
-med = sm.smooth(diff,181,window='flat')
-mask = sigma_clip(diff-med,sigma=2)
-diff[mask.mask] = med[mask.mask]
-plt.plot(diff)
+    INPUTS ---- drift_obj:  a Drift() object with defined variables (all the columns
+                            of the spectrum, ex. col_start = 0 & col_end = 2048)
+                filename:   str, name of raw MOSFIRE file
+                offset:     int, rows between the star's peak & the sky rows
+                width:      int, columns in the running mean
+                sigma:      float, clipping threshold
 
-# running median
-med = sm.smooth(diff,181,window='flat')
-plt.plot(med)
+    RETURNS --- smoothed:   array, skyline-masked & smoothed spectrum
+                total_flux: float, integral of the smoothed spectrum
+    '''
+    spectrum = drift_obj.cut_out(filename)
 
-total_flux = np.trapz(med)
-# print(total_flux)
-
-
-plt.tight_layout()
-plt.savefig(f'plots-data/mosfire-{test.band}-skylines.pdf')
-plt.close()
-
-
-
-
-# running on a few frames
-seeing = pd.read_csv(f'plots-data/seeing/seeing_map_{test.date}_{test.mask}.txt',sep='\t')
-airmass = np.linspace(seeing.airmass.min(),seeing.airmass.max(), 15)
-colors = plt.cm.RdBu(np.linspace(1,0, 15))
-cindx = np.arange(len(colors))
-
-plt.figure(figsize=(9,5))
-
-for num in np.arange(220,274,5):
-    frame = f'm210423_0{num}.fits'
-    # slicing out the star and masking out the skylines
-    spectrum = test.cut_out(frame)
-    
-    # getting airmass info from seeing df
-    row = seeing.query(f'{num} == frame').copy()
-    diff_airmass = abs(airmass-row.airmass.values[0])
-    c = cindx[diff_airmass == min(diff_airmass)][0]
-    
     profile = np.nansum(spectrum,axis=1)
-    loc = profile.tolist().index(max(profile))
-    spec = np.nansum(spectrum[loc-2:loc+3],axis=0)
+    loc = int(np.argmax(profile))
+    spec = np.nansum(spectrum[max(loc-2,0):loc+3],axis=0)
 
-    notloc = loc+8
+    notloc = loc+offset
     skylines = np.nansum(spectrum[notloc-2:notloc+3],axis=0)
-
     diff = spec-skylines
 
     # sigma clipping
-    med = sm.smooth(diff,181,window='flat')
-    mask = sigma_clip(diff-med,sigma=2)
+    med = uniform_filter1d(diff,width,mode='reflect')
+    mask = sigma_clip(diff-med,sigma=sigma)
     diff[mask.mask] = med[mask.mask]
 
     # running median
-    med = sm.smooth(diff,181,window='flat')
-    if row.seeing.values[0] > 0.84:
-        plt.plot(med,color=colors[c],ls=':')
-    else:
-        plt.plot(med,color=colors[c])
-
-    total_flux = np.trapz(med)
-#     print(f'For m210423_0{num}.fits:',total_flux)
-    print(f'airmass={round(row.airmass.values[0],2)}, seeing={round(row.seeing.values[0],2)}, \t{round(total_flux,2)}, \tand {c}')
+    med = uniform_filter1d(diff,width,mode='reflect')
+    return med, trapezoid(med)
 
 
-plt.tight_layout()
-plt.savefig(f'plots-data/mosfire-{test.band}-skylines.pdf')
-plt.close()
 
+if __name__ == '__main__':
+    frame = 'm210423_0240.fits'
 
+    # -- READING IN DATA -- #
+    df = pd.read_csv('KVS-data/keck_masks.dat',delimiter='|',
+        converters={'star_slit': lambda x: x.split(','), 'star_cols': lambda x: x.split(',')})
+    indx = len(df)-4
 
 
 
+    # -- Creating Drift() object -- #
+    test = Drift()
 
+    test.home = df.loc[indx,'path']
+    test.date = df.loc[indx,'date']
+    test.mask = df.loc[indx,'mask']
+    test.dither = df.loc[indx,'dither']
+    test.band = df.loc[indx,'band']
 
+    test.row_start = int(df.loc[indx,'star_slit'][0])
+    test.row_end = int(df.loc[indx,'star_slit'][1])
+    test.col_start = 0
+    test.col_end = 2048
 
+    # slicing out the star and masking out the skylines
+    med, total_flux = star_flux(test,frame)
+    # print(total_flux)
 
+    plt.figure(figsize=(9,5))
+    plt.plot(med)
+    plt.tight_layout()
+    plt.savefig(f'plots-data/mosfire-{test.band}-skylines.pdf')
+    plt.close()
 
 
 
 
+    # running on a few frames
+    seeing = pd.read_csv(f'plots-data/seeing/seeing_map_{test.date}_{test.mask}.txt',sep='\t')
+    airmass = np.linspace(seeing.airmass.min(),seeing.airmass.max(), 15)
+    colors = plt.cm.RdBu(np.linspace(1,0, 15))
+    cindx = np.arange(len(colors))
 
+    plt.figure(figsize=(9,5))
 
+    for num in np.arange(220,274,5):
+        frame = f'm210423_0{num}.fits'
+        # slicing out the star and masking out the skylines
+        med, total_flux = star_flux(test,frame)
 
+        # getting airmass info from seeing df
+        row = seeing.query(f'{num} == frame').copy()
+        diff_airmass = abs(airmass-row.airmass.values[0])
+        c = cindx[diff_airmass == min(diff_airmass)][0]
 
+        if row.seeing.values[0] > 0.84:
+            plt.plot(med,color=colors[c],ls=':')
+        else:
+            plt.plot(med,color=colors[c])
 
+    #     print(f'For m210423_0{num}.fits:',total_flux)
+        print(f'airmass={round(row.airmass.values[0],2)}, seeing={round(row.seeing.values[0],2)}, \t{round(total_flux,2)}, \tand {c}')
 
 
+    plt.tight_layout()
+    plt.savefig(f'plots-data/mosfire-{test.band}-skylines.pdf')
+    plt.close()
@@ -5,6 +5,9 @@ NOTE:   This script reads in data ran from a file that does not exist in this
 
 Code used to run the modules in this directory.  To do so, will read in the dataframe 
 'keck_masks.dat' which holds the current MOSFIRE masks used to test this code.
+
+For production runs, use kvs.py instead (ex. "python kvs.py seeing -n 0,3,4"), which
+picks the nights from the command line & runs them across processes.
 '''
 
 __author__ = 'Taylor Hutchison'
@@ -32,10 +35,13 @@ for indx in [len(df)-1]:
     test.dither = df.loc[indx,'dither']
     test.band = df.loc[indx,'band']
 
-    test.row_start = int(df.loc[indx,'star_slit'][0])
-    test.row_end = int(df.loc[indx,'star_slit'][1])
-    test.col_start = int(df.loc[indx,'star_cols'][0])
-    test.col_end = int(df.loc[indx,'star_cols'][1])
+    if df.loc[indx,'star_slit'][0].strip() == '': # mask not annotated yet, finding the star
+        test.auto_configure()
+    else:
+        test.row_start = int(df.loc[indx,'star_slit'][0])
+        test.row_end = int(df.loc[indx,'star_slit'][1])
+        test.col_start = int(df.loc[indx,'star_cols'][0])
+        test.col_end = int(df.loc[indx,'star_cols'][1])
 
     print('Date:', test.date, 'Mask:', test.mask)
 
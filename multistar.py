@@ -0,0 +1,138 @@
+'''
+Tracking every star in a mask at once.
+
+Drift() follows one star (row_start/row_end).  With drift_obj.stars set to the boxes of
+all the stars (ex. from autoconfig.configure_stars()), the functions here
+
+    --  cut every star's slit out of one read of each frame (for fpack'ed frames, only
+        the tiles covering the stars are decompressed, see rawfits.read_boxes())
+    --  fit the profiles of all the stars in all the frames in one batched call (see
+        Drift.fit_profiles() & profiles.py)
+    --  return the seeing & the drift of each star, like get_seeing() & get_star_drift()
+
+With several stars spread along the mask, field_drift() splits each frame's offsets into
+a shift of the whole field, a change of plate scale, & (with the stars' positions across
+the mask) a rotation -- without reading any more data.
+'''
+
+from drift import *
+from tracker import pixscale
+
+
+def cut_outs(drift_obj,filename,data=None,clip=True):
+    '''
+    Cuts all the stars' slits out of a frame, clipping the cosmic rays the same way
+    as Drift.cut_out().
+
+    INPUTS ---- drift_obj:  a Drift() object with "stars" defined
+                filename:   str, name of raw MOSFIRE file to be read in
+                data:       array, the frame if it was already read in (optional)
+                clip:       bool, False leaves the cosmic rays in (for cosmics.py)
+
+    RETURNS --- cutouts:    list of 2D arrays, one per star
+    '''
+    path = drift_obj.home+'%s/'%drift_obj.date
+    cached = drift_obj.cube_index is not None and filename in drift_obj.cube_index
+    if data is None and cached == True: data = drift_obj.read_frame(filename)
+    if data is not None: cutouts = [data[r0:r1,c0:c1] for r0,r1,c0,c1 in drift_obj.stars]
+    else: cutouts = rf.read_boxes(path+filename,drift_obj.stars) # only reads the stars' rows
+
+    clipped = []
+    for profile_2D in cutouts:
+        dtype = np.float32 if drift_obj.low_memory == True else profile_2D.dtype
+        profile_2D = profile_2D.astype(dtype) # a copy that can be changed
+        if clip == False:
+            clipped.append(profile_2D)
+            continue
+        mask = sigma_clip(profile_2D,sigma=2,axis=1)
+        profile_2D[mask.mask] = np.median(profile_2D)
+        clipped.append(profile_2D)
+    return clipped
+
+
+def fit_stars(drift_obj,frames):
+    '''
+    Fits the profiles of all the stars in a list of frames.  The frames are read (&
+    clipped) in the background while the earlier ones are collapsed, then every
+    profile is fit in one batch.  With drift_obj.cosmics = "stack", the cosmic rays
+    are found by comparing each star's cut-outs across the frames (which should be
+    from the same nod, see cosmics.py).
+
+    RETURNS --- centers:        NxK array (frames x stars), centre of each profile
+                                (pixels from the bottom of the star's box)
+                amplitudes:     NxK array, counts at the peak
+                sigmas:         NxK array, width of each profile (pixels)
+                frame_number:   1xN list
+    '''
+    nstars = len(drift_obj.stars)
+    stack = drift_obj.cosmics == 'stack'
+    reader = lambda f: cut_outs(drift_obj,f,clip=not stack)
+    profiles, frame_number = [],[]
+    for filename,cutouts in drift_obj.prefetch(frames,reader=reader):
+        if stack == True: profiles.append(cutouts)
+        else: profiles.extend(np.sum(profile_2D,axis=1) for profile_2D in cutouts)
+        frame_number.append(rf.frame_number(filename))
+    if len(frame_number) == 0:
+        empty = np.zeros((0,nstars))
+        return empty, empty, empty, frame_number
+    if stack == True: # one stack per star, then back in the same order as above
+        cleaned = [np.sum(cr.clean_stack([cutouts[k] for cutouts in profiles])[0],axis=2) for k in range(nstars)]
+        profiles = [cleaned[k][i] for i in range(len(frame_number)) for k in range(nstars)]
+
+    # sig is FWHM/2.35 for models other than "gaussian" (see Drift.fit_profiles())
+    fits = np.stack(drift_obj.fit_profiles(profiles),axis=-1).reshape(len(frame_number),nstars,3)
+    return fits[...,0], fits[...,1], fits[...,2], frame_number
+
+
+def get_star_series(drift_obj):
+    '''
+    Seeing & drift of every star, for both nods.
+
+    INPUTS ---- drift_obj:  a Drift() object with "stars" defined
+
+    RETURNS --- six arrays (grouped 2 & 2 & 2) describing frame number, seeing
+                (NxK, " FWHM), & star offsets (NxK, ") for each nod (assumes ABAB)
+    '''
+    nod_A, nod_B = drift_obj.split_dither()
+    frames, seeing, offsets = [],[],[]
+    for nod in [nod_A,nod_B]:
+        cen, amp, sig, num = fit_stars(drift_obj,nod)
+        frames.append(num)
+        seeing.append(sig * 2.35 * pixscale) # FWHM ~ 2.35*sigma
+        offsets.append((cen[:1]-cen) * pixscale) # same convention as get_star_drift()
+    return frames, seeing, offsets
+
+
+def field_drift(offsets,rows,cols=None):
+    '''
+    Splits the star offsets of each frame into a shift of the whole field, a change
+    of plate scale, & (if the stars' positions across the mask are given) a rotation:
+
+        motion of star i = -offset = shift + scale * y_i + rotation * x_i
+
+    where y_i & x_i are the positions (") of star i along & across the slits, measured
+    from the middle of the stars.  Needs at least 2 stars (3 with a rotation).
+    (The offsets count a star moving up the detector as negative, see get_star_drift(),
+    so the shift is positive up the detector & the scale positive for a larger scale.)
+
+    INPUTS ---- offsets:    NxK array (frames x stars), offsets (") from get_star_series()
+                rows:       1xK array, detector row of each star (ex. middle of its box)
+                cols:       1xK array, position of each star across the mask (pixels)
+
+    RETURNS --- terms:      Nx2 (or Nx3) array; shift ("), scale (fractional change),
+                            & rotation (radians, sign set by the direction of "cols")
+                            for each frame
+    '''
+    offsets = np.atleast_2d(np.asarray(offsets,dtype=float))
+    y = np.asarray(rows,dtype=float) * pixscale
+    design = [np.ones_like(y), y - y.mean()]
+    if cols is not None:
+        x = np.asarray(cols,dtype=float) * pixscale
+        design.append(x - x.mean())
+    design = np.stack(design,axis=1)
+    if len(y) < design.shape[1]: raise Exception(f'Need at least {design.shape[1]} stars.')
+
+    terms = np.full((len(offsets),design.shape[1]),np.nan)
+    good = np.all(np.isfinite(offsets),axis=1)
+    if good.any(): terms[good] = np.linalg.lstsq(design,-offsets[good].T,rcond=None)[0].T
+    return terms
@@ -0,0 +1,72 @@
+'''
+Bounded prefetching reader for loops over frames.
+
+Loops like Drift.fit_all() or get_slit_drift() read a frame, work on it, then read the
+next one -- so on network storage the CPU waits on every read.  Prefetcher() reads the
+next frames in background threads while the current one is being worked on:
+
+    for filename, data in Prefetcher(frames, reader, depth=2):
+        ...work on data...
+
+At most "depth" frames are read ahead, and never more than "max_bytes" worth of them
+(the size of a frame is taken from the ones already read), so the memory stays bounded.
+The frames come out in the same order they went in.
+'''
+
+import numpy as np
+import astropy.io.fits as fits
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+
+def read_fits(filename):
+    '''
+    Reads a FITS frame into memory right away.  (With astropy's default memory-mapping
+    the data would only be read when it's first used, i.e. not in the background.)
+    '''
+    return fits.getdata(filename,memmap=False)
+
+
+class Prefetcher:
+    '''
+    Iterates over (key, data) pairs, reading ahead in background threads.
+
+    INPUTS ---- keys:       list, what to read (ex. filenames), in order
+                reader:     function, reads one key & returns an array (default: read_fits)
+                depth:      int, most frames read ahead of the current one
+                max_bytes:  int, most bytes held by frames read ahead
+                workers:    int, number of reading threads
+    '''
+    def __init__(self,keys,reader=read_fits,depth=2,max_bytes=512*1024**2,workers=1):
+        self.keys = list(keys)
+        self.reader = reader
+        self.depth = max(int(depth),1)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.frame_bytes = None # size of one frame, once one has been read
+
+    def _room(self,queue):
+        if len(queue) >= self.depth: return False
+        if self.frame_bytes is None: return len(queue) == 0 # size not known yet
+        return (len(queue)+1)*self.frame_bytes <= self.max_bytes or len(queue) == 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        keys = iter(self.keys)
+        queue = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def fill():
+                while self._room(queue):
+                    key = next(keys,None)
+                    if key is None: return
+                    queue.append((key,pool.submit(self.reader,key)))
+
+            fill()
+            while len(queue) > 0:
+                key, future = queue.popleft()
+                data = future.result()
+                self.frame_bytes = max(self.frame_bytes or 0,getattr(data,'nbytes',0))
+                fill() # start on the next frames before handing this one over
+                yield key, data
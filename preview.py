@@ -0,0 +1,162 @@
+'''
+Preview tier for quick-look plots.
+
+show_me_all_profiles() and the see=True paths in collapse_profile.py read the full
+2048x2048 frames just to draw diagnostic plots.  This module stores, for every raw frame,
+a small compressed file holding
+
+    binned:     the frame binned down (default 8x8 -> 256x256), as float16
+    spatial:    the collapsed spatial profile of the full frame (see collapse_2D())
+    star:       the star's spatial profile from Drift.cut_out() (if rows are set), so
+                with the same cosmic-ray clipping
+    box:        the star's box (row_start, row_end, col_start, col_end) it was made with
+
+so that the quick-look plots for a whole night only read these previews.  The previews
+are made once (in parallel with build_previews()) and reused after that, unless the
+star's box has changed.
+'''
+
+from drift import *
+import collapse_profile as coll
+from multiprocessing import Pool
+
+
+def preview_file(drift_obj,filename,cache='previews/'):
+    return f'{cache}{drift_obj.date}/{rf.frame_stem(filename)}.npz'
+
+
+def star_box(drift_obj):
+    return np.array([drift_obj.row_start,drift_obj.row_end,drift_obj.col_start,drift_obj.col_end])
+
+
+def is_current(drift_obj,outfile):
+    '''
+    True if a preview exists & was made with the Drift() object's star box.
+    '''
+    if not os.path.exists(outfile): return False
+    with np.load(outfile) as data:
+        return 'box' in data.files and np.array_equal(data['box'],star_box(drift_obj))
+
+
+def bin_frame(arr,binning=8):
+    '''
+    Bins a frame down by averaging binning x binning blocks.
+    '''
+    ny, nx = arr.shape[0]//binning, arr.shape[1]//binning
+    arr = arr[:ny*binning,:nx*binning]
+    return np.nanmean(arr.reshape(ny,binning,nx,binning),axis=(1,3))
+
+
+def make_preview(drift_obj,filename,binning=8,cache='previews/'):
+    '''
+    Reads a raw frame once and writes its preview.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                filename:   str, name of raw MOSFIRE file to be read in
+                binning:    int, binning factor for the preview image
+                cache:      str, directory for the previews
+
+    RETURNS --- outfile:    str, name of the preview file
+    '''
+    path = drift_obj.home+'%s/'%drift_obj.date
+    frame = rf.getdata(path+filename).astype(np.float32)
+
+    binned = bin_frame(frame,binning).astype(np.float16)
+    if drift_obj.row_end > drift_obj.row_start: # same profile as fit_model()
+        star = np.sum(drift_obj.cut_out(filename,data=frame),axis=1)
+    else: star = np.zeros(0)
+    spatial = coll.collapse_2D(frame) # NOTE: this NaNs the cosmics in "frame"
+
+    outfile = preview_file(drift_obj,filename,cache)
+    os.makedirs(os.path.dirname(outfile),exist_ok=True)
+    np.savez_compressed(outfile,binned=binned,spatial=spatial.astype(np.float32),\
+                        star=star.astype(np.float32),binning=binning,box=star_box(drift_obj))
+    return outfile
+
+
+def load_preview(drift_obj,filename,cache='previews/',build=True):
+    '''
+    Returns the preview for a frame as a dictionary, making it first if needed (or
+    again, if the star's box has changed since).
+    '''
+    outfile = preview_file(drift_obj,filename,cache)
+    if not is_current(drift_obj,outfile):
+        if build == False: raise FileNotFoundError(f'No preview for {filename} in {cache}.')
+        make_preview(drift_obj,filename,cache=cache)
+    with np.load(outfile) as data:
+        return {key:data[key] for key in data.files}
+
+
+def _preview_job(args):
+    drift_obj, filename, binning, cache = args
+    if is_current(drift_obj,preview_file(drift_obj,filename,cache)): return None
+    return make_preview(drift_obj,filename,binning,cache)
+
+
+def build_previews(drift_obj,frames=None,binning=8,cache='previews/',workers=4):
+    '''
+    Makes the previews for a list of frames (default: all frames of the mask) across
+    a process pool, skipping the ones that already exist (for the same star box).
+
+    RETURNS --- made:   list, names of the previews that were written
+    '''
+    if frames is None: frames = drift_obj.mask_frames()
+    jobs = [(drift_obj,f,binning,cache) for f in frames]
+    with Pool(workers) as pool:
+        made = pool.map(_preview_job,jobs)
+    return [f for f in made if f is not None]
+
+
+# QUICK-LOOK PLOTS (previews only)
+def show_me_all_profiles(drift_obj,frames,cache='previews/',savefig=False):
+    '''
+    Same as Drift.show_me_all_profiles(), but from the previews.
+    '''
+    plt.figure(figsize=(9,6))
+    for filename in frames:
+        plt.plot(load_preview(drift_obj,filename,cache)['star'])
+
+    plt.xlabel('row in cut-out')
+    plt.tight_layout()
+    if savefig == True: plt.savefig(f'plots-data/quicklook_profiles_{drift_obj.date}_{drift_obj.mask}.png')
+    else: plt.show()
+    plt.close('all')
+
+
+def show_me_spatial(drift_obj,frames,cache='previews/',savefig=False):
+    '''
+    Plots the collapsed spatial profiles (what return_star() & make_blank() use)
+    for a list of frames, offset from each other for clarity.
+    '''
+    plt.figure(figsize=(11,7))
+    for i,filename in enumerate(frames):
+        spatial = load_preview(drift_obj,filename,cache)['spatial']
+        plt.plot(spatial/np.nanmedian(spatial)+i,lw=0.8)
+
+    plt.xlabel('row')
+    plt.ylabel('normalized counts + offset')
+    plt.tight_layout()
+    if savefig == True: plt.savefig(f'plots-data/quicklook_spatial_{drift_obj.date}_{drift_obj.mask}.png')
+    else: plt.show()
+    plt.close('all')
+
+
+def show_me_frames(drift_obj,frames,cache='previews/',ncols=6,savefig=False):
+    '''
+    Grid of the binned frames, all on the same color scale.
+    '''
+    previews = [load_preview(drift_obj,f,cache)['binned'].astype(np.float32) for f in frames]
+    vmin, vmax = np.nanpercentile(previews,[5,99])
+    nrows = int(np.ceil(len(frames)/ncols))
+
+    plt.figure(figsize=(2*ncols,2*nrows))
+    for i,(filename,img) in enumerate(zip(frames,previews)):
+        ax = plt.subplot(nrows,ncols,i+1)
+        ax.imshow(img,origin='lower',vmin=vmin,vmax=vmax)
+        ax.set_title(rf.frame_stem(filename),fontsize=9)
+        ax.set_xticks([]); ax.set_yticks([])
+
+    plt.tight_layout()
+    if savefig == True: plt.savefig(f'plots-data/quicklook_frames_{drift_obj.date}_{drift_obj.mask}.png')
+    else: plt.show()
+    plt.close('all')
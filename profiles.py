@@ -0,0 +1,305 @@
+'''
+Models of the star's spatial profile & a batched fitter for them.
+
+Drift.fit_model() used to fit a single Gaussian with curve_fit(), one profile at a time,
+and get_seeing() turned its width into a seeing with FWHM ~ 2.35*sigma.  Real MOSFIRE
+profiles have wings, which a Gaussian fit answers with a wider core.  The models here
+(set with Drift.profile_model) are
+
+    "gaussian"          mean, A, sig, B             (the original fit)
+    "moffat"            mean, A, alpha, beta, B     A / (1 + ((x-mean)/alpha)^2)^beta + B
+    "gaussian_halo"     mean, A, sig, A_halo, ratio, B
+                        a Gaussian core plus a wider (ratio*sig) Gaussian halo
+
+each with its analytic derivatives, bounds, starting point, & FWHM.  For quick-look
+seeing there's also "fast" (see fast_fwhm()), which measures the FWHM from where the
+profile crosses half its peak, without fitting.  batch_fit() fits K
+profiles at once with a vectorized Levenberg-Marquardt: the model, its derivatives, and
+the normal equations are computed for every profile in one go, so fitting a whole night
+(or all the stars of a mask, see multistar.py) costs about the same as fitting one
+profile.  Profiles of different lengths are padded & given zero weight.
+
+The Gaussian fit is the same least-squares problem (& the same starting point & bounds)
+as the curve_fit() version, and agrees with it to ~1e-5 pixels in the centre & width on
+noisy profiles (see engineering_time/test_profiles.py).
+'''
+
+import numpy as np
+
+
+class ProfileModel:
+    '''
+    A profile model for batch_fit().
+
+    INPUTS ---- name:       str, name used for Drift.profile_model
+                function:   function, (x,p) --> model (KxN), derivatives (KxNxP)
+                params:     list, names of the P parameters (the centre comes first)
+                lower:      1xP list, lower bounds of the parameters
+                upper:      1xP list, upper bounds of the parameters
+                guess:      function, (y,w) --> KxP starting parameters
+                peak:       function, KxP parameters --> height of the profile
+                            above the background
+                fwhm:       function, KxP parameters --> FWHM (pixels)
+    '''
+    def __init__(self,name,function,params,lower,upper,guess,peak,fwhm):
+        self.name = name
+        self.function = function
+        self.params = params
+        self.lower = np.asarray(lower,dtype=float)
+        self.upper = np.asarray(upper,dtype=float)
+        self.guess = guess
+        self.peak = peak
+        self.fwhm = fwhm
+
+
+# GAUSSIAN
+def gaussian(x,p):
+    '''
+    Gaussian plus a constant background, & its derivatives.
+
+    INPUTS ---- x:      KxN array, positions along each profile
+                p:      Kx4 array, (mean, A, sig, B) for each profile
+
+    RETURNS --- model:  KxN array
+                jac:    KxNx4 array, derivatives of the model by each parameter
+    '''
+    mean, A, sig, B = [p[:,i,None] for i in range(4)]
+    u = (x - mean) / sig
+    g = np.exp(-0.5*u**2)
+    jac = np.stack([A*g*u/sig, g, A*g*u**2/sig, np.ones_like(g)],axis=-1)
+    return A*g + B, jac
+
+
+def gaussian_guess(y,w):
+    '''
+    Same starting point as the original fit: the peak of the profile, a width of 4 pixels.
+    '''
+    peak = np.argmax(np.where(w > 0,y,-np.inf),axis=1)
+    return np.stack([peak.astype(float),y[np.arange(len(y)),peak],np.full(len(y),4.),np.zeros(len(y))],axis=1)
+
+
+# MOFFAT
+def moffat(x,p):
+    '''
+    Moffat profile plus a constant background, & its derivatives.
+
+    INPUTS ---- x:      KxN array, positions along each profile
+                p:      Kx5 array, (mean, A, alpha, beta, B) for each profile
+    '''
+    mean, A, alpha, beta, B = [p[:,i,None] for i in range(5)]
+    u = (x - mean) / alpha
+    q = 1 + u**2
+    m = q**-beta
+    dq = 2*A*beta*m/q # -d(model)/dq * 2
+    jac = np.stack([dq*u/alpha, m, dq*u**2/alpha, -A*m*np.log(q), np.ones_like(m)],axis=-1)
+    return A*m + B, jac
+
+
+def moffat_fwhm(p):
+    return 2*p[:,2]*np.sqrt(2**(1/p[:,3]) - 1)
+
+
+def moffat_guess(y,w,beta=2.5):
+    # starts from the Gaussian fit, with the same FWHM
+    g = levenberg_marquardt(y,w,models['gaussian'])[0]
+    alpha = 2.35*g[:,2] / (2*np.sqrt(2**(1/beta) - 1))
+    return np.stack([g[:,0],g[:,1],alpha,np.full(len(y),beta),g[:,3]],axis=1)
+
+
+# GAUSSIAN + HALO
+def gaussian_halo(x,p):
+    '''
+    Gaussian core plus a wider Gaussian halo (same centre, "ratio" times the width)
+    plus a constant background, & its derivatives.
+
+    INPUTS ---- x:      KxN array, positions along each profile
+                p:      Kx6 array, (mean, A, sig, A_halo, ratio, B) for each profile
+    '''
+    mean, A, sig, Ah, ratio, B = [p[:,i,None] for i in range(6)]
+    u = (x - mean) / sig
+    v = u / ratio
+    g, h = np.exp(-0.5*u**2), np.exp(-0.5*v**2)
+    jac = np.stack([(A*g*u + Ah*h*v/ratio)/sig, g, (A*g*u**2 + Ah*h*v**2)/sig, h,
+                    Ah*h*v**2/ratio, np.ones_like(g)],axis=-1)
+    return A*g + Ah*h + B, jac
+
+
+def halo_fwhm(p,iterations=60):
+    '''
+    FWHM of the core + halo (no closed form), by bisection for all profiles at once.
+    '''
+    A, sig, Ah, ratio = p[:,1], p[:,2], p[:,3], p[:,4]
+    half = (A + Ah) / 2
+    lo, hi = np.zeros(len(p)), 3*ratio*sig
+    for i in range(iterations):
+        d = (lo + hi) / 2
+        above = A*np.exp(-0.5*(d/sig)**2) + Ah*np.exp(-0.5*(d/(ratio*sig))**2) > half
+        lo, hi = np.where(above,d,lo), np.where(above,hi,d)
+    return lo + hi # 2 * the half width
+
+
+def halo_guess(y,w,fraction=0.1,ratio=3.):
+    # starts from the Gaussian fit, with a bit of its light moved into a halo
+    g = levenberg_marquardt(y,w,models['gaussian'])[0]
+    return np.stack([g[:,0],(1-fraction)*g[:,1],g[:,2],fraction*g[:,1],np.full(len(y),ratio),g[:,3]],axis=1)
+
+
+models = {model.name:model for model in [
+    ProfileModel('gaussian',gaussian,['mean','A','sig','B'],
+                 [0,0,0,0],[np.inf,np.inf,30,np.inf],gaussian_guess,
+                 lambda p: p[:,1],
+                 lambda p: 2.35*p[:,2]), # same approximation as get_seeing()
+    ProfileModel('moffat',moffat,['mean','A','alpha','beta','B'],
+                 [0,0,0.1,1,0],[np.inf,np.inf,60,20,np.inf],moffat_guess,
+                 lambda p: p[:,1],moffat_fwhm),
+    ProfileModel('gaussian_halo',gaussian_halo,['mean','A','sig','A_halo','ratio','B'],
+                 [0,0,0.1,0,1.5,0],[np.inf,np.inf,30,np.inf,10,np.inf],halo_guess,
+                 lambda p: p[:,1]+p[:,3],halo_fwhm),
+]}
+
+
+# FAST ESTIMATE (no fitting)
+def half_max_crossings(y,w,background):
+    '''
+    Where each profile crosses half its peak on either side of the peak, by linear
+    interpolation between the pixels (NaN if it doesn't cross on a side).
+    '''
+    k, n = y.shape
+    rows, idx = np.arange(k), np.arange(n)
+    yb = np.where(w > 0,y - background[:,None],-np.inf)
+    top = np.argmax(yb,axis=1)
+    # parabola through the brightest pixel & its neighbours for the height of the peak
+    left_y, right_y = yb[rows,np.maximum(top-1,0)], yb[rows,np.minimum(top+1,n-1)]
+    curve = left_y - 2*yb[rows,top] + right_y
+    shift = np.where(np.isfinite(curve) & (curve < 0),0.5*(left_y-right_y)/np.where(curve < 0,curve,-1),0)
+    peak = yb[rows,top] - 0.25*(left_y-right_y)*shift
+    half = peak[:,None] / 2
+
+    below = yb < half
+    left = np.where(below & (idx < top[:,None]),idx,-1).max(axis=1)         # last pixel below, left
+    right = np.where(below & (idx > top[:,None]),idx,n).min(axis=1)         # first pixel below, right
+    ok_l, ok_r = left >= 0, right < n
+    l, r = np.clip(left,0,n-2), np.clip(right,1,n-1)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        x_l = l + (half[:,0] - yb[rows,l]) / (yb[rows,l+1] - yb[rows,l])
+        x_r = r - (half[:,0] - yb[rows,r]) / (yb[rows,r-1] - yb[rows,r])
+    return np.where(ok_l,x_l,np.nan), np.where(ok_r,x_r,np.nan), peak
+
+
+def fast_fwhm(profiles,percentile=20,wings=1.5):
+    '''
+    Centre, peak, & FWHM of many profiles at once without any fitting: the FWHM is the
+    distance between the half-maximum crossings & the centre is halfway between them.
+    The background starts as a low percentile of each profile, then is remeasured as
+    the median of the pixels more than "wings" FWHMs from the centre.
+
+    INPUTS ---- profiles:   list of 1D arrays (or a KxN array), the profiles
+                percentile: float, percentile of the profile used as the first background
+                wings:      float, FWHMs from the centre beyond which pixels are background
+
+    RETURNS --- mean:       1xK array, centre of each profile
+                A:          1xK array, height of each profile above the background
+                sig:        1xK array, FWHM / 2.35 (same as summary())
+    '''
+    y, w = pad_profiles(profiles)
+    valid = np.where(w > 0,y,np.nan)
+    background = np.nanpercentile(valid,percentile,axis=1)
+    for i in range(2): # first with the rough background, then with the one from the wings
+        x_l, x_r, peak = half_max_crossings(y,w,background)
+        mean, fwhm = (x_l+x_r)/2, x_r-x_l
+        if i == 0:
+            far = np.abs(np.arange(y.shape[1]) - mean[:,None]) > wings*fwhm[:,None]
+            wing = np.where(far & (w > 0),y,np.nan)
+            enough = np.sum(np.isfinite(wing),axis=1) >= 3
+            with np.errstate(all='ignore'): background = np.where(enough,np.nanmedian(wing,axis=1),background)
+    return mean, peak, fwhm/2.35
+
+
+# FITTING
+def pad_profiles(profiles):
+    '''
+    Stacks profiles of different lengths into a KxN array (NaN-padded) with weights.
+    '''
+    n = max(len(p) for p in profiles)
+    y = np.full((len(profiles),n),np.nan)
+    for i,p in enumerate(profiles): y[i,:len(p)] = p
+    w = np.isfinite(y).astype(float)
+    return np.nan_to_num(y), w
+
+
+def levenberg_marquardt(y,w,model,p0=None,max_iter=100,tol=1e-8):
+    '''
+    Vectorized Levenberg-Marquardt for padded profiles (see batch_fit()).
+    '''
+    x = np.broadcast_to(np.arange(y.shape[1],dtype=float),y.shape)
+    p = model.guess(y,w) if p0 is None else np.array(p0,dtype=float)
+    p = np.clip(p,model.lower,model.upper)
+
+    def cost(p):
+        f, jac = model.function(x,p)
+        return np.sum(w*(y-f)**2,axis=1), f, jac
+
+    c, f, jac = cost(p)
+    lam = np.full(len(y),1e-3)
+    active = np.ones(len(y),dtype=bool)
+    for it in range(max_iter):
+        # normal equations for every profile at once
+        wjac = w[...,None]*jac
+        JTJ = np.einsum('knp,knq->kpq',wjac,jac)
+        grad = np.einsum('knp,kn->kp',wjac,y-f)
+        diag = np.einsum('kpp->kp',JTJ)
+        damped = JTJ + (lam[:,None]*np.maximum(diag,1e-12))[...,None]*np.eye(p.shape[1])
+        # parameters sitting on a bound they're pushed against are held there, so the
+        # step for the others isn't spoiled by clipping (ex. a halo that isn't needed)
+        held = ((p <= model.lower) & (grad < 0)) | ((p >= model.upper) & (grad > 0))
+        free = ~held
+        damped = damped*(free[:,:,None] & free[:,None,:]) + held[:,:,None]*np.eye(p.shape[1])
+        grad = np.where(held,0,grad)
+        try: step = np.linalg.solve(damped,grad[...,None])[...,0]
+        except np.linalg.LinAlgError: step = np.einsum('kpq,kq->kp',np.linalg.pinv(damped),grad)
+        trial = np.clip(p+step,model.lower,model.upper)
+        c_new, f_new, jac_new = cost(trial)
+
+        better = (c_new < c) & active
+        # same stopping rules as curve_fit(): the cost or the parameters stop changing
+        small = np.all(np.abs(trial-p) <= tol*(np.abs(p)+tol),axis=1)
+        done = better & ((c - c_new <= tol*c) | small)
+        p[better], f[better], jac[better] = trial[better], f_new[better], jac_new[better]
+        c = np.where(better,c_new,c)
+        lam = np.where(better,lam/10,lam*10)
+        active &= ~done & (lam < 1e12) # stops once the cost stops going down
+        if not active.any(): break
+    return p, ~active
+
+
+def batch_fit(profiles,model='gaussian',p0=None,max_iter=100,tol=1e-8):
+    '''
+    Least-squares fits of a model to many profiles at once.
+
+    INPUTS ---- profiles:   list of 1D arrays (or a KxN array), the profiles
+                model:      str or ProfileModel, ex. "gaussian", "moffat", "gaussian_halo"
+                p0:         KxP array, starting parameters (default: the model's guess)
+                max_iter:   int, most iterations
+                tol:        float, relative change in the cost (or the parameters)
+                            at which a fit stops
+
+    RETURNS --- params:     KxP array, best-fit parameters for each profile
+                ok:         1xK bool array, False if a fit didn't converge
+    '''
+    if isinstance(model,str): model = models[model]
+    y, w = pad_profiles(profiles)
+    return levenberg_marquardt(y,w,model,p0,max_iter,tol)
+
+
+def summary(params,model='gaussian'):
+    '''
+    Turns fitted parameters into what Drift.fit_model() returns for every model.
+
+    RETURNS --- mean:   1xK array, centre of each profile
+                A:      1xK array, height of each profile above the background
+                sig:    1xK array, FWHM / 2.35 -- the Gaussian sigma for "gaussian",
+                        & the equivalent one for the other models, so that
+                        FWHM = 2.35*sig (as in get_seeing()) holds for all of them
+    '''
+    if isinstance(model,str): model = models[model]
+    return params[:,0], model.peak(params), model.fwhm(params)/2.35
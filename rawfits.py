@@ -0,0 +1,125 @@
+'''
+Reading raw MOSFIRE frames that are stored compressed.
+
+Archived frames are often fpack'ed (tile-compressed, "m210423_0240.fits.fz") or gzipped
+("m210423_0240.fits.gz") rather than plain FITS files.  The functions here handle all three:
+
+    --  fpack'ed frames keep the image (& its header, with OBJECT, YOFFSET, etc.) in
+        extension 1, with an empty primary header -- image_hdu() finds the right one
+    --  read_rows() only decompresses the tiles covering the rows asked for (fpack
+        compresses row by row by default), so a cut-out or a few strips of rows
+        doesn't decompress the whole frame
+    --  gzipped frames can only be decompressed from the start of the file, so reading
+        rows there saves memory but not time
+
+The frame number is parsed from the name, so the rest of the code doesn't have to know
+which extension a frame has (see frame_number()).
+'''
+
+import numpy as np
+import astropy.io.fits as fits
+import re
+import os
+
+extensions = ['.fits','.fits.fz','.fits.gz']  # in order of preference
+compressed = ['.fits.fz','.fits.gz']
+
+
+def extension(filename):
+    '''
+    Returns which of the raw frame extensions a file name has (None if it isn't one).
+    '''
+    for ext in extensions[::-1]: # longest first
+        if filename.endswith(ext): return ext
+    return None
+
+
+def is_compressed(filename):
+    return extension(filename) in compressed
+
+
+def frame_stem(filename):
+    '''
+    File name without the extension, ex. "m210423_0240".
+    '''
+    ext = extension(filename)
+    return filename[:-len(ext)] if ext is not None else filename
+
+
+def frame_number(filename):
+    '''
+    Frame number from a raw frame name, ex. 240 for "m210423_0240.fits.fz".
+    '''
+    match = re.search(r'_(\d+)$',os.path.basename(frame_stem(filename)))
+    if match is None: raise ValueError(f'No frame number in {filename}')
+    return int(match.group(1))
+
+
+def find_file(path,stem):
+    '''
+    Name of the raw frame "stem" in "path" with whichever extension is there
+    (plain FITS if none of them are, ex. when the frames are in cubes).
+    '''
+    for ext in extensions:
+        if os.path.exists(path+stem+ext): return stem+ext
+    return stem+extensions[0]
+
+
+def image_hdu(hdul):
+    '''
+    The HDU holding the image: the primary HDU for plain or gzipped frames, the
+    first extension (a CompImageHDU) for fpack'ed frames.
+    '''
+    for hdu in hdul:
+        if hdu.is_image and hdu.header.get('NAXIS',0) > 0: return hdu
+    return hdul[0]
+
+
+def getheader(filename):
+    with fits.open(filename) as hdul:
+        return image_hdu(hdul).header.copy()
+
+
+def getdata(filename,header=False):
+    '''
+    Reads in a full raw frame (decompressed if need be).  Plain FITS files are
+    memory-mapped as usual.
+    '''
+    if is_compressed(filename) == False:
+        return fits.getdata(filename,header=header)
+    with fits.open(filename) as hdul:
+        hdu = image_hdu(hdul)
+        data = hdu.data
+        if header == True: return data, hdu.header.copy()
+        return data
+
+
+def read_rows(filename,starts,height):
+    '''
+    Reads in only some strips of rows of a raw frame, decompressing only the
+    tiles covering them for fpack'ed frames.
+
+    INPUTS ---- filename:   str, path to the raw frame
+                starts:     1xK int array, first row of each strip
+                height:     int, rows per strip
+
+    RETURNS --- strips:     Kxheightx2048 array (type of the raw data)
+    '''
+    with fits.open(filename) as hdul:
+        section = image_hdu(hdul).section # only reads the requested rows
+        return np.stack([section[s:s+height,:] for s in starts])
+
+
+def read_boxes(filename,boxes):
+    '''
+    Reads in several boxes of a raw frame from one opening of the file, decompressing
+    only the tiles covering them for fpack'ed frames.
+
+    INPUTS ---- filename:   str, path to the raw frame
+                boxes:      list of (row_start, row_end, col_start, col_end)
+
+    RETURNS --- cutouts:    list of arrays, one per box
+    '''
+    with fits.open(filename) as hdul:
+        section = image_hdu(hdul).section
+        return [np.array(section[r0:r1,c0:c1]) for r0,r1,c0,c1 in boxes]
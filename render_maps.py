@@ -0,0 +1,251 @@
+'''
+Batch renderer for the star drift, slit drift, and seeing maps.
+
+drift_map() and seeing_map() are written for one mask at a time: every call builds a new
+figure, colormap, and FixPointNormalize, and drift_map() reopens the headers to get the
+elevation.  To rerender the whole archive, this module instead
+
+    --  works from precomputed result tables (one per night & mask, see night_table()),
+    --  builds each figure, axes, colormap, & colorbar once per process and only swaps
+        out the data between masks,
+    --  renders with the Agg canvas across a process pool.
+
+The maps look the same as the ones from mask_drift.py & seeing_map.py.
+'''
+
+from drift import *
+from fixing_colorbar import *
+import matplotlib.dates as md
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from functools import lru_cache
+from datetime import timedelta
+from multiprocessing import Pool
+import glob
+
+# one row per frame, for both nods
+table_columns = ['frame','nod','utc','airmass','pa','el','seeing',\
+                 'star_offset','slit_xshift','slit_yshift']
+
+
+def table_file(date,mask,home='plots-data/'):
+    return f'{home}results/results_{date}_{mask}.txt'
+
+
+def night_table(drift_obj,slit=True,savefile=True,home='plots-data/'):
+    '''
+    Runs the star fits (and slit cross-correlations) for a mask & stores everything
+    the maps need -- including the header information -- in one table, so that the
+    maps can be rerendered without touching the raw frames again.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                slit:       bool, also run the slit drift cross-correlations
+                savefile:   bool, write table to plots-data/results/
+                home:       str, path to the plots-data/ folder
+
+    RETURNS --- table:      pandas DataFrame with "table_columns"
+    '''
+    nod_A, nod_B = drift_obj.split_dither()
+
+    tables = []
+    for nod,frames in zip(['A','B'],[nod_A,nod_B]):
+        cen, A, sig, num = drift_obj.fit_all(frames)
+        pa, el = drift_obj.get_pa_el(frames)
+        cen = np.asarray(cen)
+
+        tab = pd.DataFrame({'frame':num, 'nod':nod, 'utc':drift_obj.get_UTC(frames),
+                            'airmass':drift_obj.get_airmass(frames), 'pa':pa, 'el':el,
+                            'seeing':np.asarray(sig) * 2.35 * 0.18, # "/pixel
+                            'star_offset':(cen[0]-cen) * 0.18})     # "/pixel
+        if slit == True:
+            shifts = np.asarray([drift_obj.cross_correlations(frames[0],f,data=data) for f,data \
+                                 in drift_obj.prefetch(frames,reference=frames[0])])
+            tab['slit_xshift'], tab['slit_yshift'] = shifts[:,0], shifts[:,1]
+        else: tab['slit_xshift'], tab['slit_yshift'] = np.nan, np.nan
+        tables.append(tab)
+
+    table = pd.concat(tables)
+    table.sort_values(by=['frame'],inplace=True)
+    table.reset_index(inplace=True,drop=True)
+
+    if savefile == True:
+        os.makedirs(os.path.dirname(table_file(drift_obj.date,drift_obj.mask,home)),exist_ok=True)
+        table.to_csv(table_file(drift_obj.date,drift_obj.mask,home),sep='\t',index=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def map_colors(kind):
+    '''
+    Colormap & normalization for each kind of map (same numbers as drift_map() and
+    seeing_map()), built once per process.
+    '''
+    if kind == 'seeing':
+        cen, dmin, dmax = 2,1,3.5
+        tmap = airmass_cmap(cen,dmin,dmax)
+        norm = FixPointNormalize(fixme=cen,fixhere=cen/(dmax-dmin),vmin=dmin,vmax=2.5)
+    else:
+        cen, dmin, dmax = 35,20,90
+        tmap = elevation_cmap(cen,dmin,dmax)
+        norm = FixPointNormalize(fixme=cen,fixhere=cen/(dmax-dmin),vmin=dmin,vmax=dmax)
+    return tmap, norm
+
+
+class MapTemplate:
+    '''
+    A star drift, slit drift, or seeing map that is built once and reused.
+    Only the scatter points, text, and limits change from mask to mask.
+    '''
+    def __init__(self,kind):
+        self.kind = kind
+        self.fig = Figure(figsize=(11,6))
+        FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot(111)
+        tmap, norm = map_colors(kind)
+
+        if kind == 'seeing': size, pos, ha = 80, [(0.975,0.94),(0.975,0.88)], 'right'
+        else: size, pos, ha = 60, [(0.025,0.05),(0.025,0.1)], 'left'
+
+        kwargs = {'cmap':tmap,'norm':norm,'edgecolor':'k','s':size}
+        self.nods = [ax.scatter([],[],c=[],label='Nod A',**kwargs),
+                     ax.scatter([],[],c=[],marker='^',label='Nod B',**kwargs)]
+        self.mask_txt = ax.text(*pos[0],'',ha=ha,transform=ax.transAxes,fontsize=15)
+        self.date_txt = ax.text(*pos[1],'',ha=ha,transform=ax.transAxes,fontsize=16)
+        self.legend, self.laid_out = None, False
+
+        # colorbar
+        if kind == 'seeing':
+            cbar = self.fig.colorbar(self.nods[0],ax=ax,pad=0.02)
+            cbar.set_label('Airmass',rotation=270,labelpad=18)
+            cbar.ax.invert_yaxis()
+            ax.xaxis.set_major_formatter(md.DateFormatter('%H:%M'))
+            ax.set_xlabel('UTC')
+            ax.set_ylabel('seeing ["]')
+            ax.set_ylim(0.3,2)
+        else:
+            cbar = self.fig.colorbar(self.nods[0],ax=ax)
+            cbar.set_label('Elevation [deg]',rotation=270,labelpad=18)
+            if kind == 'star': ax.set_title('Star Drift Map',fontsize=16)
+            else: ax.set_title('Slit Drift Map',fontsize=16)
+            ax.set_xlabel('frame number')
+            ax.set_ylabel('$y_0 - y$ ["]')
+
+    def draw(self,table,date,mask):
+        '''
+        Swaps in the data for one mask.
+
+        INPUTS ---- table:  pandas DataFrame, see night_table()
+                    date:   str, date of the observations, ex. 2018nov25
+                    mask:   str, mask name
+        '''
+        ax = self.ax
+        if self.kind == 'seeing': column, color = 'seeing', 'airmass'
+        elif self.kind == 'star': column, color = 'star_offset', 'el'
+        else: column, color = 'slit_yshift', 'el'
+
+        xvals = []
+        for nod,points in zip(['A','B'],self.nods):
+            sub = table.query(f'nod == "{nod}"')
+            if self.kind == 'seeing':
+                x = md.date2num([dt.strptime(i,'%H:%M:%S.%f') for i in sub.utc])
+            else: x = sub.frame.values.astype(float)
+            points.set_offsets(np.column_stack((x,sub[column].values)))
+            points.set_array(sub[color].values)
+            xvals.append(x)
+
+        self.mask_txt.set_text('Mask: %s'%(mask))
+        self.date_txt.set_text('Date: %s'%(date))
+        if self.legend is None: self.legend = ax.legend(loc=2)
+
+        # setting the ranges
+        if self.kind == 'seeing':
+            start = md.num2date(min(x[0] for x in xvals if len(x) > 0)) - timedelta(minutes=2)
+            end = md.num2date(max(x[-1] for x in xvals if len(x) > 0)) + timedelta(minutes=2)
+            ax.set_xlim(start,end)
+        else:
+            x = np.concatenate(xvals)
+            pad = max(1,0.05*(x.max()-x.min()))
+            ax.set_xlim(x.min()-pad,x.max()+pad)
+
+            offset = table.query('nod == "A"')[column].values
+            if min(offset) < -0.2 and min(offset) > -2:
+                ax.set_ylim(min(offset)+min(offset)*0.3,0.4)
+            else: ax.set_ylim(-0.2,0.4)
+
+        if self.laid_out == False:
+            self.fig.tight_layout()
+            self.laid_out = True
+
+    def save(self,filename):
+        # the layout is already tight, so skipping the extra "tight" draw pass
+        self.fig.savefig(filename,bbox_inches=self.fig.bbox_inches)
+
+
+# one set of templates per process
+_templates = {}
+
+def map_file(kind,date,mask,home='plots-data/'):
+    if kind == 'seeing': return f'{home}seeing/seeing_map_{date}_{mask}.pdf'
+    return f'{home}{kind}_drift/{kind}_drift_map_{date}_{mask}.pdf'
+
+
+def render_night(filename,kinds=('star','slit','seeing'),home='plots-data/'):
+    '''
+    Renders the maps for one result table, reusing the templates in this process.
+
+    INPUTS ---- filename:   str, result table written by night_table()
+                kinds:      tuple, which maps to make
+                home:       str, path to the plots-data/ folder
+
+    RETURNS --- saved:      list, names of the maps written
+    '''
+    table = pd.read_csv(filename,delimiter='\t',dtype={'utc':str})
+    date, mask = os.path.basename(filename)[len('results_'):-len('.txt')].split('_',1)
+
+    saved = []
+    for kind in kinds:
+        if kind == 'slit' and table.slit_yshift.isna().all(): continue
+        if kind not in _templates: _templates[kind] = MapTemplate(kind)
+        _templates[kind].draw(table,date,mask)
+        _templates[kind].save(map_file(kind,date,mask,home))
+        saved.append(map_file(kind,date,mask,home))
+    return saved
+
+
+def _render_job(args):
+    filename, kinds, home = args
+    return render_night(filename,kinds,home)
+
+
+def render_archive(tables=None,kinds=('star','slit','seeing'),home='plots-data/',workers=4):
+    '''
+    Renders every result table across a process pool.
+
+    INPUTS ---- tables:     list, result tables (default: all in plots-data/results/)
+                kinds:      tuple, which maps to make
+                home:       str, path to the plots-data/ folder
+                workers:    int, number of processes
+
+    RETURNS --- saved:      list, names of the maps written
+    '''
+    if tables is None: tables = np.sort(glob.glob(f'{home}results/results_*.txt'))
+    jobs = [(f,kinds,home) for f in tables]
+
+    with Pool(workers) as pool:
+        # chunks keep each worker on a run of masks so the templates get reused
+        chunksize = max(1,len(jobs)//(workers*4))
+        saved = pool.map(_render_job,jobs,chunksize=chunksize)
+    return [f for night in saved for f in night]
+
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Rerendering the drift & seeing maps from the result tables.",
+                usage='render_maps.py ...')
+    parser.add_argument('-w','--workers',help='Number of processes.',type=int,default=4)
+    parser.add_argument('-k','--kinds',help='Maps to make, ex. star,slit,seeing',default='star,slit,seeing')
+    args = parser.parse_args()
+
+    saved = render_archive(kinds=tuple(args.kinds.split(',')),workers=args.workers)
+    print(f'Rendered {len(saved)} maps.')
@@ -3,7 +3,8 @@ Module for measuring and displaying the seeing for a given mask.
 The following methods exist in this module:
 
 	get_seeing() -- takes a Drift() object and returns seeing
-		            measurements for both offsets (assumes ABAB)
+		            measurements for both offsets (assumes ABAB);
+		            method="fast" skips the fits for quick-look
 	seeing_map() -- given frame numbers and measured seeing,
 		            returns a map of the seeing for both nods
 		            as a function of frame number (assumes ABAB)
@@ -27,13 +28,17 @@ import matplotlib
 
 register_matplotlib_converters()
 
-def get_seeing(drift_obj):
+def get_seeing(drift_obj,method=None):
 	'''
 	Fits a gaussian to each raw frame's star and produces the 
 	seeing measurements.
 
 	INPUTS ---- home:   path to directory containing MOSFIRE data
 		        drift_obj:  a drift_obj() object with defined variables
+		        method:     str, "fast" measures the FWHM without fitting
+		                    (for quick-look, see profiles.fast_fwhm()), or
+		                    one of the models in profiles.py (default:
+		                    drift_obj.profile_model)
 
 	RETURNS --- eight arrays (grouped 2 & 2 & 2 & 2) describing frame 
 		        number, UTC, seeing, & airmass for each nod (assumes ABAB)
@@ -44,8 +49,8 @@ def get_seeing(drift_obj):
 
 	# ------------- measuring the fits ------------- #
 	# ---------------------------------------------- #
-	cen_A, A_A, sig_A, num_A = drift_obj.fit_all(nod_A)   
-	cen_B, A_B, sig_B, num_B = drift_obj.fit_all(nod_B)   
+	cen_A, A_A, sig_A, num_A = drift_obj.fit_all(nod_A,model=method)   
+	cen_B, A_B, sig_B, num_B = drift_obj.fit_all(nod_B,model=method)   
 	# ---------------------------------------------- #
 
 	# takes the sigma and uses FWHM = sigma*2.35 (approximation)
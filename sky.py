@@ -0,0 +1,234 @@
+'''
+Rolling sky model from the opposite nod.
+
+The star's cut-outs are fit raw, sky & skylines included, so the star has to be found on
+top of the sky & the columns have to be picked to avoid the brightest lines.  Since the
+star moves by 2*dither between the nods, the frames of the other nod are a measure of the
+sky at the star's rows.  rolling_sky() goes through the night in order & for each frame
+
+    1.  keeps the last "depth" cut-outs of each nod in a ring buffer (SkyBuffer), which
+        can be memory-mapped to a scratch directory so a long night stays in bounded
+        memory
+    2.  takes the median of the other nod's buffer as the sky, with the rows of the other
+        nod's star filled in from the rows around it (sky_model())
+    3.  subtracts it from the cut-out, leaving just the star (& noise)
+
+The first frames of a nod wait until the other nod has a frame.  RollingSky keeps all of
+this between calls (see Drift.sky_subtracted()), so asking for more frames carries on from
+the last frame read, & the cut-outs of the frames passed on the way (ex. the other nod's,
+when fitting one nod) are spilled to the scratch directory until they're asked for.
+
+Only fit_all() (get_seeing(), get_star_drift(), & the kvs.py stages built on them)
+subtracts the sky.  fit_model() & the frame-by-frame paths (mask_drift.stream_drift(),
+tracker.py, kvs.py watch) fit the raw cut-outs: at the start of a night the first
+frames have no sky until the other nod has a frame.
+'''
+
+import numpy as np
+import profiles as pr
+import rawfits as rf
+import cosmics as cr
+import tempfile
+import shutil
+import weakref
+import os
+
+
+class SkyBuffer:
+    '''
+    Ring buffer of the last "depth" cut-outs of a nod.  With a scratch directory, the
+    buffer is a memory-mapped file (deleted by close()) instead of an array in memory.
+    '''
+    def __init__(self,depth,shape,dtype=np.float32,scratch=None):
+        self.depth, self.count, self.filename = depth, 0, None
+        if scratch is None: self.frames = np.empty((depth,)+tuple(shape),dtype=dtype)
+        else:
+            os.makedirs(scratch,exist_ok=True)
+            fd, self.filename = tempfile.mkstemp(suffix='.sky',dir=scratch)
+            os.close(fd)
+            self.frames = np.memmap(self.filename,dtype=dtype,mode='w+',shape=(depth,)+tuple(shape))
+
+    def push(self,cutout):
+        self.frames[self.count % self.depth] = cutout
+        self.count += 1
+
+    def median(self):
+        return np.median(self.frames[:min(self.count,self.depth)],axis=0)
+
+    def close(self):
+        if self.filename is not None:
+            del self.frames
+            os.remove(self.filename)
+            self.filename = None
+
+
+def star_rows(sky,nsigma=5.,width=1.5):
+    '''
+    Rows of the star in a sky model (the other nod's star), if there's one.
+
+    INPUTS ---- sky:    RxC array, median of the other nod's cut-outs
+                nsigma: float, how far above the noise the star's peak has to be
+                width:  float, FWHMs on either side of the centre counted as the star
+
+    RETURNS --- rows:   (int,int), first & last+1 rows of the star (None if none found)
+    '''
+    profile = np.sum(sky,axis=1)
+    resid = profile - np.median(profile)
+    noise = 1.4826 * np.median(np.abs(resid))
+    mean, A, sig = pr.fast_fwhm([profile])
+    if not (np.isfinite(mean[0]) and A[0] > nsigma*noise): return None
+    half = width * 2.35*sig[0]
+    return max(int(np.floor(mean[0]-half)),0), min(int(np.ceil(mean[0]+half))+1,len(profile))
+
+
+def sky_model(buffer,nsigma=5.,width=1.5):
+    '''
+    Sky for the other nod's frames: the median of the buffer, with the rows of its own
+    star interpolated (column by column) between the rows on either side.
+    '''
+    sky = buffer.median()
+    rows = star_rows(sky,nsigma,width)
+    if rows is None: return sky
+    r0, r1 = rows
+    below, above = sky[max(r0-1,0)], sky[min(r1,len(sky)-1)]
+    if r0 == 0: below = above
+    if r1 == len(sky): above = below
+    t = ((np.arange(r0,r1) - (r0-1)) / (r1 - r0 + 1))[:,None]
+    sky[r0:r1] = (1-t)*below + t*above
+    return sky
+
+
+class RollingSky:
+    '''
+    The state of the sky model for a night, kept between calls: the buffers of both nods,
+    the frames waiting for the other nod, & where in the night the reading is up to.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                depth:      int, frames of the other nod in the median
+                scratch:    str, directory for memory-mapped buffers & the spilled cut-outs
+                            (default: buffers in memory, spilled cut-outs in a temporary
+                            directory)
+                clip:       bool, replace the cosmic rays after the subtraction, frame by
+                            frame (see cosmics.py; sigma-clipping the rows as in
+                            Drift.cut_out() would clip the star's spectrum once the
+                            sky is gone); False to leave them for cosmics.clean_stack()
+    '''
+    def __init__(self,drift_obj,depth=5,scratch=None,clip=True):
+        self.drift_obj, self.depth, self.scratch, self.clip = drift_obj, depth, scratch, clip
+        if scratch is not None: os.makedirs(scratch,exist_ok=True)
+        self.spill = tempfile.mkdtemp(prefix='kvs-sky-',dir=scratch)
+        # the spilled cut-outs & memory-mapped buffers go when this does (or at exit)
+        self._cleanup = weakref.finalize(self,shutil.rmtree,self.spill,True)
+        self.night, self.nod_of = [],{}     # frames in order & the nod of each (0 or 1)
+        self.read = 0                       # frames of the night read so far
+        self.buffers, self.waiting = [None,None], [[],[]]
+        self.spilled = set()                # frames whose cut-outs are in "spill"
+
+    def add_nods(self,nod_A,nod_B):
+        '''
+        Adds the frames of each nod (ex. from split_dither()) that aren't known yet.
+
+        RETURNS --- ok:     bool, False if a new frame comes before one already read
+                            (the sky has to be started over)
+        '''
+        new = {**{f:0 for f in nod_A if f not in self.nod_of},**{f:1 for f in nod_B if f not in self.nod_of}}
+        if len(new) == 0: return True
+        new_night = sorted(list(self.nod_of)+list(new),key=rf.frame_number)
+        if new_night[:self.read] != self.night[:self.read]: return False
+        self.night = new_night
+        self.nod_of.update(new)
+        return True
+
+    def available(self,frames):
+        '''
+        True if all the frames can still be handed out (not read yet, or spilled).
+        '''
+        position = {f:i for i,f in enumerate(self.night)}
+        return all(f in self.spilled or (f in position and position[f] >= self.read) for f in frames)
+
+    def _subtract(self,cutout,sky):
+        cutout = cutout - sky
+        if self.clip == True: cutout = cr.clean_stack(cutout[None],inplace=True)[0][0]
+        return cutout
+
+    def _produce(self,last):
+        # reads on to position "last" of the night, yielding (filename, cut-out) as they're
+        # ready, then one frame at a time for as long as they're asked for (ex. a frame
+        # waiting for the other nod's next frame)
+        reader = lambda f: self.drift_obj.cut_out(f,clip=False)
+        while self.read < len(self.night):
+            frames = self.night[self.read:max(last+1,self.read+1)]
+            for filename,cutout in self.drift_obj.prefetch(frames,reader=reader):
+                self.read += 1
+                nod = self.nod_of[filename]
+                if self.buffers[nod] is None:
+                    self.buffers[nod] = SkyBuffer(self.depth,cutout.shape,cutout.dtype,\
+                                                  None if self.scratch is None else self.spill)
+                self.buffers[nod].push(cutout)
+                self.waiting[nod].append((filename,cutout))
+                for n in [nod,1-nod]: # this frame, or the other nod's frames waiting for it
+                    if len(self.waiting[n]) > 0 and self.buffers[1-n] is not None:
+                        sky = sky_model(self.buffers[1-n])
+                        while len(self.waiting[n]) > 0:
+                            f,c = self.waiting[n].pop(0)
+                            yield f, self._subtract(c,sky)
+
+    def _spill_file(self,filename):
+        return os.path.join(self.spill,filename+'.npy')
+
+    def subtracted(self,frames):
+        '''
+        Iterates over (filename, sky-subtracted cut-out) for the frames asked for (which
+        have to be available()), in the order asked for.  Frames passed on the way are
+        spilled until they're asked for, & each spilled cut-out is deleted once it's
+        handed out.
+        '''
+        position = {f:i for i,f in enumerate(self.night)}
+        wanted, ready = set(frames), {}
+        last = max([position[f] for f in frames if f not in self.spilled],default=-1)
+        produced = self._produce(last)
+        for filename in frames:
+            if filename in self.spilled:
+                cutout = np.load(self._spill_file(filename))
+                os.remove(self._spill_file(filename))
+                self.spilled.discard(filename)
+                yield filename, cutout
+                continue
+            while filename not in ready:
+                try: f,cutout = next(produced)
+                except StopIteration: raise Exception('Need frames in both nods for the sky model.')
+                if f in wanted: ready[f] = cutout
+                else:
+                    np.save(self._spill_file(f),cutout)
+                    self.spilled.add(f)
+            yield filename, ready.pop(filename)
+
+    def close(self):
+        for buffer in self.buffers:
+            if buffer is not None: buffer.close()
+        self.buffers = [None,None]
+        self._cleanup()
+
+
+def rolling_sky(drift_obj,frames,depth=5,scratch=None,clip=True,nods=None):
+    '''
+    Iterates over (filename, sky-subtracted cut-out) for the frames asked for, reading
+    the cut-outs of the night (both nods, in order) up to the last one to build the sky.
+    The frames come back in the order asked for.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                frames:     list, names of raw MOSFIRE files wanted
+                depth:      int, frames of the other nod in the median
+                scratch:    str, directory for memory-mapped buffers (default: in memory)
+                clip:       bool, replace the cosmic rays after the subtraction (see RollingSky)
+                nods:       (list,list), the frames of each nod if they're already known
+                            (default: from split_dither())
+    '''
+    nod_A, nod_B = drift_obj.split_dither() if nods is None else nods
+    if len(nod_A) == 0 or len(nod_B) == 0:
+        raise Exception('Need frames in both nods for the sky model.')
+    rolling = RollingSky(drift_obj,depth,scratch,clip)
+    try:
+        rolling.add_nods(nod_A,nod_B)
+        yield from rolling.subtracted(frames)
+    finally: rolling.close()
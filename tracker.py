@@ -0,0 +1,335 @@
+'''
+Incremental star-drift & seeing tracker.
+
+get_star_drift() & get_seeing() refit every frame of the night each time they're called.
+The StarTracker() here instead takes one frame's fit at a time and keeps running
+statistics, with the same (small) amount of work for every new frame:
+
+    --  the reference centre of the star for each nod (first frame of the nod, as in
+        get_star_drift()), so the offset of a new frame is one subtraction
+    --  the rolling median seeing over the last "window" frames (deque + sorted list,
+        same idea as running_median_insort() in masking_out_skylines.py)
+    --  the drift rate of the star for each nod, from a rolling linear fit to the
+        offsets vs. time (running sums, so adding & dropping a frame is O(1))
+    --  outlier flags for the seeing & the offset, measured against the rolling
+        statistics (flagged frames are not added to the statistics)
+
+The whole state can be saved with snapshot()/save() & picked up again with restore()/load(),
+so a monitor that runs all night only ever processes the new frames (see track_night()).
+'''
+
+import numpy as np
+from collections import deque
+from bisect import insort, bisect_left
+import rawfits as rf
+import json
+import os
+
+pixscale = 0.18 # MOSFIRE "/pixel
+
+
+def utc_hours(utc):
+    '''
+    Converts a header UTC string (ex. "10:42:13.45") to hours.
+    '''
+    h, m, s = utc.split(':')
+    return int(h) + int(m)/60 + float(s)/3600
+
+
+class RollingMedian:
+    '''
+    Median (& spread) of the last "window" values.  The values are kept in a deque
+    (in order of arrival) and in a sorted list, so an update is a bisect & an insert.
+    '''
+    def __init__(self,window=15):
+        self.window = window
+        self.values = deque()
+        self.ordered = []
+
+    def add(self,value):
+        if len(self.values) == self.window:
+            old = self.values.popleft()
+            del self.ordered[bisect_left(self.ordered,old)]
+        self.values.append(value)
+        insort(self.ordered,value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def median(self):
+        if len(self.ordered) == 0: return np.nan
+        return self.ordered[len(self.ordered)//2]
+
+    def scale(self):
+        '''
+        Robust standard deviation from the interquartile range.
+        '''
+        n = len(self.ordered)
+        if n < 4: return np.nan
+        return (self.ordered[(3*n)//4] - self.ordered[n//4]) / 1.349
+
+    def state(self):
+        return {'window':self.window, 'values':list(self.values)}
+
+    @classmethod
+    def from_state(cls,state):
+        new = cls(state['window'])
+        for value in state['values']: new.add(value)
+        return new
+
+
+class RollingLinearFit:
+    '''
+    Least-squares line through the last "window" (x,y) points, from running sums.
+    '''
+    def __init__(self,window=10):
+        self.window = window
+        self.points = deque()
+        self.sums = np.zeros(5) # n, x, y, xx, xy
+
+    def add(self,x,y):
+        if len(self.points) == self.window:
+            ox, oy = self.points.popleft()
+            self.sums -= [1,ox,oy,ox*ox,ox*oy]
+        self.points.append((x,y))
+        self.sums += [1,x,y,x*x,x*y]
+
+    def slope(self):
+        n, sx, sy, sxx, sxy = self.sums
+        denom = n*sxx - sx*sx
+        if n < 2 or denom <= 0: return np.nan
+        return float((n*sxy - sx*sy) / denom)
+
+    def predict(self,x):
+        n, sx, sy, sxx, sxy = self.sums
+        if n == 0: return np.nan
+        slope = self.slope()
+        if np.isnan(slope): return float(sy/n)
+        return float((sy - slope*sx)/n + slope*x)
+
+    def state(self):
+        return {'window':self.window, 'points':[list(p) for p in self.points],
+                'sums':self.sums.tolist()}
+
+    @classmethod
+    def from_state(cls,state):
+        new = cls(state['window'])
+        new.points = deque(tuple(p) for p in state['points'])
+        new.sums = np.asarray(state['sums']) # same round-off as before the snapshot
+        return new
+
+
+class FrameLister:
+    '''
+    Finds the frames of a mask written since the last call, sorting only the new files
+    into nods (same rules as Drift.split_dither()), so a poll doesn't read the headers of
+    every frame of the night.  The directory is listed every time (not the cubes or the
+    catalogue, which don't see frames written since they were made).  The state is the
+    highest frame number looked at & the frames found but not handed out yet, so it
+    doesn't grow with the night.
+    '''
+    def __init__(self):
+        self.listed = -1        # highest frame number of the files already looked at
+        self.waiting = {}       # filename --> nod of the frames of the mask found but not
+                                # done yet (None if the header couldn't be read yet)
+
+    def new_frames(self,drift_obj,after=-1):
+        '''
+        RETURNS --- frames:     list of (filename, nod) for the frames of the mask after
+                                frame number "after" that aren't done() yet, in order
+        '''
+        for filename in drift_obj.raw_frames():
+            if rf.frame_number(filename) > self.listed: self.waiting.setdefault(filename,None)
+        for filename,nod in list(self.waiting.items()):
+            self.listed = max(self.listed,rf.frame_number(filename))
+            if rf.frame_number(filename) <= after: del self.waiting[filename]
+            elif nod is None:
+                try: head = drift_obj.header(filename)
+                except OSError: continue # still being written, tried again on the next call
+                nod = frame_nod(drift_obj,head)
+                if nod is None: del self.waiting[filename] # another mask, or not a science frame
+                else: self.waiting[filename] = nod
+        frames = [(f,nod) for f,nod in self.waiting.items() if nod is not None]
+        return sorted(frames,key=lambda frame: rf.frame_number(frame[0]))
+
+    def done(self,filename):
+        self.waiting.pop(filename,None)
+
+    def state(self):
+        return {'listed':self.listed, 'waiting':self.waiting}
+
+    @classmethod
+    def from_state(cls,state):
+        new = cls()
+        new.listed, new.waiting = state.get('listed',-1), dict(state.get('waiting',{}))
+        return new
+
+
+class StarTracker:
+    '''
+    Tracks the star's drift & the seeing one frame at a time.
+
+    INPUTS ---- window:         int, frames in the rolling seeing statistics
+                rate_window:    int, frames (per nod) in the rolling drift-rate fit
+                clip:           float, how many (robust) standard deviations away
+                                from the rolling statistics makes a frame an outlier
+                min_frames:     int, frames needed before anything is flagged
+    '''
+    def __init__(self,window=15,rate_window=10,clip=5.,min_frames=5):
+        self.window = window
+        self.rate_window = rate_window
+        self.clip = clip
+        self.min_frames = min_frames
+
+        self.t0 = None          # UTC (hours) of the first frame
+        self.last_frame = -1    # highest frame number processed so far
+        self.reference = {}     # nod --> reference centre (pixels)
+        self.seeing = RollingMedian(window)
+        self.rate = {}          # nod --> RollingLinearFit of offset (") vs. time (hours)
+        self.residuals = {}     # nod --> RollingMedian of |offset - fit| (")
+        self.frames = FrameLister() # frames of the mask not tracked yet
+
+    def _hours(self,utc):
+        t = utc_hours(utc)
+        if self.t0 is None: self.t0 = t
+        if t < self.t0 - 12: t += 24 # past midnight UTC
+        return t - self.t0
+
+    def update(self,frame,nod,utc,center,sigma):
+        '''
+        Adds one frame's fit (ex. from Drift.fit_model()).
+
+        INPUTS ---- frame:      int, frame number
+                    nod:        str, nod of the frame, ex. "A"
+                    utc:        str, UTC of the frame
+                    center:     float, centre of the star's profile (pixels)
+                    sigma:      float, width of the star's profile (pixels)
+
+        RETURNS --- row:        dict, measurements & running statistics for the frame
+        '''
+        hours = self._hours(utc)
+        center, sigma = float(center), float(sigma)
+        seeing = sigma * 2.35 * pixscale # FWHM ~ 2.35*sigma
+        if nod not in self.reference:
+            self.reference[nod] = center
+            self.rate[nod] = RollingLinearFit(self.rate_window)
+            self.residuals[nod] = RollingMedian(self.window)
+        offset = (self.reference[nod] - center) * pixscale
+
+        # -- flagging against the statistics of the frames before this one -- #
+        seeing_outlier = False
+        if len(self.seeing) >= self.min_frames:
+            scale = self.seeing.scale()
+            if scale > 0: seeing_outlier = bool(abs(seeing - self.seeing.median()) > self.clip*scale)
+
+        fit, resid = self.rate[nod], self.residuals[nod]
+        offset_outlier = False
+        if len(resid) >= self.min_frames:
+            scale = 1.4826 * resid.median()
+            if scale > 0: offset_outlier = bool(abs(offset - fit.predict(hours)) > self.clip*scale)
+
+        # -- updating the statistics -- #
+        if seeing_outlier == False: self.seeing.add(seeing)
+        if offset_outlier == False:
+            if fit.sums[0] >= 2: resid.add(abs(offset - fit.predict(hours)))
+            fit.add(hours,offset)
+        self.last_frame = max(self.last_frame,int(frame))
+
+        return {'frame':int(frame), 'nod':nod, 'utc':utc, 'seeing':seeing, 'star_offset':offset,
+                'seeing_median':self.seeing.median(), 'drift_rate':fit.slope(), # "/hour
+                'seeing_outlier':seeing_outlier, 'offset_outlier':offset_outlier}
+
+    def ingest(self,drift_obj,filename,nod=None):
+        '''
+        Fits one raw frame with a Drift() object & adds it to the tracker.
+        '''
+        head = drift_obj.header(filename)
+        if nod is None: nod = frame_nod(drift_obj,head)
+        if nod is None: raise Exception('ABAB dither pattern not found.')
+        center, A, sigma = drift_obj.fit_model(filename)
+        self.frames.done(filename)
+        return self.update(rf.frame_number(filename),nod,head['UTC'],center,sigma)
+
+    def new_frames(self,drift_obj):
+        '''
+        The frames of the mask written since the last call (see FrameLister), so a poll
+        only reads the headers of new files instead of every frame of the night.
+
+        RETURNS --- frames:     list of (filename, nod) for the frames of the mask that
+                                haven't been tracked yet, in order of frame number
+        '''
+        return self.frames.new_frames(drift_obj,after=self.last_frame)
+
+    # SAVING & RESTORING
+    def snapshot(self):
+        '''
+        Returns the full state of the tracker as a (JSON-friendly) dictionary.
+        '''
+        return {'window':self.window, 'rate_window':self.rate_window, 'clip':self.clip,
+                'min_frames':self.min_frames, 't0':self.t0, 'last_frame':self.last_frame,
+                **self.frames.state(),
+                'reference':self.reference, 'seeing':self.seeing.state(),
+                'rate':{nod:fit.state() for nod,fit in self.rate.items()},
+                'residuals':{nod:res.state() for nod,res in self.residuals.items()}}
+
+    @classmethod
+    def restore(cls,state):
+        new = cls(state['window'],state['rate_window'],state['clip'],state['min_frames'])
+        new.t0, new.last_frame = state['t0'], state['last_frame']
+        new.frames = FrameLister.from_state(state) # (not in states saved by older versions)
+        new.reference = dict(state['reference'])
+        new.seeing = RollingMedian.from_state(state['seeing'])
+        new.rate = {nod:RollingLinearFit.from_state(s) for nod,s in state['rate'].items()}
+        new.residuals = {nod:RollingMedian.from_state(s) for nod,s in state['residuals'].items()}
+        return new
+
+    def save(self,filename):
+        with open(filename+'.tmp','w') as f: json.dump(self.snapshot(),f)
+        os.replace(filename+'.tmp',filename) # never leaves half a state behind
+
+    @classmethod
+    def load(cls,filename):
+        with open(filename) as f: return cls.restore(json.load(f))
+
+
+def frame_nod(drift_obj,head):
+    '''
+    Nod of a raw frame from its header: "A" or "B", or None for frames of other masks
+    & alignment frames.  Raises an exception if the dither doesn't match, as
+    Drift.split_dither() does.
+    '''
+    if head.get('OBJECT') != drift_obj.mask or head.get('GRATMODE') != 'spectroscopy': return None
+    if head['YOFFSET'] == drift_obj.dither: return 'A'
+    if head['YOFFSET'] == -drift_obj.dither: return 'B'
+    raise Exception('ABAB dither pattern not found.')
+
+
+def state_file(date,mask,home='plots-data/'):
+    return f'{home}tracker/tracker_{date}_{mask}.json'
+
+
+def track_night(drift_obj,tracker=None,savefile=True):
+    '''
+    Feeds the frames of a mask that the tracker hasn't seen yet into it, in order.
+    Run it again as new frames come in: the state is saved after every call (and
+    picked up again if no tracker is given), so old frames are never refit.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                tracker:    StarTracker, (default: load the saved state, or start fresh)
+                savefile:   bool, save the state to plots-data/tracker/
+
+    RETURNS --- tracker:    the updated StarTracker
+                rows:       list of dicts, one per new frame (see StarTracker.update())
+    '''
+    filename = state_file(drift_obj.date,drift_obj.mask)
+    if tracker is None:
+        if os.path.exists(filename): tracker = StarTracker.load(filename)
+        else: tracker = StarTracker()
+
+    # only the headers of files that are new since the last call are read
+    rows = [tracker.ingest(drift_obj,f,nod) for f,nod in tracker.new_frames(drift_obj)]
+
+    if savefile == True:
+        os.makedirs(os.path.dirname(filename),exist_ok=True)
+        tracker.save(filename)
+    return tracker, rows
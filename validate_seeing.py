@@ -0,0 +1,131 @@
+'''
+Checks the fast (no fitting) FWHM estimate against the Gaussian fits.
+
+profiles.fast_fwhm() measures the seeing from where the star's profile crosses half its
+peak, which takes a few milliseconds for a whole night instead of a fit per frame.  For
+each archived night (a row of keck_masks.dat), this script collapses the star's profiles
+once, measures them both ways, & reports
+
+    --  the bias & scatter of the fast seeing relative to the Gaussian fits (")
+    --  the scatter of the fast centres relative to the fitted ones (pixels)
+    --  how many frames each method failed on
+    --  the time each method takes for the whole night
+
+The per-frame measurements are saved to plots-data/seeing/ for a closer look.
+'''
+
+from drift import *
+import time
+
+report_columns = ['date','mask','frames','bias','scatter','cen_scatter',\
+                  'failed_fit','failed_fast','time_fit','time_fast']
+
+
+def night_profiles(drift_obj):
+    '''
+    Collapsed profiles of the star in every frame of both nods (as in fit_all()).
+
+    RETURNS --- profiles:       list of 1D arrays
+                frame_number:   1xN list
+    '''
+    nod_A, nod_B = drift_obj.split_dither()
+    profiles, frame_number = [],[]
+    for filename,profile_2D in drift_obj.prefetch(list(nod_A)+list(nod_B),reader=drift_obj.cut_out):
+        profiles.append(np.sum(profile_2D,axis=1))
+        frame_number.append(rf.frame_number(filename))
+    return profiles, frame_number
+
+
+def compare_night(drift_obj,model='gaussian',savefile=True):
+    '''
+    Measures the seeing of a night with the fits & with the fast estimate.
+
+    INPUTS ---- drift_obj:  a Drift() object with defined variables
+                model:      str, model the fast estimate is compared to
+                savefile:   bool, write the per-frame table to plots-data/seeing/
+
+    RETURNS --- summary:    dict with "report_columns"
+                table:      pandas DataFrame, both measurements for each frame
+    '''
+    profiles, frame_number = night_profiles(drift_obj)
+
+    start = time.time()
+    cen_fit, A_fit, sig_fit = drift_obj.fit_profiles(profiles,model)
+    time_fit = time.time() - start
+    start = time.time()
+    cen_fast, A_fast, sig_fast = drift_obj.fit_profiles(profiles,'fast')
+    time_fast = time.time() - start
+
+    table = pd.DataFrame({'frame':frame_number,
+                          'seeing_fit':np.asarray(sig_fit) * 2.35 * 0.18,   # "/pixel
+                          'seeing_fast':np.asarray(sig_fast) * 2.35 * 0.18,
+                          'cen_fit':cen_fit, 'cen_fast':cen_fast})
+    table.sort_values(by=['frame'],inplace=True)
+    table.reset_index(inplace=True,drop=True)
+
+    diff = (table['seeing_fast'] - table['seeing_fit']).values
+    both = np.isfinite(diff)
+    summary = {'date':drift_obj.date, 'mask':drift_obj.mask, 'frames':len(table),
+               'bias':np.median(diff[both]) if both.any() else np.nan,
+               'scatter':1.4826*np.median(np.abs(diff[both]-np.median(diff[both]))) if both.any() else np.nan,
+               'cen_scatter':np.nanstd(table['cen_fast']-table['cen_fit']),
+               'failed_fit':int(np.sum(~np.isfinite(table['seeing_fit']))),
+               'failed_fast':int(np.sum(~np.isfinite(table['seeing_fast']))),
+               'time_fit':time_fit, 'time_fast':time_fast}
+
+    if savefile == True:
+        os.makedirs('plots-data/seeing',exist_ok=True)
+        table.to_csv(f'plots-data/seeing/fast_seeing_{drift_obj.date}_{drift_obj.mask}.txt',
+                     sep='\t',index=False)
+    return summary, table
+
+
+def print_report(report):
+    print('%10s %12s %7s %9s %9s %9s %7s %7s %9s %9s'%('date','mask','frames','bias"','scatter"',
+          'cen_rms','fails','fails','fit [s]','fast [s]'))
+    print('%10s %12s %7s %9s %9s %9s %7s %7s %9s %9s'%('','','','','','','(fit)','(fast)','',''))
+    for row in report.itertuples():
+        print('%10s %12s %7i %+9.3f %9.3f %9.3f %7i %7i %9.3f %9.4f'%(row.date,row.mask,row.frames,
+              row.bias,row.scatter,row.cen_scatter,row.failed_fit,row.failed_fast,row.time_fit,row.time_fast))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Comparing the fast seeing estimate to the Gaussian fits.",
+                usage='validate_seeing.py [-m MASKS] [-n NIGHTS] [-p MODEL] [-s]')
+    parser.add_argument('-m','--masks',help='Table of nights & masks. (default: KVS-data/keck_masks.dat)',
+                        default='KVS-data/keck_masks.dat')
+    parser.add_argument('-n','--nights',help='Rows of the table to run, ex. 0,3,4 (default: all)',default=None)
+    parser.add_argument('-p','--model',help='Model the fast estimate is compared to. (default: gaussian)',
+                        default='gaussian')
+    parser.add_argument('-s','--save',help='Save the report to plots-data/seeing/.',action='store_true')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.masks,delimiter='|',
+        converters={'star_slit': lambda x: x.split(','), 'star_cols': lambda x: x.split(',')})
+    nights = df.index.values if args.nights is None else [int(i) for i in args.nights.split(',')]
+
+    report = []
+    for indx in nights:
+        # -- Creating Drift() object (as in measure.py) -- #
+        test = Drift()
+        test.home = df.loc[indx,'path']
+        test.date = df.loc[indx,'date']
+        test.mask = df.loc[indx,'mask']
+        test.dither = df.loc[indx,'dither']
+        test.band = df.loc[indx,'band']
+        if df.loc[indx,'star_slit'][0].strip() == '': test.auto_configure()
+        else:
+            test.row_start, test.row_end = [int(i) for i in df.loc[indx,'star_slit'][:2]]
+            test.col_start, test.col_end = [int(i) for i in df.loc[indx,'star_cols'][:2]]
+
+        print('Date:', test.date, 'Mask:', test.mask)
+        summary, table = compare_night(test,model=args.model)
+        report.append(summary)
+
+    report = pd.DataFrame(report,columns=report_columns)
+    print()
+    print_report(report)
+    if args.save == True:
+        os.makedirs('plots-data/seeing',exist_ok=True)
+        report.to_csv('plots-data/seeing/fast_seeing_validation.txt',sep='\t',index=False)
@@ -0,0 +1,225 @@
+'''
+Masked, normalized cross-correlation (Padfield 2012, IEEE TIP 21, 2706) done with FFTs.
+
+Drift.cross_correlations() used to hand NaN-blanked frames to image_registration, which
+relies on that package setting NaNs to zero after subtracting the mean.  Here the ignored
+pixels are handled explicitly with weight maps instead: every lag is normalized by only
+the pixels that overlap with nonzero weight in *both* images, so blanked rows, bad pixels,
+and the edges of the frame don't bias the peak.  The peak is refined to sub-pixel
+accuracy with a small upsampled DFT around it (or a 2nd order Taylor expansion, like
+image_registration, when upsample=1), and the shifts follow the same convention as
+image_registration.cross_correlation_shifts(): (xshift, yshift) is how far "img" is
+offset from "ref".
+
+Since the drifts we look for are small, "maxoff" limits both the lags that are searched
+and the zero-padding of the FFTs, which keeps the transforms close to the frame size.
+'''
+
+import numpy as np
+from scipy import fft
+
+
+def _weights(arr,weight):
+    '''
+    Weight map for an image (or stack of strips): zero for NaNs, and weights with one
+    less dimension than the image are applied to whole rows.
+    '''
+    good = ~np.isnan(arr)
+    if weight is None: return good.astype(arr.dtype)
+    weight = np.asarray(weight,dtype=arr.dtype)
+    if weight.ndim == arr.ndim-1: weight = weight[...,None] # row weights, ex. ~blank_rows()
+    return np.where(good,weight,0).astype(arr.dtype)
+
+
+# the sums that make up the normalized cross-correlation at each lag (see _normalize())
+terms = ['overlap','cc','r_sum','i_sum','r_sq','i_sq']
+
+
+def _normalize(sums,limits=None,overlap_ratio=0.3,dtype=np.float64):
+    '''
+    Turns the correlated sums into the normalized cross-correlation.  Lags with too
+    little overlap, or where either image is flat, are set to 0.  The limits used are
+    returned so the same ones can be used on an upsampled grid (see upsampled_peak()).
+    '''
+    overlap, cc, r_sum, i_sum, r_sq, i_sq = [sums[t] for t in terms]
+    if limits is None: min_overlap = max(overlap_ratio*overlap.max(),1)
+    else: min_overlap = limits[0]
+
+    good = overlap > min_overlap
+    overlap = np.where(good,overlap,1)
+    numerator = cc - r_sum*i_sum/overlap
+    r_var, i_var = r_sq - r_sum**2/overlap, i_sq - i_sum**2/overlap
+    # lags where either image is flat only have round-off left in the variances
+    if limits is None:
+        tol = np.sqrt(np.finfo(dtype).eps)
+        limits = (min_overlap,tol*r_var.max(),tol*i_var.max())
+    good &= (r_var > limits[1]) & (i_var > limits[2])
+
+    ncc = np.zeros_like(cc)
+    ncc[good] = numerator[good] / np.sqrt(r_var[good]*i_var[good])
+    return np.clip(ncc,-1,1), limits
+
+
+def _correlate(ref,img,ref_weight,img_weight,maxoff,overlap_ratio,dtype):
+    '''
+    Does the work for masked_ncc(), also returning the cross-power spectra of the
+    sums (used to refine the peak, see upsampled_peak()).
+    '''
+    ref = np.asarray(ref,dtype=dtype)
+    img = np.asarray(img,dtype=dtype)
+    if ref.shape != img.shape: raise ValueError('Images must have same shape.')
+    ny, nx = ref.shape[-2:]
+
+    wr, wi = _weights(ref,ref_weight), _weights(img,img_weight)
+    # removing the weighted means keeps the sums small (better precision)
+    fr = np.where(wr > 0,ref - np.sum(np.nan_to_num(ref)*wr)/max(wr.sum(),1),0)
+    fi = np.where(wi > 0,img - np.sum(np.nan_to_num(img)*wi)/max(wi.sum(),1),0)
+
+    if maxoff is None: pady, padx = ny-1, nx-1
+    else: pady, padx = min(int(maxoff),ny-1), min(int(maxoff),nx-1)
+    shape = (fft.next_fast_len(ny+pady,real=True),fft.next_fast_len(nx+padx,real=True))
+
+    # cross-power spectrum of a & b (b is conjugated); for a stack of strips the
+    # spectra of the strips are added up, so there is one inverse FFT per sum
+    def forward(a): return fft.rfft2(a,s=shape,workers=-1)
+    def cross(A,B):
+        prod = A*np.conj(B)
+        if prod.ndim == 3: prod = prod.sum(axis=0)
+        return prod
+    def corr(prod):
+        out = fft.irfft2(prod,s=shape,workers=-1)
+        # lags from -pady..pady and -padx..padx, with the zero lag in the middle
+        out = np.roll(out,(pady,padx),axis=(0,1))
+        return out[:2*pady+1,:2*padx+1]
+
+    Wr, Wi = forward(wr), forward(wi)
+    Fr, Fi = forward(fr*wr), forward(fi*wi)
+    spectra = {'overlap':cross(Wi,Wr), 'cc':cross(Fi,Fr), 'r_sum':cross(Wi,Fr), 'i_sum':cross(Fi,Wr)}
+    spectra['r_sq'] = cross(Wi,forward(fr*fr*wr))
+    spectra['i_sq'] = cross(forward(fi*fi*wi),Wr)
+    del Wr, Wi, Fr, Fi
+
+    sums = {t:corr(spectra[t]) for t in terms}
+    sums['overlap'] = np.round(sums['overlap']) # number of (weighted) overlapping pixels
+    ncc, limits = _normalize(sums,overlap_ratio=overlap_ratio,dtype=dtype)
+    return ncc, pady, padx, (spectra,shape,limits)
+
+
+def masked_ncc(ref,img,ref_weight=None,img_weight=None,maxoff=None,overlap_ratio=0.3,dtype=np.float64):
+    '''
+    Returns the masked normalized cross-correlation surface of two images.
+
+    Stacks of strips (KxNxM arrays, ex. the rows around the slit edges) can be given
+    instead of images: the strips are correlated separately & added up, which is the
+    same as correlating the full frames with only the rows of the strips weighted.
+
+    INPUTS ---- ref,img:        NxM (or KxNxM) arrays, reference & offset images (NaNs are ignored)
+                ref_weight:     NxM or 1xN array, weights for ref (1D = per row)
+                img_weight:     NxM or 1xN array, weights for img (1D = per row)
+                maxoff:         int, largest shift searched (default: any shift)
+                overlap_ratio:  float, lags overlapping less than this fraction of the
+                                best-overlapping lag are ignored
+                dtype:          numpy float type used for the FFTs
+
+    RETURNS --- ncc:            2D array, correlation coefficient for each lag, with
+                                the zero lag at (pady,padx)
+                pady,padx:      (int,int), padding (= largest lag) in each direction
+    '''
+    ncc, pady, padx = _correlate(ref,img,ref_weight,img_weight,maxoff,overlap_ratio,dtype)[:3]
+    return ncc, pady, padx
+
+
+def subpixel_peak(surface):
+    '''
+    Location of the peak of a surface to sub-pixel accuracy, using a 2nd order
+    Taylor expansion around the brightest pixel (as in image_registration).
+
+    RETURNS --- ypeak,xpeak:    (float,float), position of the peak
+    '''
+    ymax, xmax = np.unravel_index(np.argmax(surface),surface.shape)
+    if ymax in (0,surface.shape[0]-1) or xmax in (0,surface.shape[1]-1):
+        return float(ymax), float(xmax) # at the edge, can't refine
+
+    c = surface[ymax-1:ymax+2,xmax-1:xmax+2]
+    fx, fy = (c[1,2]-c[1,0])/2, (c[2,1]-c[0,1])/2
+    fxx, fyy = c[1,2]-2*c[1,1]+c[1,0], c[2,1]-2*c[1,1]+c[0,1]
+    fxy = (c[2,2]-c[2,0]-c[0,2]+c[0,0])/4
+
+    det = fxx*fyy - fxy**2
+    if det == 0: return float(ymax), float(xmax)
+    dx = (fxy*fy - fyy*fx) / det
+    dy = (fxy*fx - fxx*fy) / det
+    # a peak this far off means the surface isn't quadratic here
+    if abs(dx) > 1 or abs(dy) > 1: return float(ymax), float(xmax)
+    return ymax+dy, xmax+dx
+
+
+def upsampled_peak(spectra,shape,limits,ylag,xlag,upsample=20):
+    '''
+    Refines a peak of the normalized cross-correlation by evaluating it on a grid
+    1/upsample of a pixel fine, within a pixel of the integer peak, straight from the
+    cross-power spectra of the sums with a matrix DFT (Guizar-Sicairos et al. 2008,
+    Opt. Lett. 33, 156).  Only (2*upsample+1)^2 lags are computed, instead of an
+    upsampled FFT.  The normalization is upsampled too, otherwise the peak is pulled
+    towards the lag with the most overlap (badly so for small strips).
+
+    INPUTS ---- spectra:        dict, rfft2 cross-power spectra of the sums (see _correlate())
+                shape:          (int,int), shape of the (padded) real arrays
+                limits:         tuple, limits used by _normalize() on the integer lags
+                ylag,xlag:      (int,int), integer lag of the peak
+                upsample:       int, grid points per pixel
+
+    RETURNS --- ylag,xlag:      (float,float), refined lag of the peak
+    '''
+    ny, nx = shape
+    nfreq = spectra['cc'].shape[1]
+    weight = np.full(nfreq,2.) # the rfft only holds half of the x frequencies
+    weight[0] = 1
+    if nx % 2 == 0: weight[-1] = 1
+
+    ys = ylag + np.arange(-upsample,upsample+1)/upsample
+    xs = xlag + np.arange(-upsample,upsample+1)/upsample
+    ey = np.exp(2j*np.pi*np.outer(ys,fft.fftfreq(ny)))
+    ex = np.exp(2j*np.pi*np.outer(np.arange(nfreq)/nx,xs))*weight[:,None]
+    sums = {t:(ey @ spectra[t] @ ex).real/(ny*nx) for t in terms}
+    surface = _normalize(sums,limits)[0]
+
+    j, i = np.unravel_index(np.argmax(surface),surface.shape)
+    ypeak, xpeak = float(ys[j]), float(xs[i])
+    # a parabola through the fine grid gets well below a grid step
+    step = 1/upsample
+    if 0 < j < len(ys)-1:
+        a, b, c = surface[j-1:j+2,i]
+        if a-2*b+c < 0: ypeak += step*(a-c)/(2*(a-2*b+c))
+    if 0 < i < len(xs)-1:
+        a, b, c = surface[j,i-1:i+2]
+        if a-2*b+c < 0: xpeak += step*(a-c)/(2*(a-2*b+c))
+    return ypeak, xpeak
+
+
+def masked_cross_correlation_shifts(ref,img,ref_weight=None,img_weight=None,maxoff=None,\
+                                    overlap_ratio=0.3,upsample=20,dtype=np.float64,return_peak=False):
+    '''
+    Measures how far "img" is offset from "ref", ignoring NaNs & zero-weight pixels.
+
+    INPUTS ---- ref,img:        NxM (or KxNxM, see masked_ncc()) arrays, reference & offset images
+                ref_weight:     NxM or 1xN array, weights for ref (1D = per row)
+                img_weight:     NxM or 1xN array, weights for img (1D = per row)
+                maxoff:         int, largest shift searched (default: any shift)
+                overlap_ratio:  float, see masked_ncc()
+                upsample:       int, precision of the peak is 1/upsample pixels
+                                (1 uses a 2nd order Taylor expansion instead)
+                dtype:          numpy float type used for the FFTs
+                return_peak:    bool, also return the correlation coefficient at the peak
+
+    RETURNS --- xshift,yshift:  (float,float), shift of img relative to ref
+    '''
+    ncc, pady, padx, (spectra,shape,limits) = _correlate(ref,img,ref_weight,img_weight,maxoff,overlap_ratio,dtype)
+    if upsample > 1:
+        ymax, xmax = np.unravel_index(np.argmax(ncc),ncc.shape)
+        yshift, xshift = upsampled_peak(spectra,shape,limits,ymax-pady,xmax-padx,upsample)
+    else:
+        ypeak, xpeak = subpixel_peak(ncc)
+        xshift, yshift = xpeak-padx, ypeak-pady # zero lag is at (pady,padx)
+    if return_peak == True: return xshift, yshift, ncc.max()
+    return xshift, yshift